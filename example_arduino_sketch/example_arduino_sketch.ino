@@ -1,4 +1,5 @@
 #include <SerialTransfer.h>
+#include "usb_layout.h" // python usb_layout.py -o usb_layout.h
 
 #define DEBUG_PORT    Serial  //COM12
 #define FEEDBACK_PORT Serial2 //COM10
@@ -7,17 +8,7 @@
 SerialTransfer feedback;
 
 
-struct __attribute__((__packed__)) state{
-  float roll   = 0;
-  float pitch  = 0;
-  uint16_t hdg = 0;
-  uint16_t alt = 0;
-  uint16_t ias = 0;
-  float lat    = 0;
-  float lon    = 0;
-  byte flaps   = 0;
-  byte gear    = 0;
-} plane;
+state plane;
 
 
 void setup()
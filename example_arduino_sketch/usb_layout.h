@@ -0,0 +1,15 @@
+#pragma once
+
+// Generated by Thunder Viewer (usb_layout.py) - must match the USB fields
+// selected in Thunder Viewer
+struct __attribute__((__packed__)) state{
+  float    roll;
+  float    pitch;
+  uint16_t hdg;
+  uint16_t alt;
+  uint16_t ias;
+  float    lat;
+  float    lon;
+  byte     flaps;
+  byte     gear;
+};
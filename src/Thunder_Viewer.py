@@ -1,18 +1,22 @@
 import os
 import sys
 import requests
-from PyQt5.QtGui import QColor
+import threading
+import multiprocessing
 from PyQt5.QtCore import QProcess, pyqtSlot, Qt
-from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog, QTableWidgetItem
+from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog
 from pySerialTransfer import pySerialTransfer as transfer
 from gui.remotePlayGui import Ui_PlayerManager
 from gui.usbFieldsGui import Ui_usbFieldManager
 from gui.gui import Ui_ThunderViewer
 from gui.overlay import Ui_Overlay
 from mqtt_thread import MqttSubThread
-from stream_thread import StreamThread, StreamHandler
+from stream_thread import StreamThread
 from record_thread import RecordThread
-from constants import APP_DIR, LOGS_DIR
+from overlay_renderer import OverlayRenderer
+from telemetry_snapshot import TelemetrySnapshot
+from metrics import MetricsServer
+from constants import APP_DIR, LOGS_DIR, METRICS_PORT, SINK_PROCESSES
 
 
 class AppWindow(QMainWindow):
@@ -31,6 +35,7 @@ class AppWindow(QMainWindow):
         self.setup_overlay()
         self.setup_player_manager()
         self.setup_usb_manager()
+        self.setup_metrics()
         
         self.connect_signals()
         self.init_recording_status()
@@ -58,17 +63,16 @@ class AppWindow(QMainWindow):
                                     Qt.X11BypassWindowManagerHint)
         self.Overlay.setAttribute(Qt.WA_TranslucentBackground)
         
-        self.Overlay_ui.telem_table.setStyleSheet("QTableWidget {background-color: transparent;}"
+        self.Overlay_ui.telem_table.setStyleSheet("QTableView {background-color: transparent;}"
                                                   "QHeaderView::section {background-color: transparent;}"
                                                   "QHeaderView {background-color: transparent;}"
                                                   "QTableCornerButton::section {background-color: transparent;}")
-        self.Overlay_ui.telem_table.setColumnCount(3)
-        self.Overlay_ui.telem_table.setRowCount(1)
         self.Overlay_ui.field_select_table.setColumnCount(1)
         self.Overlay_ui.field_select_table.setRowCount(0)
         self.Overlay.move(0, 0)
         
-        self.overlay_fields = []
+        self.telem_snapshot   = TelemetrySnapshot() # latest sample published by the recorder
+        self.overlay_renderer = OverlayRenderer(self.Overlay, self.Overlay_ui, self.telem_snapshot)
         
     def setup_player_manager(self):
         '''
@@ -92,6 +96,18 @@ class AppWindow(QMainWindow):
         self.UsbManager_ui = Ui_usbFieldManager()
         self.UsbManager_ui.setupUi(self.UsbManager)
     
+    def setup_metrics(self):
+        '''
+        Description:
+        ------------
+        Serve pipeline metrics at http://localhost:METRICS_PORT/metrics for
+        as long as the app is open
+        '''
+        
+        if METRICS_PORT:
+            self.metrics_server = MetricsServer(METRICS_PORT)
+            threading.Thread(target=self.metrics_server.serve_forever, daemon=True).start()
+    
     def connect_signals(self):
         '''
         Description:
@@ -173,7 +189,6 @@ class AppWindow(QMainWindow):
             if self.ui.live_usb.isChecked():
                 self.usb_port = self.ui.usb_ports.currentText()
                 self.usb_baud = int(self.ui.usb_baud.currentText())
-                self.transfer = transfer.SerialTransfer(self.usb_port, self.usb_baud)
             
             if self.ui.mqtt.isChecked():
                 self.mqtt_sub_th = MqttSubThread(self)
@@ -181,14 +196,15 @@ class AppWindow(QMainWindow):
                 self.mqtt_sub_th.update_names.connect(self.update_player_names)
                 self.mqtt_sub_th.send_stream_data.connect(self.send_to_stream)
             
-            if self.ui.live_telem.isChecked():
+            # with SINK_PROCESSES the recorder streams from a worker process
+            if self.ui.live_telem.isChecked() and not SINK_PROCESSES:
                 self.stream_th = StreamThread(self)
                 self.stream_th.start()
             
             self.rec_th = RecordThread(self)
             self.rec_th.start()
             self.rec_th.send_stream_data.connect(self.send_to_stream)
-            self.rec_th.send_overlay_data.connect(self.update_overlay)
+            self.rec_th.send_status.connect(self.ui.statusbar.showMessage)
             
             self.ui.recording.setChecked(True)
     
@@ -202,24 +218,24 @@ class AppWindow(QMainWindow):
         
         self.enable_inputs()
         
-        if self.ui.live_usb.isChecked():
-            self.transfer.close()
-        
         try:
             if self.rec_th.isRunning():
-                self.rec_th.terminate()
+                self.rec_th.stop()
+                self.rec_th.wait()
         except AttributeError:
             pass
         
         try:
             if self.stream_th.isRunning():
-                self.stream_th.terminate()
+                self.stream_th.stop()
+                self.stream_th.wait()
         except AttributeError:
             pass
         
         try:
             if self.mqtt_sub_th.isRunning():
-                self.mqtt_sub_th.terminate()
+                self.mqtt_sub_th.stop()
+                self.mqtt_sub_th.wait()
         except AttributeError:
             pass
         
@@ -263,80 +279,13 @@ class AppWindow(QMainWindow):
     @pyqtSlot(str)
     def send_to_stream(self, line):
         try:
-            StreamHandler.remote_data_buff.append(line)
+            if SINK_PROCESSES:
+                self.rec_th.recorder.publish_text(line)
+            else:
+                self.stream_th.publish(line)
         except AttributeError:
             pass
     
-    @pyqtSlot(dict)
-    def update_overlay(self, telem_dict):
-        # find all valid fields
-        found_fields = telem_dict.keys()
-        
-        # remove any fields that are no longer valid
-        for i in range(len(self.overlay_fields)-1, -1, -1):
-            if self.overlay_fields[i] not in found_fields:
-                for row in range(self.Overlay_ui.field_select_table.rowCount()):
-                    field = self.Overlay_ui.field_select_table.item(row, 0).text()
-                    
-                    scrubbed_field = self.overlay_fields[i].replace('_', ' ').upper().split(',')[0]
-                    if field == scrubbed_field:
-                        self.Overlay_ui.field_select_table.removeRow(row)
-                        break
-                
-                self.overlay_fields.pop(i)
-        
-        # add new fields
-        for field in found_fields:
-            if field not in self.overlay_fields:
-                self.overlay_fields.append(field)
-                
-                #add row
-                new_row_num = self.Overlay_ui.field_select_table.rowCount()
-                self.Overlay_ui.field_select_table.insertRow(new_row_num)
-                
-                chkBoxItem = QTableWidgetItem()
-                chkBoxItem.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-                chkBoxItem.setCheckState(Qt.Unchecked)
-                chkBoxItem.setTextAlignment(Qt.AlignLeft | Qt.AlignVCenter)
-                chkBoxItem.setText(field.replace('_', ' ').upper().split(',')[0])
-                
-                self.Overlay_ui.field_select_table.setItem(new_row_num, 0, chkBoxItem)
-                
-        selected_fields_list = []
-        for row in range(self.Overlay_ui.field_select_table.rowCount()):
-            try:
-                if self.Overlay_ui.field_select_table.item(row, 0).checkState():
-                    selected_fields_list.append(self.Overlay_ui.field_select_table.item(row, 0).text())
-            except AttributeError:
-                pass
-        
-        # reset table
-        self.Overlay_ui.telem_table.setRowCount(0)
-        
-        # fill the table with new telemetry data
-        index = 0
-        for datum in telem_dict.keys():
-            datum_str = datum.replace('_', ' ').upper().split(',')[0]
-            
-            if datum_str in selected_fields_list:
-                self.Overlay_ui.telem_table.insertRow(index)
-                self.Overlay_ui.telem_table.setItem(index, 0, QTableWidgetItem(datum_str + '   '))
-                self.Overlay_ui.telem_table.setItem(index, 1, QTableWidgetItem(str(telem_dict[datum]).upper()))
-                index += 1
-        
-        # apply font color to each cell
-        for row in range(self.Overlay_ui.telem_table.rowCount()):
-            for col in range(self.Overlay_ui.telem_table.columnCount()):
-                try:
-                    self.Overlay_ui.telem_table.item(row, col).setForeground(QColor(255, 255, 255))
-                except AttributeError:
-                    pass
-        
-        # resize table to contents
-        self.Overlay_ui.telem_table.resizeColumnsToContents()
-        self.Overlay_ui.telem_table.resizeRowsToContents()
-        self.Overlay_ui.telem_table.resize(10000, 10000)
-    
     def block_players(self):
         '''
         Description:
@@ -415,6 +364,9 @@ def main():
 
 
 if __name__ == '__main__':
+    # sink worker processes of the frozen exe must not start the GUI again
+    multiprocessing.freeze_support()
+    
     try:
         main()
     except (SystemExit, KeyboardInterrupt, requests.exceptions.ConnectionError):
@@ -0,0 +1,313 @@
+import os
+import sys
+import glob
+import json
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from constants import LOGS_DIR, REMOTE_DIR
+
+
+# exported columns (in order) and their dtypes
+COLUMNS = (('time',        'f8'),
+           ('lon',         'f8'),
+           ('lat',         'f8'),
+           ('alt',         'f8'),
+           ('roll',        'f4'),
+           ('pitch',       'f4'),
+           ('heading',     'f4'),
+           ('throttle',    'f4'),
+           ('roll_input',  'f4'),
+           ('pitch_input', 'f4'),
+           ('yaw_input',   'f4'),
+           ('ias',         'f4'),
+           ('tas',         'f4'),
+           ('fuel_weight', 'f4'),
+           ('fuel_volume', 'f4'),
+           ('mach',        'f4'),
+           ('aoa',         'f4'),
+           ('gear',        'f4'),
+           ('flaps',       'f4'))
+
+COLUMN_NAMES = tuple(column[0] for column in COLUMNS)
+
+# ACMI property -> column number
+PROPERTY_COLUMNS = {'Throttle':          COLUMN_NAMES.index('throttle'),
+                    'RollControlInput':  COLUMN_NAMES.index('roll_input'),
+                    'PitchControlInput': COLUMN_NAMES.index('pitch_input'),
+                    'YawControlInput':   COLUMN_NAMES.index('yaw_input'),
+                    'IAS':               COLUMN_NAMES.index('ias'),
+                    'TAS':               COLUMN_NAMES.index('tas'),
+                    'FuelWeight':        COLUMN_NAMES.index('fuel_weight'),
+                    'FuelVolume':        COLUMN_NAMES.index('fuel_volume'),
+                    'Mach':              COLUMN_NAMES.index('mach'),
+                    'AOA':               COLUMN_NAMES.index('aoa'),
+                    'LandingGear':       COLUMN_NAMES.index('gear'),
+                    'Flaps':             COLUMN_NAMES.index('flaps')}
+
+# column numbers of the "T=" components for every transform length Tacview
+# supports (lon|lat|alt, lon|lat|alt|u|v, lon|lat|alt|roll|pitch|yaw and
+# lon|lat|alt|roll|pitch|yaw|u|v|heading) - None for unexported components
+_POSITION  = (1, 2, 3)
+_ROTATION  = (4, 5, 6)
+TRANSFORMS = {3: _POSITION,
+              5: _POSITION + (None, None),
+              6: _POSITION + _ROTATION,
+              9: _POSITION + _ROTATION + (None, None, None)}
+
+# object properties kept as (last reported) object metadata
+META_PROPERTIES = ('Name', 'Type', 'Color', 'Callsign', 'Coalition', 'Pilot')
+
+FORMATS = {'npz': '.npz', 'parquet': '.parquet'}
+
+
+class ObjectTrack(object):
+    '''
+    Description:
+    ------------
+    Exported samples of a single ACMI object
+    '''
+    
+    __slots__ = ('meta', 'state', 'columns')
+    
+    def __init__(self):
+        self.meta    = {}                               # metadata property -> value
+        self.state   = [float('nan')] * len(COLUMNS)    # latest value of every column
+        self.columns = [array('d') for _ in COLUMNS]    # values of every column (one row per object line)
+
+
+def parse_log(path):
+    '''
+    Description:
+    ------------
+    Stream an ACMI log into typed columns. ACMI logs only contain the
+    properties that changed, so the full state of every object is carried
+    from line to line and one row is added for every object line
+    
+    :param path: str - ACMI log path
+    
+    :return: tuple - reference time (str) and tracks (dict - object hex ID
+                     -> ObjectTrack, in order of first appearance)
+    '''
+    
+    ref_time   = ''
+    tracks     = {}
+    now        = 0.0
+    properties = PROPERTY_COLUMNS
+    
+    with open(path, 'r', encoding='utf8', errors='replace') as f:
+        for line in f:
+            first = line[:1]
+            
+            if first == '#':
+                try:
+                    now = float(line[1:])
+                except ValueError:
+                    pass
+                
+                continue
+            
+            if first in ('-', '/', '\n', ''):
+                continue
+            
+            obj_id, sep, props = line.rstrip('\r\n').partition(',')
+            
+            if not sep:
+                continue # file header
+            
+            if obj_id == '0':
+                if props.startswith('ReferenceTime='):
+                    ref_time = props.split('=', 1)[1]
+                
+                continue
+            
+            track = tracks.get(obj_id)
+            
+            if track is None:
+                track = ObjectTrack()
+                tracks[obj_id] = track
+            
+            state    = track.state
+            state[0] = now
+            
+            for prop in props.split(','):
+                key, _, value = prop.partition('=')
+                
+                try:
+                    if key == 'T':
+                        comps = value.split('|')
+                        
+                        for column, comp in zip(TRANSFORMS.get(len(comps), ()), comps):
+                            if comp and (column is not None):
+                                state[column] = float(comp)
+                    
+                    elif key in properties:
+                        state[properties[key]] = float(value)
+                    
+                    elif key in META_PROPERTIES:
+                        track.meta[key] = value
+                
+                except ValueError:
+                    pass
+            
+            for column, value in zip(track.columns, state):
+                column.append(value)
+    
+    return ref_time, tracks
+
+def write_npz(path, ref_time, tracks):
+    '''
+    Description:
+    ------------
+    Save exported tracks as a NumPy .npz archive - one array per column
+    with the rows of every object stored contiguously (rows of object i are
+    object_offsets[i]:object_offsets[i + 1])
+    
+    :param path:     str  - output file path
+    :param ref_time: str  - reference time of the log
+    :param tracks:   dict - object hex ID -> ObjectTrack
+    '''
+    
+    import numpy as np
+    
+    offsets = [0]
+    
+    for track in tracks.values():
+        offsets.append(offsets[-1] + len(track.columns[0]))
+    
+    arrays = {'ref_time':       np.array(ref_time),
+              'object_ids':     np.array(list(tracks.keys()), dtype=str),
+              'object_offsets': np.array(offsets, dtype='i8'),
+              'object_meta':    np.array(json.dumps({obj_id: track.meta for obj_id, track in tracks.items()}))}
+    
+    for i, (name, dtype) in enumerate(COLUMNS):
+        parts = [np.frombuffer(track.columns[i], dtype='f8') for track in tracks.values()]
+        arrays[name] = np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+    
+    np.savez_compressed(path, **arrays)
+
+def write_parquet(path, ref_time, tracks):
+    '''
+    Description:
+    ------------
+    Save exported tracks as a Parquet file with one row group per object
+    
+    :param path:     str  - output file path
+    :param ref_time: str  - reference time of the log
+    :param tracks:   dict - object hex ID -> ObjectTrack
+    '''
+    
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    types  = {'f8': pa.float64(), 'f4': pa.float32()}
+    meta   = {'ref_time': ref_time,
+              'objects':  json.dumps({obj_id: track.meta for obj_id, track in tracks.items()})}
+    schema = pa.schema([('object', pa.string())] + [(name, types[dtype]) for name, dtype in COLUMNS], metadata=meta)
+    
+    with pq.ParquetWriter(path, schema) as writer:
+        for obj_id, track in tracks.items():
+            rows    = len(track.columns[0])
+            columns = [pa.repeat(obj_id, rows).cast(pa.string())]
+            
+            for column, (name, dtype) in zip(track.columns, COLUMNS):
+                values = pa.Array.from_buffers(pa.float64(), rows, [None, pa.py_buffer(column)])
+                columns.append(values.cast(types[dtype]))
+            
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+WRITERS = {'npz': write_npz, 'parquet': write_parquet}
+
+def export_log(path, out_path, fmt='npz'):
+    '''
+    Description:
+    ------------
+    Export a single ACMI log
+    
+    :param path:     str - ACMI log path
+    :param out_path: str - output file path
+    :param fmt:      str - output format ("npz" or "parquet")
+    
+    :return: tuple - ACMI log path, number of rows exported and error
+                     message (None if the export succeeded)
+    '''
+    
+    try:
+        ref_time, tracks = parse_log(path)
+        WRITERS[fmt](out_path, ref_time, tracks)
+    except (OSError, ImportError) as e:
+        return path, 0, str(e)
+    
+    return path, sum(len(track.columns[0]) for track in tracks.values()), None
+
+def export_logs(paths, out_dir=None, fmt='npz', workers=None):
+    '''
+    Description:
+    ------------
+    Export ACMI logs in parallel (one log per worker process at a time)
+    
+    :param paths:   list - ACMI log paths
+    :param out_dir: str  - output directory (next to every log if None)
+    :param fmt:     str  - output format ("npz" or "parquet")
+    :param workers: int  - number of worker processes (CPU count if None)
+    
+    :return: generator - (ACMI log path, rows, error) tuple of every log
+                         (see export_log()) in completion order
+    '''
+    
+    out_paths = []
+    
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0] + FORMATS[fmt]
+        out_paths.append(os.path.join(out_dir or os.path.dirname(path), name))
+    
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    
+    if (workers == 1) or (len(paths) < 2):
+        for path, out_path in zip(paths, out_paths):
+            yield export_log(path, out_path, fmt)
+        
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(export_log, path, out_path, fmt) for path, out_path in zip(paths, out_paths)]
+        
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(argv=None):
+    '''
+    Description:
+    ------------
+    Export ACMI logs to columnar files for bulk analysis
+    '''
+    
+    parser = argparse.ArgumentParser(prog='acmi_export.py',
+                                     description='Export ACMI logs to NumPy (.npz) or Parquet columns')
+    parser.add_argument('paths', nargs='*', help='ACMI logs or directories of logs (default: local and remote log directories)')
+    parser.add_argument('-o', '--output', help='output directory (default: next to every log)')
+    parser.add_argument('-f', '--format', choices=sorted(FORMATS), default='npz', help='output format')
+    parser.add_argument('-j', '--workers', type=int, help='number of worker processes (default: CPU count)')
+    
+    args  = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    paths = []
+    
+    for path in args.paths or [LOGS_DIR, REMOTE_DIR]:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, '*.acmi'))))
+        elif os.path.exists(path):
+            paths.append(path)
+        else:
+            print('ERROR: Could not find {}'.format(path))
+    
+    for path, rows, error in export_logs(paths, args.output, args.format, args.workers):
+        if error:
+            print('ERROR: Could not export {} - {}'.format(path, error))
+        else:
+            print('{}: {} rows'.format(path, rows))
+
+
+if __name__ == '__main__':
+    main()
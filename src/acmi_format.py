@@ -0,0 +1,276 @@
+import time
+from random import randint
+from collections import namedtuple
+from WarThunder import acmi
+from constants import ACMI_ENTRY, INITIAL_META, ACMI_KEYFRAME_PERIOD
+
+
+ENTRY_FIELDS   = tuple(ACMI_ENTRY.keys())   # ACMI properties logged every sample (in order)
+META_FIELDS    = tuple(INITIAL_META.keys()) # ACMI object metadata properties (in order)
+ENTRY_PREFIXES = tuple('{}='.format(field) for field in ENTRY_FIELDS)
+TRANSFORM      = '{:0.9f}|{:0.9f}|{}|{:0.1f}|{:0.1f}|{:0.1f}'
+CONTROL        = '{0:.6f}'
+FRAME          = '#{:.2f}\n{},{}\n'
+GLOBAL_PROP    = '0,{}={}\n'
+
+# raw (unformatted) values needed to build a single ACMI entry - optional
+# values are None if War Thunder did not report them
+EntryRecord = namedtuple('EntryRecord', ['lon',
+                                         'lat',
+                                         'alt',
+                                         'roll',
+                                         'pitch',
+                                         'hdg',
+                                         'throttle',
+                                         'ailerons',
+                                         'elevator',
+                                         'pedals',
+                                         'ias',
+                                         'tas',
+                                         'fuel',
+                                         'fuel0',
+                                         'mach',
+                                         'aoa',
+                                         'gear',
+                                         'flaps'])
+
+
+def gen_id():
+    '''
+    Description:
+    ------------
+    Find a valid Tacview object hex ID
+    
+    :return: str - new object hex ID
+    '''
+    
+    return str(hex(randint(1, acmi.MAX_NUM_OBJS + 2))[2:]).upper()
+
+def format_header(ref_time):
+    '''
+    Description:
+    ------------
+    Create the mandatory ACMI file header
+    
+    :param ref_time: datetime - UTC reference time all entry timestamps are
+                                relative to
+    
+    :return: str - ACMI header text
+    '''
+    
+    return acmi.header_mandatory.format(filetype='text/acmi/tacview',
+                                        acmiver='2.1',
+                                        reftime=ref_time.isoformat())
+
+def format_user_header(header):
+    '''
+    Description:
+    ------------
+    Create the optional ACMI global properties (see format_header_dict())
+    
+    :param header: dict - global property names and values
+    
+    :return: str - ACMI global property lines
+    '''
+    
+    return ''.join(GLOBAL_PROP.format(key, value) for key, value in header.items())
+
+def extract_record(telem):
+    '''
+    Description:
+    ------------
+    Pull all values needed for an ACMI entry out of a telemetry sample
+    
+    :param telem: dict - full War Thunder vehicle telemetry data
+    
+    :return: EntryRecord - raw entry values
+    '''
+    
+    get = telem.get
+    
+    return EntryRecord(telem['lon'],
+                       telem['lat'],
+                       telem['alt_m'],
+                       telem['aviahorizon_roll'],
+                       telem['aviahorizon_pitch'],
+                       telem['compass'],
+                       telem['throttle 1, %'],
+                       get('stick_ailerons'),
+                       get('stick_elevator'),
+                       get('pedals1'),
+                       telem['IAS, km/h'],
+                       telem['TAS, km/h'],
+                       telem['Mfuel, kg'],
+                       telem['Mfuel0, kg'],
+                       telem['M'],
+                       get('AoA, deg'),
+                       get('gear, %'),
+                       get('flaps, %'))
+
+def format_record(rec):
+    '''
+    Description:
+    ------------
+    Convert raw entry values to ACMI property value strings
+    
+    :param rec: EntryRecord - raw entry values
+    
+    :return: tuple - property value strings in ENTRY_FIELDS order
+    '''
+    
+    return (TRANSFORM.format(rec.lon, rec.lat, rec.alt, rec.roll, rec.pitch, rec.hdg),
+            str(rec.throttle / 100),
+            '0' if rec.ailerons is None else CONTROL.format(rec.ailerons),
+            '0' if rec.elevator is None else CONTROL.format(rec.elevator),
+            '0' if rec.pedals is None else CONTROL.format(rec.pedals),
+            CONTROL.format(rec.ias),
+            str(rec.tas),
+            str(rec.fuel),
+            str(rec.fuel / rec.fuel0),
+            str(rec.mach),
+            '0' if rec.aoa is None else str(rec.aoa),
+            '1' if rec.gear is None else str(rec.gear / 100),
+            '0' if rec.flaps is None else str(rec.flaps / 100))
+
+def format_meta(airframe, team_flag=True):
+    '''
+    Description:
+    ------------
+    Create the ACMI object metadata properties (only needed once per object
+    to be displayed)
+    
+    :param airframe:  str  - War Thunder vehicle type
+    :param team_flag: bool - True for the blue team, False for the red team
+    
+    :return: str - comma separated metadata properties
+    '''
+    
+    meta = dict(INITIAL_META)
+    
+    meta['Name'] = airframe
+    meta['Type'] = 'Air+FixedWing'
+    
+    if team_flag:
+        meta['Coalition'] = 'Blue_Team'
+        meta['Color']     = 'Blue'
+    else:
+        meta['Coalition'] = 'Red_Team'
+        meta['Color']     = 'Red'
+    
+    return ','.join('{}={}'.format(field, meta[field]) for field in META_FIELDS)
+
+def encode_transform(prev_transform, transform):
+    '''
+    Description:
+    ------------
+    Blank out every component of an ACMI "T=" value that is unchanged since
+    the previously emitted value (i.e. "T=lon|lat|alt||..." omission syntax)
+    
+    :param prev_transform: str - last emitted (full) "T=" value
+    :param transform:      str - new (full) "T=" value
+    
+    :return: str - "T=" value with unchanged components omitted ('' if no
+                   component changed)
+    '''
+    
+    prev_comps = prev_transform.split('|')
+    comps      = transform.split('|')
+    
+    if len(prev_comps) != len(comps):
+        return transform
+    
+    delta = [comp if comp != prev_comp else '' for comp, prev_comp in zip(comps, prev_comps)]
+    
+    if not any(delta):
+        return ''
+    
+    return '|'.join(delta)
+
+
+class EntryFormatter(object):
+    '''
+    Description:
+    ------------
+    Precompiled ACMI entry formatter for a single object. Each call builds
+    one complete "#<time>\\n<id>,<props>\\n" string directly from a fixed
+    field schema.
+    
+    Only properties that changed since the last emitted entry are written.
+    A full state (keyframe, including the object metadata) is written for
+    the first entry and then every keyframe_period seconds so that late
+    readers (new Tacview clients, remote MQTT players) can reconstruct the
+    object
+    '''
+    
+    __slots__ = ('obj_id', 'meta', 'keyframe_period', '_last', '_keyframe')
+    
+    def __init__(self, obj_id, meta='', keyframe_period=ACMI_KEYFRAME_PERIOD):
+        '''
+        Description:
+        ------------
+        Initialize the formatter
+        
+        :param obj_id:          str   - ACMI object hex ID
+        :param meta:            str   - object metadata properties (see
+                                        format_meta())
+        :param keyframe_period: float - seconds between full object states
+        '''
+        
+        self.obj_id          = obj_id
+        self.meta            = meta
+        self.keyframe_period = keyframe_period
+        
+        self.reset()
+    
+    def reset(self):
+        '''
+        Description:
+        ------------
+        Forget the emitted state so the next entry is a full keyframe
+        (i.e. when a new ACMI log is started)
+        '''
+        
+        self._last     = None
+        self._keyframe = 0
+    
+    def format(self, tstamp, values):
+        '''
+        Description:
+        ------------
+        Build the ACMI text for a single sample
+        
+        :param tstamp: float - seconds since the log's reference time
+        :param values: tuple - property value strings (see format_record())
+        
+        :return: str - ACMI entry ('' if no property changed)
+        '''
+        
+        now  = time.monotonic()
+        last = self._last
+        
+        self._last = values
+        
+        if (last is None) or (now - self._keyframe >= self.keyframe_period):
+            self._keyframe = now
+            props = ','.join([prefix + value for prefix, value in zip(ENTRY_PREFIXES, values)])
+            
+            if self.meta:
+                props = props + ',' + self.meta
+            
+            return FRAME.format(tstamp, self.obj_id, props)
+        
+        props = []
+        
+        transform = encode_transform(last[0], values[0])
+        
+        if transform:
+            props.append(ENTRY_PREFIXES[0] + transform)
+        
+        for i in range(1, len(values)):
+            if values[i] != last[i]:
+                props.append(ENTRY_PREFIXES[i] + values[i])
+        
+        if not props:
+            return ''
+        
+        return FRAME.format(tstamp, self.obj_id, ','.join(props))
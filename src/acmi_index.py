@@ -0,0 +1,491 @@
+import os
+import sys
+import mmap
+import glob
+import struct
+import argparse
+from array import array
+from bisect import bisect_right
+from constants import LOGS_DIR, REMOTE_DIR
+
+
+INDEX_EXT     = '.idx'
+INDEX_MAGIC   = b'TVIX'
+INDEX_VERSION = 1
+
+INDEX_HEAD  = struct.Struct('<4sBQII') # magic, index version, indexed bytes, frame count, object count
+OBJECT_HEAD = struct.Struct('<Hdd')    # object ID length, first and last appearance (s)
+
+
+def index_path(path):
+    '''
+    Description:
+    ------------
+    Path of the sidecar index of an ACMI log
+    
+    :param path: str - ACMI log path
+    
+    :return: str - sidecar index path
+    '''
+    
+    return path + INDEX_EXT
+
+def _little_endian(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    
+    return values.tobytes()
+
+
+class AcmiIndex(object):
+    '''
+    Description:
+    ------------
+    Seek index of a single ACMI log - the byte offset of every "#<time>"
+    frame and the first/last appearance (in seconds) of every object.
+    
+    The index is built incrementally: feed() takes the log text in the
+    order it is written (starting at byte 0) and only complete lines are
+    indexed, so it can follow a log while it is being recorded
+    '''
+    
+    def __init__(self):
+        '''
+        Description:
+        ------------
+        Initialize an empty index
+        '''
+        
+        self.times   = array('d') # frame times (s)
+        self.offsets = array('Q') # byte offset of every frame's "#" line
+        self.objects = {}         # object hex ID -> [first appearance (s), last appearance (s)]
+        self.end     = 0          # byte offset of the first line not yet indexed
+        
+        self._tail = b''
+    
+    def feed(self, data):
+        '''
+        Description:
+        ------------
+        Index the next chunk of log text (a trailing partial line is kept
+        until the rest of it arrives)
+        
+        :param data: bytes - log text following everything fed so far
+        '''
+        
+        if self._tail:
+            data = self._tail + data
+        
+        times   = self.times
+        objects = self.objects
+        offset  = self.end
+        now     = times[-1] if times else 0.0
+        start   = 0
+        stop    = data.find(b'\n')
+        
+        while stop != -1:
+            if stop > start:
+                first = data[start]
+                
+                if first == 0x2F: # "/" (comment)
+                    pass
+                
+                elif first == 0x23: # "#"
+                    try:
+                        now = float(data[start + 1:stop])
+                        times.append(now)
+                        self.offsets.append(offset + start)
+                    except ValueError:
+                        pass
+                
+                else:
+                    if first == 0x2D: # "-" (object removed)
+                        comma = stop
+                        start += 1
+                    else:
+                        comma = data.find(b',', start, stop)
+                    
+                    if comma != -1:
+                        obj_id = data[start:comma].decode('utf8', 'replace')
+                        
+                        if obj_id != '0':
+                            seen = objects.get(obj_id)
+                            
+                            if seen is None:
+                                objects[obj_id] = [now, now]
+                            else:
+                                seen[1] = now
+            
+            start = stop + 1
+            stop  = data.find(b'\n', start)
+        
+        self.end   = offset + start
+        self._tail = bytes(data[start:])
+    
+    def update(self, log):
+        '''
+        Description:
+        ------------
+        Index the part of a complete log that isn't indexed yet (i.e. after
+        loading a sidecar index of a log that kept growing)
+        
+        :param log: bytes/mmap - entire log contents
+        '''
+        
+        self._tail = b''
+        self.feed(log[self.end:])
+    
+    def frame(self, tstamp):
+        '''
+        Description:
+        ------------
+        Find the last frame at or before the given time (O(log n))
+        
+        :param tstamp: float - seconds since the log's reference time
+        
+        :return: int - frame number (0 if tstamp is before the first frame,
+                       -1 if the log has no frames)
+        '''
+        
+        if not self.times:
+            return -1
+        
+        return max(bisect_right(self.times, tstamp) - 1, 0)
+    
+    def save(self, path):
+        '''
+        Description:
+        ------------
+        Write the index to a sidecar file (replaced atomically)
+        
+        :param path: str - sidecar index path
+        '''
+        
+        parts = [INDEX_HEAD.pack(INDEX_MAGIC, INDEX_VERSION, self.end, len(self.times), len(self.objects)),
+                 _little_endian(self.times),
+                 _little_endian(self.offsets)]
+        
+        for obj_id, (first, last) in self.objects.items():
+            obj_id = obj_id.encode('utf8')
+            parts.append(OBJECT_HEAD.pack(len(obj_id), first, last) + obj_id)
+        
+        tmp_path = path + '.tmp'
+        
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(parts))
+        
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path):
+        '''
+        Description:
+        ------------
+        Read an index from a sidecar file
+        
+        :param path: str - sidecar index path
+        
+        :return index: AcmiIndex - loaded index (None if the file is missing
+                                   or invalid)
+        '''
+        
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        
+        try:
+            magic, version, end, num_frames, num_objects = INDEX_HEAD.unpack_from(data)
+            
+            if (magic != INDEX_MAGIC) or (version != INDEX_VERSION):
+                return None
+            
+            index = cls()
+            index.end = end
+            offset    = INDEX_HEAD.size
+            
+            for values in (index.times, index.offsets):
+                size = num_frames * values.itemsize
+                values.frombytes(data[offset:offset + size])
+                offset += size
+                
+                if sys.byteorder != 'little':
+                    values.byteswap()
+            
+            for _ in range(num_objects):
+                length, first, last = OBJECT_HEAD.unpack_from(data, offset)
+                offset += OBJECT_HEAD.size
+                
+                index.objects[data[offset:offset + length].decode('utf8')] = [first, last]
+                offset += length
+        
+        except (struct.error, ValueError, UnicodeDecodeError):
+            return None
+        
+        if len(index.offsets) != num_frames:
+            return None
+        
+        return index
+
+
+def load_index(path):
+    '''
+    Description:
+    ------------
+    Get the up to date index of an existing ACMI log (without saving it)
+    
+    :param path: str - ACMI log path
+    
+    :return: AcmiIndex - index of the log (empty if the log doesn't exist)
+    '''
+    
+    try:
+        with AcmiReader(path, save_index=False) as reader:
+            return reader.index
+    except OSError:
+        return AcmiIndex()
+
+
+class AcmiReader(object):
+    '''
+    Description:
+    ------------
+    Random access to an ACMI log through a memory map and its sidecar index.
+    
+    A missing or outdated sidecar index is brought up to date by indexing
+    only the part of the log written after it, so logs that are still being
+    recorded can be opened (and refreshed) as well
+    '''
+    
+    def __init__(self, path, save_index=True):
+        '''
+        Description:
+        ------------
+        Open a log
+        
+        :param path:       str  - ACMI log path
+        :param save_index: bool - write the sidecar index if it had to be
+                                  updated
+        '''
+        
+        self.path       = path
+        self.save_index = save_index
+        self.index      = AcmiIndex.load(index_path(path)) or AcmiIndex()
+        
+        self._file = open(path, 'rb')
+        self._mmap = None
+        
+        self.refresh()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def close(self):
+        '''
+        Description:
+        ------------
+        Release the memory map and file handle
+        '''
+        
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        
+        self._file.close()
+    
+    def refresh(self):
+        '''
+        Description:
+        ------------
+        Map the current size of the log and index anything not yet indexed
+        '''
+        
+        size = os.fstat(self._file.fileno()).st_size
+        
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        
+        if size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        # start over if the log was replaced since the sidecar was written
+        if not self._valid(size):
+            self.index = AcmiIndex()
+        
+        if self.index.end < size:
+            self.index.update(self._mmap)
+            
+            if self.save_index:
+                try:
+                    self.index.save(index_path(self.path))
+                except OSError as e:
+                    print('ERROR: Could not save index of {} - {}'.format(self.path, e))
+    
+    def _valid(self, size):
+        index = self.index
+        
+        if index.end > size:
+            return False
+        
+        if index.end and self._mmap[index.end - 1:index.end] != b'\n':
+            return False
+        
+        return not index.offsets or (self._mmap[index.offsets[-1]:index.offsets[-1] + 1] == b'#')
+    
+    @property
+    def duration(self):
+        '''
+        Description:
+        ------------
+        Time of the last frame (s)
+        '''
+        
+        return self.index.times[-1] if self.index.times else 0.0
+    
+    @property
+    def objects(self):
+        '''
+        Description:
+        ------------
+        Object hex ID -> [first appearance (s), last appearance (s)]
+        '''
+        
+        return self.index.objects
+    
+    def header(self):
+        '''
+        Description:
+        ------------
+        Text before the first frame (file header and global properties)
+        
+        :return: str - header text
+        '''
+        
+        end = self.index.offsets[0] if self.index.offsets else self.index.end
+        
+        return self._text(0, end)
+    
+    def seek(self, tstamp):
+        '''
+        Description:
+        ------------
+        Byte offset of the last frame at or before the given time
+        
+        :param tstamp: float - seconds since the log's reference time
+        
+        :return: int - byte offset (end of the indexed text if the log has
+                       no frames)
+        '''
+        
+        frame = self.index.frame(tstamp)
+        
+        return self.index.offsets[frame] if frame >= 0 else self.index.end
+    
+    def read(self, start=None, end=None):
+        '''
+        Description:
+        ------------
+        Text of all frames between two times - the frame in progress at
+        start is included so the first object states are known
+        
+        :param start: float - first time (s) - from the first frame if None
+        :param end:   float - last time (s)  - to the last frame if None
+        
+        :return: str - ACMI frame text
+        '''
+        
+        first = self.seek(start) if start is not None else self.seek(0)
+        last  = self.index.end
+        
+        if end is not None:
+            frame = bisect_right(self.index.times, end)
+            
+            if frame < len(self.index.offsets):
+                last = self.index.offsets[frame]
+        
+        return self._text(first, max(first, last))
+    
+    def frames(self, start=None, end=None):
+        '''
+        Description:
+        ------------
+        Iterate over frames between two times
+        
+        :param start: float - first time (s) - from the first frame if None
+        :param end:   float - last time (s)  - to the last frame if None
+        
+        :return: generator - (frame time (s), frame text) tuples
+        '''
+        
+        times   = self.index.times
+        offsets = self.index.offsets
+        first   = self.index.frame(start) if start is not None else 0
+        last    = bisect_right(times, end) if end is not None else len(times)
+        
+        for i in range(max(first, 0), last):
+            stop = offsets[i + 1] if i + 1 < len(offsets) else self.index.end
+            
+            yield times[i], self._text(offsets[i], stop)
+    
+    def active_objects(self, tstamp):
+        '''
+        Description:
+        ------------
+        Objects that have appeared at or before and last appear at or after
+        the given time
+        
+        :param tstamp: float - seconds since the log's reference time
+        
+        :return: list - object hex IDs
+        '''
+        
+        return [obj_id for obj_id, (first, last) in self.index.objects.items() if first <= tstamp <= last]
+    
+    def _text(self, start, stop):
+        if self._mmap is None:
+            return ''
+        
+        return self._mmap[start:stop].decode('utf8', 'replace')
+
+
+def main(argv=None):
+    '''
+    Description:
+    ------------
+    Build (or update) the sidecar index of ACMI logs
+    '''
+    
+    parser = argparse.ArgumentParser(prog='acmi_index.py',
+                                     description='Build the sidecar seek index of ACMI logs')
+    parser.add_argument('paths', nargs='*', help='ACMI logs or directories of logs (default: local and remote log directories)')
+    
+    args  = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    paths = []
+    
+    for path in args.paths or [LOGS_DIR, REMOTE_DIR]:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, '*.acmi'))))
+        elif os.path.exists(path):
+            paths.append(path)
+        else:
+            print('ERROR: Could not find {}'.format(path))
+    
+    for path in paths:
+        try:
+            with AcmiReader(path) as reader:
+                print('{}: {} frames, {} objects, {:.2f}s'.format(path,
+                                                                   len(reader.index.times),
+                                                                   len(reader.objects),
+                                                                   reader.duration))
+        except OSError as e:
+            print('ERROR: Could not index {} - {}'.format(path, e))
+
+
+if __name__ == '__main__':
+    main()
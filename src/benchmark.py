@@ -0,0 +1,401 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+from recorder import Recorder, RecordConfig
+from sim_server import SimServer, OrbitProfile, ReplayProfile, SIM_PORT
+from tacview_server import TacviewServer
+from telemetry_snapshot import TelemetrySnapshot
+from usb_layout import USB_FIELDS
+from usb_writer import UsbWriter
+
+
+CLIENT_HANDSHAKE = b'XtraLib.Stream.0\nTacview.RealTimeTelemetry.0\nThunder_Viewer_Benchmark\n\x00'
+PERCENTILES      = (50, 90, 99)
+
+
+def percentile(values, pct):
+    '''
+    Description:
+    ------------
+    Nearest-rank percentile
+    
+    :param values: list  - sorted values
+    :param pct:    float - percentile (0-100)
+    
+    :return: float - percentile value (0 if there are no values)
+    '''
+    
+    if not values:
+        return 0.0
+    
+    return values[min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))]
+
+
+class StageTimer(object):
+    '''
+    Description:
+    ------------
+    Collects the duration of every call of wrapped pipeline stages
+    '''
+    
+    def __init__(self):
+        self.samples = {} # stage name -> list of durations (s)
+        self.bytes   = {} # stage name -> bytes passed to the stage
+        self.lock    = threading.Lock()
+    
+    def wrap(self, stage, func, count_arg=None):
+        '''
+        Description:
+        ------------
+        Time every call of a function
+        
+        :param stage:     str      - stage name
+        :param func:      callable - function to time
+        :param count_arg: int      - position of an argument whose length is
+                                     added to the stage's byte count
+        
+        :return: callable - timed function
+        '''
+        
+        samples = self.samples.setdefault(stage, [])
+        self.bytes.setdefault(stage, 0)
+        
+        def timed(*args, **kwargs):
+            start  = time.perf_counter()
+            result = func(*args, **kwargs)
+            samples.append(time.perf_counter() - start)
+            
+            if count_arg is not None:
+                with self.lock:
+                    self.bytes[stage] += len(args[count_arg])
+            
+            return result
+        
+        return timed
+    
+    def report(self):
+        '''
+        Description:
+        ------------
+        Summarize the collected durations
+        
+        :return: dict - stage name -> count, percentiles and max (ms)
+        '''
+        
+        summary = {}
+        
+        for stage, samples in self.samples.items():
+            values = sorted(samples)
+            stats  = {'count': len(values)}
+            
+            for pct in PERCENTILES:
+                stats['p{}_ms'.format(pct)] = percentile(values, pct) * 1000
+            
+            stats['max_ms'] = (values[-1] * 1000) if values else 0.0
+            summary[stage]  = stats
+        
+        return summary
+
+
+class LoopbackTransfer(object):
+    '''
+    Description:
+    ------------
+    Stand-in for pySerialTransfer.SerialTransfer that only counts packets
+    '''
+    
+    def __init__(self):
+        self.txBuff  = bytearray(254)
+        self.packets = 0
+        self.bytes   = 0
+    
+    def send(self, size):
+        self.packets += 1
+        self.bytes   += size
+    
+    def close(self):
+        pass
+
+
+class LoopbackUsbWriter(UsbWriter):
+    '''
+    Description:
+    ------------
+    UsbWriter that sends to a LoopbackTransfer instead of a serial port
+    '''
+    
+    def connect(self):
+        self.transfer = self.loopback = LoopbackTransfer()
+        return True
+
+
+class TacviewClient(object):
+    '''
+    Description:
+    ------------
+    Minimal Tacview real-time telemetry client that counts received bytes
+    '''
+    
+    def __init__(self, port, host='localhost'):
+        self.port     = port
+        self.host     = host
+        self.received = 0
+        self._running = True
+    
+    def stop(self):
+        self._running = False
+    
+    def run(self):
+        for _ in range(50):
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=0.2)
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            print('ERROR: Could not connect to the Tacview stream on port {}'.format(self.port))
+            return
+        
+        with sock:
+            sock.sendall(CLIENT_HANDSHAKE)
+            
+            while self._running:
+                try:
+                    data = sock.recv(65536)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                
+                if not data:
+                    break
+                
+                self.received += len(data)
+
+
+def cpu_times():
+    try:
+        import psutil
+        return psutil.cpu_times(percpu=True)
+    except ImportError:
+        return None
+
+def cpu_usage(start, end):
+    '''
+    Description:
+    ------------
+    Per-core CPU usage between two psutil.cpu_times(percpu=True) samples
+    
+    :return: list - usage of every core in percent (None if psutil isn't
+                    installed)
+    '''
+    
+    if start is None or end is None:
+        return None
+    
+    usage = []
+    
+    for before, after in zip(start, end):
+        total = sum(after) - sum(before)
+        idle  = (after.idle - before.idle) + (getattr(after, 'iowait', 0) - getattr(before, 'iowait', 0))
+        usage.append(100 * (total - idle) / total if total > 0 else 0.0)
+    
+    return usage
+
+def run_benchmark(args):
+    '''
+    Description:
+    ------------
+    Record from the simulated localhost server through the full pipeline
+    (ACMI log, Tacview stream, MQTT, USB) and measure it
+    
+    :param args: argparse.Namespace - parsed options
+    
+    :return: dict - benchmark results
+    '''
+    
+    threads = []
+    timer   = StageTimer()
+    sim     = None
+    
+    if not args.no_sim:
+        profile = ReplayProfile(args.replay) if args.replay else OrbitProfile()
+        sim     = SimServer(profile, port=args.sim_port, speed=args.speed)
+        threads.append(threading.Thread(target=sim.serve_forever, daemon=True))
+    
+    server    = None
+    on_stream = None
+    client    = TacviewClient(args.stream_port)
+    threads.append(threading.Thread(target=client.run, daemon=True))
+    
+    # worker processes run their own Tacview server
+    if not args.sink_processes:
+        server    = TacviewServer(args.stream_port)
+        on_stream = timer.wrap('stream', server.publish, count_arg=0)
+        threads.append(threading.Thread(target=server.serve_forever, daemon=True))
+    
+    log_dir  = args.log_dir or tempfile.mkdtemp(prefix='thunder_viewer_bench_')
+    snapshot = TelemetrySnapshot()
+    config   = RecordConfig(log_dir=log_dir,
+                            sample_rate=args.sample_rate,
+                            stream_enable=True,
+                            mqtt_enable=bool(args.broker),
+                            mqtt_id=args.mqtt_id,
+                            broker_host=args.broker or '',
+                            mqtt_codec=args.mqtt_codec,
+                            column_enable=args.columns,
+                            sink_processes=args.sink_processes,
+                            stream_port=args.stream_port,
+                            broadcast_target=args.broadcast or '')
+    
+    recorder = Recorder(config,
+                        on_stream=on_stream,
+                        on_overlay=timer.wrap('overlay', snapshot.publish))
+    
+    # send every USB field to a loopback device at the USB writer's own rate
+    usb = LoopbackUsbWriter('loopback', 0, [field[0] for field in USB_FIELDS], args.usb_rate)
+    recorder.usb_writer = usb
+    recorder.usb_enable = True
+    
+    recorder.telem.get_telemetry = timer.wrap('fetch', recorder.telem.get_telemetry)
+    recorder.process_player_data = timer.wrap('sample', recorder.process_player_data)
+    recorder.writer.write        = timer.wrap('log', recorder.writer.write)
+    usb.publish                  = timer.wrap('usb', usb.publish)
+    
+    if recorder.mqtt_enable and not args.sink_processes:
+        recorder.mqttc.publish = timer.wrap('mqtt', recorder.mqttc.publish, count_arg=1)
+    
+    for thread in threads:
+        thread.start()
+    
+    time.sleep(args.warmup)
+    
+    rec_th = threading.Thread(target=recorder.run, daemon=True)
+    
+    cpu_start  = cpu_times()
+    proc_start = os.times()
+    start      = time.monotonic()
+    
+    rec_th.start()
+    time.sleep(args.duration)
+    recorder.stop()
+    rec_th.join()
+    
+    elapsed  = time.monotonic() - start
+    proc_end = os.times()
+    cpu_end  = cpu_times()
+    
+    if recorder.mqtt_enable and not args.sink_processes:
+        recorder.mqttc.disconnect()
+    
+    client.stop()
+    
+    if server:
+        server.shutdown()
+    
+    if sim:
+        sim.shutdown()
+    
+    loopback = getattr(usb, 'loopback', None)
+    cpu_time = (proc_end.user - proc_start.user) + (proc_end.system - proc_start.system)
+    
+    return {'duration_s':       elapsed,
+            'target_rate_hz':   args.sample_rate,
+            'achieved_rate_hz': recorder.scheduler.ticks / elapsed,
+            'missed_deadlines': recorder.scheduler.missed,
+            'stages':           timer.report(),
+            'process_cpu_pct':  100 * cpu_time / elapsed,
+            'cpu_per_core_pct': cpu_usage(cpu_start, cpu_end),
+            'bytes':            {'log':    recorder.writer.written,
+                                 'stream': client.received,
+                                 'mqtt':   timer.bytes.get('mqtt', 0),
+                                 'usb':    loopback.bytes if loopback else 0},
+            'sinks':            {name: {'delivered': sink.delivered,
+                                        'dropped':   sink.dropped,
+                                        'failed':    sink.failed} for name, sink in recorder.pipeline.sinks.items()},
+            'usb':              {'sent':    usb.sent,
+                                 'dropped': usb.dropped,
+                                 'failed':  usb.failed},
+            'sim_requests':     dict(sim.requests) if sim else {},
+            'log_dir':          log_dir}
+
+def print_report(results):
+    '''
+    Description:
+    ------------
+    Print benchmark results as a table
+    
+    :param results: dict - benchmark results (see run_benchmark())
+    '''
+    
+    print('Sample rate:      {:.2f} Hz achieved of {} Hz target ({} missed deadlines)'.format(results['achieved_rate_hz'],
+                                                                                             results['target_rate_hz'],
+                                                                                             results['missed_deadlines']))
+    print('Process CPU:      {:.1f}%'.format(results['process_cpu_pct']))
+    
+    if results['cpu_per_core_pct'] is not None:
+        print('CPU per core:     {}'.format(' '.join('{:.0f}%'.format(core) for core in results['cpu_per_core_pct'])))
+    else:
+        print('CPU per core:     (install psutil)')
+    
+    print('Bytes written:    {}'.format(', '.join('{} {}'.format(name, count) for name, count in results['bytes'].items())))
+    print('USB packets:      {sent} sent, {dropped} dropped, {failed} failed'.format(**results['usb']))
+    print('Sink drops:       {}'.format(', '.join('{} {}'.format(name, stats['dropped']) for name, stats in results['sinks'].items())))
+    print()
+    print('{:<10}{:>8}{:>10}{:>10}{:>10}{:>10}'.format('stage', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    
+    for stage, stats in results['stages'].items():
+        print('{:<10}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}'.format(stage,
+                                                                       stats['count'],
+                                                                       stats['p50_ms'],
+                                                                       stats['p90_ms'],
+                                                                       stats['p99_ms'],
+                                                                       stats['max_ms']))
+
+
+def main(argv=None):
+    '''
+    Description:
+    ------------
+    Benchmark the recording pipeline against the simulated War Thunder
+    localhost server
+    '''
+    
+    parser = argparse.ArgumentParser(prog='benchmark.py',
+                                     description='Measure the recording pipeline end to end without the game')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to record')
+    parser.add_argument('--warmup', type=float, default=1, help='seconds to wait for the servers to start')
+    parser.add_argument('--sample-rate', type=int, default=10, help='samples per second')
+    parser.add_argument('--replay', help='ACMI log replayed by the simulated server (synthetic orbit if not given)')
+    parser.add_argument('--speed', type=float, default=1.0, help='playback speed of the simulated server')
+    parser.add_argument('--sim-port', type=int, default=SIM_PORT, help='simulated server port (the WarThunder library expects 8111)')
+    parser.add_argument('--no-sim', action='store_true', help="don't start the simulated server (use the game or a sim_server.py process)")
+    parser.add_argument('--stream-port', type=int, default=18110, help='Tacview stream port')
+    parser.add_argument('--broker', help='MQTT broker host (i.e. localhost) - MQTT is skipped if not given')
+    parser.add_argument('--mqtt-id', default='thunder_viewer_benchmark', help='MQTT topic')
+    parser.add_argument('--mqtt-codec', choices=['binary', 'json'], default='binary', help='MQTT payload format')
+    parser.add_argument('--usb-rate', type=int, default=50, help='loopback USB packets per second')
+    parser.add_argument('--sink-processes', action='store_true',
+                        help='write the log, stream and publish to MQTT from worker processes')
+    parser.add_argument('--columns', action='store_true', help='also record a raw telemetry column file')
+    parser.add_argument('--broadcast', metavar='TARGET', help='also broadcast binary telemetry datagrams (i.e. udp://239.255.42.99:8114)')
+    parser.add_argument('--log-dir', help='directory logs are saved in (temporary directory if not given)')
+    parser.add_argument('--json', help='also save the results to this JSON file (i.e. to compare before/after a change)')
+    
+    args    = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    results = run_benchmark(args)
+    
+    print_report(results)
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
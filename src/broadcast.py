@@ -0,0 +1,376 @@
+'''
+Connectionless binary telemetry broadcast for motion rigs, gauges and other
+low-latency consumers on the same machine or LAN. Every sample is sent as a
+single fixed-layout datagram - there is no per-listener state, so any number
+of listeners costs the same as one.
+
+Targets:
+    udp://239.255.42.99:8114  - UDP multicast (any number of listeners on the
+                                machine/LAN join the group), unicast or
+                                broadcast addresses work too
+    unix:///tmp/tv.sock       - Unix datagram socket (a single local
+                                listener, POSIX only)
+
+Datagram layout (version 1) - little endian, no padding, 208 bytes:
+
+    offset  type      field
+    0       char[4]   magic 'TVBC'
+    4       uint8     layout version
+    5       uint8     flags (reserved)
+    6       uint16    reserved
+    8       uint64    sequence - +1 every datagram (gaps are lost datagrams)
+    16      double    time - UNIX time (s) the datagram was sent
+    24      double    tstamp - seconds since the ACMI log's reference time
+    32      char[32]  airframe - War Thunder vehicle type (UTF-8, NUL padded)
+    64      double    18 values in telem_shm.FIELDS order (NaN if not
+                      reported)
+
+Listen (reference decoder):
+    python broadcast.py listen --target udp://239.255.42.99:8114
+
+Measure the loopback latency:
+    python broadcast.py bench --count 10000 --rate 1000
+'''
+
+import os
+import sys
+import time
+import socket
+import struct
+import argparse
+import threading
+from collections import namedtuple
+from metrics import metrics
+from telem_shm import FIELDS
+from constants import BROADCAST_TARGET, BROADCAST_TTL
+
+
+DATAGRAM_MAGIC   = b'TVBC'
+DATAGRAM_VERSION = 1
+DATAGRAM         = struct.Struct('<4sBBHQdd32s{}d'.format(len(FIELDS))) # see the layout above
+NO_VALUES        = (float('nan'),) * len(FIELDS)
+DEFAULT_TARGET   = 'udp://239.255.42.99:8114'
+
+dropped_counter = metrics.counter('broadcast_dropped_total', 'Broadcast datagrams the OS refused')
+
+BroadcastSample = namedtuple('BroadcastSample', ('sequence', 'time', 'tstamp', 'airframe') + FIELDS)
+
+
+def parse_target(target):
+    '''
+    Description:
+    ------------
+    Split a broadcast target into a socket family and address
+    
+    :param target: str - i.e. 'udp://239.255.42.99:8114' or 'unix:///tmp/tv.sock'
+    
+    :return: tuple - socket family and address
+    
+    Raises ValueError if the target isn't supported
+    '''
+    
+    scheme, _, address = target.partition('://')
+    
+    if scheme == 'udp':
+        host, _, port = address.rpartition(':')
+        return socket.AF_INET, (host, int(port))
+    
+    if scheme == 'unix' and hasattr(socket, 'AF_UNIX'):
+        return socket.AF_UNIX, address
+    
+    raise ValueError('Unsupported broadcast target {}'.format(target))
+
+def is_multicast(host):
+    try:
+        return 224 <= int(host.split('.')[0]) <= 239
+    except ValueError:
+        return False
+
+def decode(datagram):
+    '''
+    Description:
+    ------------
+    Reference decoder of a broadcast datagram
+    
+    :param datagram: bytes - received datagram
+    
+    :return: BroadcastSample - decoded sample (None if it isn't a version 1
+                               Thunder Viewer datagram)
+    '''
+    
+    if len(datagram) != DATAGRAM.size:
+        return None
+    
+    values = DATAGRAM.unpack(datagram)
+    
+    if values[0] != DATAGRAM_MAGIC or values[1] != DATAGRAM_VERSION:
+        return None
+    
+    airframe = values[7].rstrip(b'\x00').decode('utf8', 'replace')
+    
+    return BroadcastSample(values[4], values[5], values[6], airframe, *values[8:])
+
+
+class BroadcastSender(object):
+    '''
+    Description:
+    ------------
+    Sends every sample as a single datagram. Sending never blocks - a
+    datagram the OS can't take right away is dropped and counted
+    '''
+    
+    def __init__(self, target=BROADCAST_TARGET or DEFAULT_TARGET, ttl=BROADCAST_TTL):
+        '''
+        Description:
+        ------------
+        Open the socket
+        
+        :param target: str - broadcast target (see parse_target())
+        :param ttl:    int - multicast time to live (1 keeps datagrams on the
+                             local network)
+        '''
+        
+        self.target   = target
+        self.sequence = 0
+        self.dropped  = 0 # datagrams the OS refused (i.e. no Unix listener)
+        
+        self.family, self.address = parse_target(target)
+        self.sock = socket.socket(self.family, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        
+        if self.family == socket.AF_INET:
+            host = self.address[0]
+            
+            if is_multicast(host):
+                self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+                self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            elif host.endswith('.255'):
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    
+    def send(self, tstamp, airframe, values):
+        '''
+        Description:
+        ------------
+        Broadcast a single sample
+        
+        :param tstamp:   float - seconds since the ACMI log's reference time
+                                 (None if unknown)
+        :param airframe: str   - War Thunder vehicle type
+        :param values:   tuple - values in FIELDS order (None if not reported,
+                                 i.e. an acmi_format.EntryRecord)
+        
+        :return: bool - whether or not the datagram was sent
+        '''
+        
+        values = NO_VALUES if values is None else tuple(float('nan') if value is None else value for value in values)
+        
+        self.sequence += 1
+        datagram = DATAGRAM.pack(DATAGRAM_MAGIC,
+                                 DATAGRAM_VERSION,
+                                 0,
+                                 0,
+                                 self.sequence,
+                                 time.time(),
+                                 float('nan') if tstamp is None else tstamp,
+                                 airframe.encode('utf8')[:32],
+                                 *values)
+        
+        try:
+            self.sock.sendto(datagram, self.address)
+        except OSError:
+            self.dropped += 1
+            dropped_counter.inc()
+            return False
+        
+        return True
+    
+    def close(self):
+        self.sock.close()
+
+
+class BroadcastReceiver(object):
+    '''
+    Description:
+    ------------
+    Receives broadcast samples (several receivers on the same machine can
+    listen to the same multicast target)
+    '''
+    
+    def __init__(self, target=BROADCAST_TARGET or DEFAULT_TARGET):
+        '''
+        Description:
+        ------------
+        Bind to the target and join its multicast group (if any)
+        
+        :param target: str - broadcast target (see parse_target())
+        '''
+        
+        self.target   = target
+        self.lost     = 0    # datagrams missing from the sequence
+        self.last_seq = None
+        
+        self.family, self.address = parse_target(target)
+        self.sock = socket.socket(self.family, socket.SOCK_DGRAM)
+        
+        if self.family == socket.AF_INET:
+            host, port = self.address
+            
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            
+            if hasattr(socket, 'SO_REUSEPORT'):
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            
+            self.sock.bind(('', port))
+            
+            if is_multicast(host):
+                membership = socket.inet_aton(host) + socket.inet_aton('0.0.0.0')
+                self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        else:
+            # a Unix socket left behind by a listener that crashed
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            
+            self.sock.bind(self.address)
+    
+    def recv(self, timeout=None):
+        '''
+        Description:
+        ------------
+        Wait for the next sample
+        
+        :param timeout: float - max time (s) to wait (forever if None)
+        
+        :return: BroadcastSample - received sample (None on timeout)
+        '''
+        
+        self.sock.settimeout(timeout)
+        
+        while True:
+            try:
+                datagram = self.sock.recv(DATAGRAM.size + 1)
+            except socket.timeout:
+                return None
+            
+            sample = decode(datagram)
+            
+            if sample is None:
+                continue
+            
+            # a restarted sender starts over at 1
+            if self.last_seq is not None and sample.sequence > self.last_seq + 1:
+                self.lost += sample.sequence - self.last_seq - 1
+            
+            self.last_seq = sample.sequence
+            return sample
+    
+    def close(self):
+        self.sock.close()
+        
+        if self.family != socket.AF_INET:
+            try:
+                os.unlink(self.address)
+            except OSError:
+                pass
+
+
+def listen(args):
+    receiver = BroadcastReceiver(args.target)
+    
+    try:
+        while True:
+            sample = receiver.recv()
+            print('#{} latency {:.2f} ms: {}'.format(sample.sequence,
+                                                     (time.time() - sample.time) * 1000,
+                                                     ', '.join('{}={:g}'.format(field, getattr(sample, field)) for field in FIELDS)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.close()
+
+def bench(args):
+    '''
+    Description:
+    ------------
+    Send datagrams to a receiver in the same process and report the
+    send-to-receive latency
+    '''
+    
+    from benchmark import percentile
+    
+    receiver  = BroadcastReceiver(args.target)
+    sender    = BroadcastSender(args.target)
+    sent      = {} # sequence -> time.perf_counter() of the send
+    latencies = []
+    values    = tuple(float(i) for i in range(len(FIELDS)))
+    
+    def receive():
+        while len(latencies) < args.count:
+            sample = receiver.recv(timeout=1)
+            
+            if sample is None:
+                break
+            
+            latencies.append(time.perf_counter() - sent[sample.sequence])
+    
+    receive_th = threading.Thread(target=receive, daemon=True)
+    receive_th.start()
+    
+    start = time.perf_counter()
+    send_cost = 0.0
+    
+    for i in range(args.count):
+        deadline = start + i / args.rate
+        
+        while time.perf_counter() < deadline:
+            time.sleep(0)
+        
+        sent[sender.sequence + 1] = before = time.perf_counter()
+        sender.send(i / args.rate, 'benchmark', values)
+        send_cost += time.perf_counter() - before
+    
+    receive_th.join()
+    sender.close()
+    receiver.close()
+    
+    latencies.sort()
+    
+    print('Target:       {}'.format(args.target))
+    print('Datagrams:    {} sent, {} received, {} lost, {} refused'.format(args.count, len(latencies), receiver.lost, sender.dropped))
+    print('Send cost:    {:.1f} us per datagram'.format(send_cost / args.count * 1e6))
+    
+    for pct in (50, 90, 99):
+        print('Latency p{}:  {:.1f} us'.format(pct, percentile(latencies, pct) * 1e6))
+    
+    if latencies:
+        print('Latency max:  {:.1f} us'.format(latencies[-1] * 1e6))
+
+def main(argv=None):
+    '''
+    Description:
+    ------------
+    Listen to the telemetry broadcast or measure its loopback latency
+    '''
+    
+    parser = argparse.ArgumentParser(prog='broadcast.py',
+                                     description='Thunder Viewer binary telemetry broadcast tools')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    
+    listen_cmd = commands.add_parser('listen', help='print received samples')
+    listen_cmd.add_argument('--target', default=BROADCAST_TARGET or DEFAULT_TARGET, help='i.e. udp://239.255.42.99:8114 or unix:///tmp/tv.sock')
+    
+    bench_cmd = commands.add_parser('bench', help='measure the loopback latency')
+    bench_cmd.add_argument('--target', default=DEFAULT_TARGET, help='i.e. udp://239.255.42.99:8114 or unix:///tmp/tv.sock')
+    bench_cmd.add_argument('--count', type=int, default=10000, help='datagrams to send')
+    bench_cmd.add_argument('--rate', type=float, default=1000, help='datagrams per second')
+    
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    
+    if args.command == 'listen':
+        listen(args)
+    else:
+        bench(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+import struct
+from array import array
+from constants import COLUMN_CHUNK_ROWS
+
+
+COLUMN_EXT     = '.tvcol'
+COLUMN_MAGIC   = b'TVCL'
+CHUNK_MAGIC    = b'TVCK'
+COLUMN_VERSION = 1
+
+NUMBER = 0 # numeric/bool values
+TEXT   = 1 # text values (stored as uint16 codes of a per-column label table)
+
+FILE_HEAD  = struct.Struct('<4sB')    # magic, format version
+CHUNK_HEAD = struct.Struct('<4sIHHH') # magic, rows, new columns, new labels, column blocks
+COLUMN_DEF = struct.Struct('<BB')     # column type, struct code
+LABEL_DEF  = struct.Struct('<H')      # column number
+BLOCK_HEAD = struct.Struct('<HI')     # column number, number of values (bitmap of the rows with a value follows if < rows)
+STR_LEN    = struct.Struct('<H')
+
+# only the position needs double precision, every other War Thunder
+# indicator is reported with < 7 significant digits (see mqtt_codec.py)
+DOUBLE_FIELDS = ('lon', 'lat', 'alt_m')
+
+
+def _pack_str(text):
+    data = text.encode('utf8')
+    return STR_LEN.pack(len(data)) + data
+
+def _unpack_str(data, offset):
+    length, = STR_LEN.unpack_from(data, offset)
+    offset += STR_LEN.size
+    return data[offset:offset + length].decode('utf8'), offset + length
+
+
+class Column(object):
+    '''
+    Description:
+    ------------
+    Preallocated buffer of a single column for one chunk of rows
+    '''
+    
+    __slots__ = ('num', 'name', 'kind', 'code', 'values', 'present', 'count', 'labels', 'new_labels')
+    
+    def __init__(self, num, name, kind, rows):
+        self.num        = num
+        self.name       = name
+        self.kind       = kind
+        self.code       = 'H' if kind == TEXT else ('d' if name in DOUBLE_FIELDS else 'f')
+        self.values     = array(self.code, bytes(array(self.code).itemsize * rows))
+        self.present    = bytearray(rows) # 1 for every row with a value
+        self.count      = 0               # number of rows with a value
+        self.labels     = {}              # text -> code (TEXT columns only)
+        self.new_labels = []              # labels not yet written
+
+
+class ColumnRecorder(object):
+    '''
+    Description:
+    ------------
+    Records every raw War Thunder telemetry sample (including the fields
+    ACMI logs don't keep) into preallocated column buffers. Full chunks are
+    serialized into a compact binary file and written by the given
+    LogWriter, so the sampling loop never touches the disk.
+    
+    Columns are created as keys show up - a column only holds values for
+    the rows whose sample contained its key (sparse), so fields appearing
+    mid-flight cost nothing before they appear.
+    
+    File layout: FILE_HEAD, reference time, then chunks. Every chunk starts
+    with the schema changes since the previous chunk (new columns and text
+    labels) followed by the sample times and one block per column with
+    values in the chunk
+    '''
+    
+    def __init__(self, writer, path, ref_time, chunk_rows=COLUMN_CHUNK_ROWS):
+        '''
+        Description:
+        ------------
+        Start a new column file
+        
+        :param writer:     LogWriter - writer used for the file
+        :param path:       str       - column file path
+        :param ref_time:   datetime  - UTC reference time of the sample times
+        :param chunk_rows: int       - number of rows per chunk
+        '''
+        
+        self.writer     = writer
+        self.path       = path
+        self.chunk_rows = chunk_rows
+        self.columns    = {} # telemetry key -> Column
+        self.rows       = 0  # rows in the current chunk
+        self.total_rows = 0  # rows written in previous chunks
+        
+        self.times      = array('d', bytes(8 * chunk_rows))
+        self._new_cols  = [] # columns created since the last chunk
+        self._order     = [] # all columns (in column number order)
+        
+        self.writer.open(path, FILE_HEAD.pack(COLUMN_MAGIC, COLUMN_VERSION) + _pack_str(ref_time.isoformat()))
+    
+    def append(self, tstamp, telem):
+        '''
+        Description:
+        ------------
+        Add a single sample
+        
+        :param tstamp: float - seconds since the reference time
+        :param telem:  dict  - full War Thunder vehicle telemetry data
+        '''
+        
+        row     = self.rows
+        columns = self.columns
+        
+        self.times[row] = tstamp
+        
+        for key, value in telem.items():
+            col = columns.get(key)
+            
+            if col is None:
+                col = self.add_column(key, TEXT if isinstance(value, str) else NUMBER)
+            
+            if col.kind == TEXT:
+                if not isinstance(value, str):
+                    continue
+                
+                code = col.labels.get(value)
+                
+                if code is None:
+                    code = len(col.labels)
+                    col.labels[value] = code
+                    col.new_labels.append(value)
+                
+                value = code
+            
+            elif value is None or isinstance(value, str):
+                continue
+            
+            col.values[row]  = value
+            col.present[row] = 1
+            col.count       += 1
+        
+        self.rows += 1
+        
+        if self.rows == self.chunk_rows:
+            self.flush()
+    
+    def add_column(self, name, kind):
+        '''
+        Description:
+        ------------
+        Create the buffer of a new column
+        
+        :param name: str - telemetry key
+        :param kind: int - NUMBER or TEXT
+        
+        :return col: Column - new column
+        '''
+        
+        col = Column(len(self._order), name, kind, self.chunk_rows)
+        
+        self.columns[name] = col
+        self._order.append(col)
+        self._new_cols.append(col)
+        
+        return col
+    
+    def flush(self):
+        '''
+        Description:
+        ------------
+        Serialize the current chunk and queue it to be written
+        '''
+        
+        rows = self.rows
+        
+        if not rows:
+            return
+        
+        new_labels = [(col, label) for col in self._order for label in col.new_labels]
+        blocks     = [col for col in self._order if col.count]
+        parts      = [CHUNK_HEAD.pack(CHUNK_MAGIC, rows, len(self._new_cols), len(new_labels), len(blocks))]
+        
+        for col in self._new_cols:
+            parts.append(COLUMN_DEF.pack(col.kind, ord(col.code)) + _pack_str(col.name))
+        
+        for col, label in new_labels:
+            parts.append(LABEL_DEF.pack(col.num) + _pack_str(label))
+        
+        parts.append(self.times[:rows].tobytes())
+        
+        for col in blocks:
+            parts.append(BLOCK_HEAD.pack(col.num, col.count))
+            
+            if col.count == rows:
+                parts.append(col.values[:rows].tobytes())
+            else:
+                present = col.present
+                bitmap  = bytearray((rows + 7) // 8)
+                
+                for i in range(rows):
+                    if present[i]:
+                        bitmap[i >> 3] |= 1 << (i & 7)
+                
+                parts.append(bytes(bitmap))
+                parts.append(array(col.code, [col.values[i] for i in range(rows) if present[i]]).tobytes())
+            
+            col.present[:] = bytes(self.chunk_rows)
+            col.count      = 0
+        
+        for col in self._order:
+            col.new_labels = []
+        
+        self._new_cols   = []
+        self.total_rows += rows
+        self.rows        = 0
+        
+        self.writer.write(self.path, b''.join(parts))
+    
+    def close(self):
+        '''
+        Description:
+        ------------
+        Write the last (partial) chunk and close the file
+        '''
+        
+        self.flush()
+        self.writer.close(self.path)
+
+
+def read_columns(path):
+    '''
+    Description:
+    ------------
+    Read a column file
+    
+    :param path: str - column file path
+    
+    :return: tuple - reference time (str), sample times (array) and columns
+                     (dict - telemetry key -> list of values, None for rows
+                     without a value)
+    '''
+    
+    with open(path, 'rb') as f:
+        data = f.read()
+    
+    magic, version = FILE_HEAD.unpack_from(data)
+    
+    if (magic != COLUMN_MAGIC) or (version != COLUMN_VERSION):
+        raise ValueError('{} is not a Thunder Viewer column file'.format(path))
+    
+    ref_time, offset = _unpack_str(data, FILE_HEAD.size)
+    
+    times   = array('d')
+    schema  = [] # (name, kind, struct code) of every column
+    labels  = [] # label list of every column
+    columns = {}
+    
+    while offset + CHUNK_HEAD.size <= len(data):
+        magic, rows, num_cols, num_labels, num_blocks = CHUNK_HEAD.unpack_from(data, offset)
+        offset += CHUNK_HEAD.size
+        
+        if magic != CHUNK_MAGIC:
+            raise ValueError('Corrupt chunk in {}'.format(path))
+        
+        for _ in range(num_cols):
+            kind, code = COLUMN_DEF.unpack_from(data, offset)
+            name, offset = _unpack_str(data, offset + COLUMN_DEF.size)
+            
+            schema.append((name, kind, chr(code)))
+            labels.append([])
+            columns[name] = [None] * len(times)
+        
+        for _ in range(num_labels):
+            num, = LABEL_DEF.unpack_from(data, offset)
+            label, offset = _unpack_str(data, offset + LABEL_DEF.size)
+            
+            labels[num].append(label)
+        
+        times.frombytes(data[offset:offset + 8 * rows])
+        offset += 8 * rows
+        
+        for values in columns.values():
+            values.extend([None] * rows)
+        
+        for _ in range(num_blocks):
+            num, count = BLOCK_HEAD.unpack_from(data, offset)
+            offset += BLOCK_HEAD.size
+            
+            name, kind, code = schema[num]
+            first = len(times) - rows
+            
+            if count == rows:
+                present = range(rows)
+            else:
+                bitmap  = data[offset:offset + (rows + 7) // 8]
+                offset += len(bitmap)
+                present = [i for i in range(rows) if bitmap[i >> 3] & (1 << (i & 7))]
+            
+            values = array(code)
+            values.frombytes(data[offset:offset + values.itemsize * count])
+            offset += values.itemsize * count
+            
+            if kind == TEXT:
+                values = [labels[num][value] for value in values]
+            elif code == 'f':
+                values = [float('{:.7g}'.format(value)) for value in values] # drop float32 rounding noise
+            
+            column = columns[name]
+            
+            for i, value in zip(present, values):
+                column[first + i] = value
+    
+    return ref_time, times, columns
@@ -10,11 +10,44 @@ LOGS_DIR     = os.path.join(APP_DIR, 'logs')
 MQTT_DIR     = os.path.join(APP_DIR, 'mqtt')
 REMOTE_DIR   = os.path.join(MQTT_DIR, 'remote_players')
 REF_FILE     = os.path.join(MQTT_DIR, 'reference.txt')
-TEXTURES_DIR = os.path.join(os.environ['APPDATA'], r'Tacview\Data\Terrain\Textures')
+TEXTURES_DIR = os.path.join(os.environ.get('APPDATA', APP_DIR), r'Tacview\Data\Terrain\Textures')
 XML_NAME     = 'CustomTextureList.xml'
 TEXTURE_XML_TEMPLATE  = os.path.join(APP_DIR, XML_NAME)
 TEXTURE_XML  = os.path.join(TEXTURES_DIR, XML_NAME)
 TITLE_FORMAT = '{timestamp}_{user}.acmi'
+STREAM_BUFF_LEN         = 100        # max number of ACMI lines waiting to be streamed
+STREAM_CLIENT_MAX_QUEUE = 256 * 1024 # max unsent bytes before a Tacview client is dropped
+ACMI_KEYFRAME_PERIOD    = 10         # seconds between full (non-delta) ACMI object states
+FETCH_TIMEOUT           = 1.0        # HTTP timeout (s) of a single War Thunder localhost request
+FETCH_BUDGET            = 0.25       # max time (s) a sample waits for late localhost endpoints
+LOG_FLUSH_INTERVAL      = 1.0        # max time (s) ACMI log text is held before being written
+LOG_FLUSH_BYTES         = 64 * 1024  # queued bytes per ACMI log that trigger an early write
+LOG_FSYNC               = False      # force every ACMI log write to stable storage
+ACMI_INDEX              = True       # keep a sidecar seek index (.idx) next to every ACMI log
+COLUMN_CHUNK_ROWS       = 1024       # samples buffered per chunk of a raw telemetry column file
+REF_CHECK_PERIOD        = 1.0        # min time (s) between checks of REF_FILE for updates by other processes
+MQTT_CODEC              = 'binary'   # MQTT payload format - 'binary' or 'json' (older versions)
+MQTT_COMPRESS           = False      # zlib compress binary MQTT payloads
+OVERLAY_MAX_FPS         = 60         # max overlay redraws per second (capped by the display refresh rate)
+USB_RATE                = 50         # packets sent to the USB device per second
+USB_RECONNECT_MIN       = 0.5        # first delay (s) before reopening a failed USB device
+USB_RECONNECT_MAX       = 10.0       # max delay (s) before reopening a failed USB device
+TEXTURE_RETRY           = 30.0       # delay (s) before installing a map texture that failed again
+METRICS_PORT            = 8113       # localhost port of the Prometheus metrics endpoint (0 disables it)
+METRICS_SUMMARY_PERIOD  = 5.0        # seconds between stage latency summaries in the status bar
+SINK_QUEUE_LEN          = 100        # samples queued per pipeline output before its overflow policy applies
+SINK_PROCESSES          = False      # write ACMI logs, stream to Tacview and publish to MQTT from worker processes
+SHM_RING_SLOTS          = 1024       # records held by the shared memory ring buffer of a worker process
+SHM_WAIT_TIMEOUT        = 0.5        # max time (s) waiting for room in a worker process' ring buffer before checking the worker is alive
+METRICS_SYNC_PERIOD     = 1.0        # seconds between copies of a worker process' stage latencies to the main process
+TELEM_SHM               = True       # publish the latest sample to shared memory for local tools (see telem_shm.py)
+TELEM_SHM_NAME          = 'thunder_viewer_telemetry' # name of the latest-sample shared memory block
+BROADCAST_TARGET        = ''         # binary telemetry broadcast target, i.e. 'udp://239.255.42.99:8114' ('' disables it - see broadcast.py)
+BROADCAST_TTL           = 1          # multicast time to live of the broadcast (1 keeps it on the local network)
+GAME_DOWN_PROBE         = (1.0, 15.0) # first and max delay (s) between probes while War Thunder isn't running
+HANGAR_PROBE            = (0.5, 2.0)  # first and max delay (s) between probes while in the hangar (matches take longer to load)
+DEAD_PROBE              = (0.0, 0.0)  # first and max delay (s) between probes while waiting to spawn (never less than the sample period)
+PROBE_BACKOFF           = 2.0        # factor the probe delay grows by while War Thunder stays in the same state
 ACMI_HEADER  = {'DataSource': '',
                 'DataRecorder': '',
                 'Author': '',
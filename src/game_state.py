@@ -0,0 +1,71 @@
+from constants import GAME_DOWN_PROBE, HANGAR_PROBE, DEAD_PROBE, PROBE_BACKOFF
+
+
+GAME_DOWN = 'game down' # War Thunder's localhost server isn't answering
+IN_HANGAR = 'in hangar' # War Thunder is running, but no match is loaded
+DEAD      = 'dead'      # a match is loaded, but the player has no vehicle (dead or not spawned yet)
+IN_MATCH  = 'in match'  # the player is driving a vehicle - sampled at the full rate
+
+STATUS = {GAME_DOWN: 'Waiting for War Thunder to start',
+          IN_HANGAR: 'Waiting for a match in the hangar',
+          DEAD:      'Waiting to spawn',
+          IN_MATCH:  'Recording'}
+
+
+class GameStateMachine(object):
+    '''
+    Description:
+    ------------
+    Tracks what War Thunder is doing and how long the recorder may wait
+    before checking again. Only IN_MATCH is sampled at the full rate - every
+    other state is polled with a cheap probe whose delay grows exponentially
+    (up to the state's max) for as long as the state doesn't change, so a
+    recorder left idle costs close to nothing
+    '''
+    
+    def __init__(self, period):
+        '''
+        Description:
+        ------------
+        Initialize the state machine (the state is unknown until the first
+        update())
+        
+        :param period: float - sample period in seconds (the shortest delay
+                               between probes)
+        '''
+        
+        self.period  = period
+        self.backoff = {GAME_DOWN: GAME_DOWN_PROBE, # state -> first and max delay between probes
+                        IN_HANGAR: HANGAR_PROBE,
+                        DEAD:      DEAD_PROBE,
+                        IN_MATCH:  (0.0, 0.0)}
+        self.state   = None
+        self.delay   = 0.0 # time (s) to wait before the next probe (the first probe is immediate)
+    
+    def _first(self, state):
+        return max(self.backoff[state][0], self.period)
+    
+    @property
+    def sampling(self):
+        return self.state == IN_MATCH
+    
+    def update(self, state):
+        '''
+        Description:
+        ------------
+        Record the latest observed state and compute the delay before the
+        next probe
+        
+        :param state: str - observed state (GAME_DOWN, IN_HANGAR, DEAD or
+                            IN_MATCH)
+        
+        :return: bool - whether or not the state changed
+        '''
+        
+        if state != self.state:
+            self.state = state
+            self.delay = self._first(state)
+            return True
+        
+        self.delay = max(min(self.delay * PROBE_BACKOFF, self.backoff[state][1]), self._first(state))
+        return False
@@ -84,6 +84,43 @@ class DragTable(QtWidgets.QTableWidget):
         super(DragTable, self).mouseReleaseEvent(event)
 
 
+class DragTableView(QtWidgets.QTableView):
+
+    def mousePressEvent(self, event):
+        self.__mousePressPos = None
+        self.__mouseMovePos = None
+        
+        if event.button() == QtCore.Qt.LeftButton:
+            self.__mousePressPos = event.globalPos()
+            self.__mouseMovePos = event.globalPos()
+
+        super(DragTableView, self).mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() == QtCore.Qt.LeftButton:
+            # adjust offset from clicked point to origin of widget
+            currPos = self.mapToGlobal(self.pos())
+            globalPos = event.globalPos()
+            diff = globalPos - self.__mouseMovePos
+            newPos = self.mapFromGlobal(currPos + diff)
+            
+            self.move(newPos)
+
+            self.__mouseMovePos = globalPos
+
+        super(DragTableView, self).mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self.__mousePressPos is not None:
+            moved = event.globalPos() - self.__mousePressPos 
+            
+            if moved.manhattanLength() > 3:
+                event.ignore()
+                return
+
+        super(DragTableView, self).mouseReleaseEvent(event)
+
+
 class Ui_Overlay(object):
     def setupUi(self, Overlay):
         Overlay.setObjectName("Overlay")
@@ -98,7 +135,7 @@ class Ui_Overlay(object):
         Overlay.setAutoFillBackground(False)
         self.centralwidget = QtWidgets.QWidget(Overlay)
         self.centralwidget.setObjectName("centralwidget")
-        self.telem_table = DragTable(self.centralwidget)
+        self.telem_table = DragTableView(self.centralwidget)
         self.telem_table.setGeometry(QtCore.QRect(0, 0, 411, 431))
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Maximum, QtWidgets.QSizePolicy.Maximum)
         sizePolicy.setHorizontalStretch(0)
@@ -121,8 +158,6 @@ class Ui_Overlay(object):
         self.telem_table.setHorizontalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
         self.telem_table.setShowGrid(False)
         self.telem_table.setObjectName("telem_table")
-        self.telem_table.setColumnCount(0)
-        self.telem_table.setRowCount(0)
         self.telem_table.horizontalHeader().setVisible(False)
         self.telem_table.horizontalHeader().setCascadingSectionResizes(True)
         self.telem_table.horizontalHeader().setSortIndicatorShown(False)
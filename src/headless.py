@@ -0,0 +1,186 @@
+'''
+Headless (command line) entry point - records and streams match data without
+the GUI. PyQt5 is never imported.
+
+Example:
+    python headless.py record --sample-rate 10 --stream-port 8110
+    python headless.py record --config match.json --duration 1800
+    python headless.py record --broadcast udp://239.255.42.99:8114
+
+A config file is a JSON object whose keys are the long option names (i.e.
+{"log_dir": "D:/acmi", "mqtt_id": "my_squadron"}). Options given on the
+command line override the config file.
+'''
+
+import sys
+import json
+import signal
+import argparse
+import threading
+import multiprocessing
+from constants import LOGS_DIR, BROKER_HOST, MQTT_CODEC, USB_RATE, METRICS_PORT, BROADCAST_TARGET
+from metrics import MetricsServer
+from recorder import Recorder, RecordConfig
+from tacview_server import TacviewServer
+
+
+def build_parser():
+    '''
+    Description:
+    ------------
+    Create the command line parser
+    
+    :return parser: argparse.ArgumentParser - command line parser
+    '''
+    
+    parser = argparse.ArgumentParser(prog='headless.py',
+                                     description='Record and stream War Thunder match data without the GUI')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    
+    record = commands.add_parser('record', help='record (and optionally stream) match data')
+    record.add_argument('--config', help='JSON file with default option values')
+    record.add_argument('--log-dir', default=LOGS_DIR, help='directory ACMI logs are saved in')
+    record.add_argument('--sample-rate', type=int, default=6, help='samples per second')
+    record.add_argument('--team', choices=['blue', 'red'], default='blue', help='team color in Tacview')
+    record.add_argument('--stream-port', type=int, help='stream to Tacview clients on this localhost port')
+    record.add_argument('--mqtt-id', help='share data with this remote session ID')
+    record.add_argument('--broker', default=BROKER_HOST, help='MQTT broker host name')
+    record.add_argument('--mqtt-codec', choices=['binary', 'json'], default=MQTT_CODEC,
+                        help='MQTT payload format ("json" for squadron mates on older versions)')
+    record.add_argument('--mqtt-compress', action='store_true', help='zlib compress binary MQTT payloads')
+    record.add_argument('--usb-port', help='send data to the USB device on this serial port')
+    record.add_argument('--usb-baud', type=int, default=115200, help='USB device baud rate')
+    record.add_argument('--usb-rate', type=int, default=USB_RATE, help='packets sent to the USB device per second')
+    record.add_argument('--usb-field', action='append', dest='usb_fields', default=None,
+                        help='field sent to the USB device (i.e. "Roll Angle") - can be repeated')
+    record.add_argument('--columns', action='store_true',
+                        help='also record every raw telemetry field to a column file (.tvcol) next to the ACMI log')
+    record.add_argument('--sink-processes', action='store_true',
+                        help='write ACMI logs, stream to Tacview and publish to MQTT from worker processes')
+    record.add_argument('--broadcast', default=BROADCAST_TARGET or None, metavar='TARGET',
+                        help='broadcast binary telemetry datagrams (i.e. udp://239.255.42.99:8114 or unix:///tmp/tv.sock)')
+    record.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help='serve Prometheus metrics at http://localhost:<port>/metrics (0 disables)')
+    record.add_argument('--duration', type=float, help='stop recording after this many seconds')
+    
+    parser.commands = {'record': record}
+    
+    return parser
+
+def parse_args(argv):
+    '''
+    Description:
+    ------------
+    Parse the command line, using the config file (if given) for defaults
+    
+    :param argv: list - command line arguments
+    
+    :return args: argparse.Namespace - parsed options
+    '''
+    
+    parser = build_parser()
+    args   = parser.parse_args(argv)
+    
+    if getattr(args, 'config', None):
+        with open(args.config, 'r') as f:
+            defaults = json.load(f)
+        
+        parser.commands[args.command].set_defaults(**defaults)
+        args = parser.parse_args(argv)
+    
+    return args
+
+def record(args):
+    '''
+    Description:
+    ------------
+    Record (and optionally stream) match data until interrupted
+    
+    :param args: argparse.Namespace - parsed options
+    '''
+    
+    threads = []
+    server  = None
+    session = None
+    metrics_server = None
+    
+    # worker processes run their own Tacview server
+    if args.stream_port and not args.sink_processes:
+        server = TacviewServer(args.stream_port)
+        threads.append(threading.Thread(target=server.serve_forever, daemon=True))
+    
+    on_stream = server.publish if server else None
+    
+    if args.metrics_port:
+        metrics_server = MetricsServer(args.metrics_port)
+        threads.append(threading.Thread(target=metrics_server.serve_forever, daemon=True))
+    
+    config = RecordConfig(log_dir=args.log_dir,
+                          sample_rate=args.sample_rate,
+                          team_flag=(args.team == 'blue'),
+                          stream_enable=bool(args.stream_port),
+                          mqtt_enable=bool(args.mqtt_id),
+                          mqtt_id=args.mqtt_id or '',
+                          broker_host=args.broker,
+                          usb_enable=bool(args.usb_port),
+                          usb_fields=args.usb_fields,
+                          usb_port=args.usb_port or '',
+                          usb_baud=args.usb_baud,
+                          usb_rate=args.usb_rate,
+                          column_enable=args.columns,
+                          mqtt_codec=args.mqtt_codec,
+                          mqtt_compress=args.mqtt_compress,
+                          sink_processes=args.sink_processes,
+                          stream_port=args.stream_port,
+                          broadcast_target=args.broadcast or '')
+    
+    recorder = Recorder(config, on_stream=on_stream)
+    
+    if args.mqtt_id:
+        from remote_session import RemoteSession
+        
+        # remote players are streamed wherever the recorder streams to
+        session = RemoteSession(args.mqtt_id, args.broker, on_stream=recorder.on_stream)
+        threads.append(threading.Thread(target=session.run, daemon=True))
+    
+    signal.signal(signal.SIGINT,  lambda signum, frame: recorder.stop())
+    signal.signal(signal.SIGTERM, lambda signum, frame: recorder.stop())
+    
+    if args.duration:
+        timer = threading.Timer(args.duration, recorder.stop)
+        timer.daemon = True
+        timer.start()
+    
+    for thread in threads:
+        thread.start()
+    
+    try:
+        recorder.run()
+    finally:
+        if server:
+            server.shutdown()
+        
+        if session:
+            session.stop()
+        
+        if metrics_server:
+            metrics_server.shutdown()
+
+def main(argv=None):
+    '''
+    Description:
+    ------------
+    Main program to run
+    '''
+    
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    
+    if args.command == 'record':
+        record(args)
+
+
+if __name__ == '__main__':
+    # sink worker processes of a frozen build must not run main() again
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,353 @@
+import os
+import time
+import threading
+from collections import deque
+from acmi_index import AcmiIndex, index_path, load_index
+from metrics import metrics
+from constants import LOG_FLUSH_INTERVAL, LOG_FLUSH_BYTES, LOG_FSYNC, ACMI_INDEX
+
+
+OPEN  = 0 # truncate the log and write its header
+WRITE = 1 # append text to the log
+CLOSE = 2 # flush and close the log
+
+ACMI_EXT = '.acmi' # only ACMI logs are indexed
+
+write_timer = metrics.stage('log')
+log_errors  = metrics.errors('log')
+
+
+def queue_gauge(name):
+    '''
+    Description:
+    ------------
+    Queue depth metric of a log writer
+    
+    :param name: str - writer name
+    
+    :return: Gauge - log_queue_depth gauge labelled with the writer name
+    '''
+    
+    return metrics.gauge('log_queue_depth', 'Log operations queued for the log writer', writer=name)
+
+
+def _encode(text):
+    return text.encode('utf8') if isinstance(text, str) else text
+
+
+class LogFile(object):
+    '''
+    Description:
+    ------------
+    Write state of a single log file
+    '''
+    
+    def __init__(self, path):
+        '''
+        Description:
+        ------------
+        Initialize the write state
+        
+        :param path: str - log file path
+        '''
+        
+        self.path       = path
+        self.handle     = None
+        self.pending    = bytearray() # encoded text not yet written to disk
+        self.last_flush = time.monotonic()
+        self.failed     = False       # True while the last write attempt failed
+        self.index      = None        # AcmiIndex of the text written so far (None if not indexed)
+
+
+class LogWriter(object):
+    '''
+    Description:
+    ------------
+    Dedicated ACMI log writer. Producers (the sampling loop, the MQTT
+    subscriber) only queue text - they never touch the disk. The writer
+    keeps one open handle per log and writes the queued text in large
+    batches once flush_bytes have accumulated or flush_interval seconds have
+    passed, optionally followed by an fsync.
+    
+    Nothing is ever dropped: if a write fails (i.e. the network share is
+    unavailable) the text is kept and the write is retried at the next flush.
+    
+    If indexing is enabled, the seek index of every log is updated with the
+    text as it is written and saved next to the log when the log is closed
+    (see acmi_index.py)
+    '''
+    
+    def __init__(self, flush_interval=LOG_FLUSH_INTERVAL, flush_bytes=LOG_FLUSH_BYTES, fsync=LOG_FSYNC, index=ACMI_INDEX, name='local'):
+        '''
+        Description:
+        ------------
+        Initialize the writer (nothing is written until run() is called)
+        
+        :param flush_interval: float - max seconds queued text is held before
+                                       being written
+        :param flush_bytes:    int   - number of queued bytes per log that
+                                       triggers a write
+        :param fsync:          bool  - force every write to stable storage
+        :param index:          bool  - keep a sidecar seek index of every log
+        :param name:           str   - writer name (queue depth metric label)
+        '''
+        
+        self.flush_interval = flush_interval
+        self.flush_bytes    = flush_bytes
+        self.fsync          = fsync
+        self.index          = index
+        self.written        = 0 # number of bytes written to disk
+        self.errors         = 0 # number of failed writes
+        
+        self.logs     = {} # path -> LogFile
+        self._ops     = deque()
+        self._cond    = threading.Condition()
+        self._running = True
+        
+        # path -> queued or pending bytes not yet written (guarded by _cond)
+        # - counted as text is queued so the writer can be woken up as soon
+        # as a log has flush_bytes to write
+        self._unflushed = {}
+        
+        # released once run() ends so a finished writer isn't kept alive
+        self._gauge = queue_gauge(name)
+        self._depth = lambda: self.queue_depth
+        self._gauge.set_function(self._depth)
+    
+    @property
+    def queue_depth(self):
+        '''
+        Description:
+        ------------
+        Number of queued operations not yet processed by the writer
+        '''
+        
+        return len(self._ops)
+    
+    @property
+    def pending_bytes(self):
+        '''
+        Description:
+        ------------
+        Number of processed bytes waiting for the next flush
+        '''
+        
+        return sum(len(log.pending) for log in list(self.logs.values()))
+    
+    def open(self, path, header=''):
+        '''
+        Description:
+        ------------
+        Queue the creation of a new log (an existing file is truncated)
+        
+        :param path:   str       - log file path
+        :param header: str/bytes - text (or binary data) written at the start
+                                   of the log
+        '''
+        
+        self._queue(OPEN, path, header)
+    
+    def write(self, path, text):
+        '''
+        Description:
+        ------------
+        Queue text to be appended to a log - safe to call from any thread
+        
+        :param path: str       - log file path
+        :param text: str/bytes - text (or binary data) to append
+        '''
+        
+        self._queue(WRITE, path, text)
+    
+    def close(self, path):
+        '''
+        Description:
+        ------------
+        Queue a final flush and close of a log
+        
+        :param path: str - log file path
+        '''
+        
+        self._queue(CLOSE, path, None)
+    
+    def stop(self):
+        '''
+        Description:
+        ------------
+        Write everything that is queued, close all logs and end run() - safe
+        to call from any thread
+        '''
+        
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+    
+    def run(self):
+        '''
+        Description:
+        ------------
+        Process queued log operations until stop() is called
+        '''
+        
+        while True:
+            with self._cond:
+                if not self._ops and self._running:
+                    self._cond.wait(self.flush_interval)
+                
+                ops = list(self._ops)
+                self._ops.clear()
+                running = self._running
+            
+            for op, path, text in ops:
+                self._process(op, path, text)
+            
+            if not running:
+                break
+            
+            self._flush_due()
+        
+        for log in list(self.logs.values()):
+            self._flush(log)
+            self._close(log)
+            self._save_index(log)
+        
+        self.logs = {}
+        self._gauge.clear_function(self._depth)
+    
+    def _queue(self, op, path, text):
+        with self._cond:
+            self._ops.append((op, path, text))
+            
+            if op == WRITE:
+                before = self._unflushed.get(path, 0)
+                after  = before + len(text)
+                self._unflushed[path] = after
+                
+                # only wake the writer once per early write (not for every
+                # write while a failed log is waiting to be retried)
+                if before < self.flush_bytes <= after:
+                    self._cond.notify()
+            
+            else:
+                if op == OPEN:
+                    self._unflushed[path] = len(text)
+                else:
+                    self._unflushed.pop(path, None)
+                
+                self._cond.notify()
+    
+    def _process(self, op, path, text):
+        if op == OPEN:
+            log = self.logs.get(path)
+            
+            if log:
+                self._flush(log)
+                self._close(log)
+                self._save_index(log)
+            
+            log = LogFile(path)
+            self.logs[path] = log
+            
+            if self.index and path.endswith(ACMI_EXT):
+                log.index = AcmiIndex()
+            
+            try:
+                log.handle = open(path, 'wb', buffering=0)
+            except OSError as e:
+                print('ERROR: Could not create log {} - {}'.format(path, e))
+                log_errors.inc()
+                self.errors += 1
+            
+            log.pending += _encode(text)
+        
+        elif op == WRITE:
+            log = self.logs.get(path)
+            
+            if log is None:
+                log = LogFile(path)
+                self.logs[path] = log
+                
+                # appending to an existing log - index what is already there
+                if self.index and path.endswith(ACMI_EXT):
+                    log.index = load_index(path)
+            
+            log.pending += _encode(text)
+        
+        elif op == CLOSE:
+            log = self.logs.pop(path, None)
+            
+            if log:
+                self._flush(log)
+                self._close(log)
+                self._save_index(log)
+    
+    def _flush_due(self):
+        now = time.monotonic()
+        
+        for log in list(self.logs.values()):
+            if (len(log.pending) >= self.flush_bytes) or (log.pending and (now - log.last_flush >= self.flush_interval)):
+                self._flush(log)
+    
+    def _flush(self, log):
+        log.last_flush = time.monotonic()
+        
+        if not log.pending:
+            return
+        
+        data  = bytes(log.pending)
+        sent  = 0
+        start = time.perf_counter()
+        
+        try:
+            if log.handle is None:
+                log.handle = open(log.path, 'ab', buffering=0)
+            
+            view = memoryview(data)
+            
+            while sent < len(data):
+                sent += log.handle.write(view[sent:])
+            
+            if self.fsync:
+                os.fsync(log.handle.fileno())
+            
+            log.failed = False
+        
+        except OSError as e:
+            # keep the unwritten text and retry with a fresh handle at the next flush
+            if not log.failed:
+                print('ERROR: Could not write log {} - {}'.format(log.path, e))
+            
+            log_errors.inc()
+            self.errors += 1
+            log.failed   = True
+            self._close(log)
+        
+        write_timer.observe(time.perf_counter() - start)
+        
+        del log.pending[:sent]
+        self.written += sent
+        
+        if sent:
+            with self._cond:
+                if log.path in self._unflushed:
+                    self._unflushed[log.path] = max(self._unflushed[log.path] - sent, 0)
+        
+        if sent and (log.index is not None):
+            log.index.feed(data[:sent])
+    
+    def _close(self, log):
+        if log.handle:
+            try:
+                log.handle.close()
+            except OSError:
+                pass
+            
+            log.handle = None
+    
+    def _save_index(self, log):
+        if log.index is not None:
+            try:
+                log.index.save(index_path(log.path))
+            except OSError as e:
+                print('ERROR: Could not save index of log {} - {}'.format(log.path, e))
+                log_errors.inc()
@@ -0,0 +1,489 @@
+'''
+Low-overhead pipeline metrics - per-stage latency histograms and event
+counters, exposed in the Prometheus text format by a localhost HTTP endpoint
+(see MetricsServer) and summarized for the GUI status bar
+
+Example:
+    from metrics import metrics
+    
+    fetch_timer = metrics.stage('fetch')
+    
+    with fetch_timer.time():
+        telem.get_telemetry()
+'''
+
+import time
+import threading
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from constants import METRICS_PORT
+
+
+PREFIX          = 'thunder_viewer_'
+CONTENT_TYPE    = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5) # seconds
+SUMMARY_STAGES  = ('sample', 'fetch', 'format', 'log', 'mqtt', 'stream', 'usb', 'texture')
+
+
+def format_labels(labels, extra=''):
+    '''
+    Description:
+    ------------
+    Format metric labels in the Prometheus text format
+    
+    :param labels: tuple - (name, value) pairs
+    :param extra:  str   - already formatted label appended to the others
+    
+    :return: str - i.e. '{stage="fetch",le="0.1"}' ('' if there are no labels)
+    '''
+    
+    items = ['{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"')) for name, value in labels]
+    
+    if extra:
+        items.append(extra)
+    
+    return '{{{}}}'.format(','.join(items)) if items else ''
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    '''
+    Description:
+    ------------
+    Monotonic event counter (safe to increment from any thread)
+    '''
+    
+    def __init__(self, labels=()):
+        self.labels = labels
+        self.value  = 0
+        self._lock  = threading.Lock()
+    
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+    
+    def render(self, name):
+        return ['{}{} {}'.format(name, format_labels(self.labels), format_value(self.value))]
+
+
+class Gauge(object):
+    '''
+    Description:
+    ------------
+    Current value of something that goes up and down (i.e. a queue depth).
+    The value is either set or read from a function when rendered
+    '''
+    
+    def __init__(self, labels=()):
+        self.labels   = labels
+        self.value    = 0
+        self.function = None
+    
+    def set(self, value):
+        self.value = value
+    
+    def set_function(self, function):
+        '''
+        Description:
+        ------------
+        Read the value from a function whenever the gauge is rendered
+        
+        :param function: callable - returns the current value (None to go
+                                    back to the set value)
+        '''
+        
+        self.function = function
+    
+    def clear_function(self, function):
+        '''
+        Description:
+        ------------
+        Go back to the set value unless another function was set since
+        
+        :param function: callable - function passed to set_function()
+        '''
+        
+        if self.function is function:
+            self.function = None
+    
+    def render(self, name):
+        value = self.value if self.function is None else self.function()
+        return ['{}{} {}'.format(name, format_labels(self.labels), format_value(value))]
+
+
+class _Timer(object):
+    __slots__ = ('histogram', 'start')
+    
+    def __init__(self, histogram):
+        self.histogram = histogram
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Histogram(object):
+    '''
+    Description:
+    ------------
+    Distribution of values over fixed buckets. Observing is a bisect and a
+    few additions - every histogram is meant to be observed by a single
+    thread (its pipeline stage), while readers only take copies
+    '''
+    
+    def __init__(self, labels=(), buckets=LATENCY_BUCKETS):
+        '''
+        Description:
+        ------------
+        Initialize an empty histogram
+        
+        :param labels:  tuple - (name, value) label pairs
+        :param buckets: tuple - sorted upper bounds of the buckets (a +Inf
+                                bucket is added)
+        '''
+        
+        self.labels  = labels
+        self.buckets = tuple(buckets)
+        self.counts  = [0] * (len(self.buckets) + 1) # non-cumulative, the last is +Inf
+        self.sum     = 0.0
+        self.count   = 0
+    
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum   += value
+        self.count += 1
+    
+    def merge(self, counts, total):
+        '''
+        Description:
+        ------------
+        Add observations made elsewhere (i.e. by a worker process)
+        
+        :param counts: list  - bucket counts to add (non-cumulative, same
+                               buckets)
+        :param total:  float - sum of the added observations
+        '''
+        
+        for i, count in enumerate(counts):
+            self.counts[i] += count
+        
+        self.sum   += total
+        self.count += sum(counts)
+    
+    def time(self):
+        '''
+        Description:
+        ------------
+        Context manager observing the time (s) spent in its block
+        '''
+        
+        return _Timer(self)
+    
+    def snapshot(self):
+        '''
+        Description:
+        ------------
+        Copy of the bucket counts (subtract two snapshots to get the
+        distribution of a time window)
+        '''
+        
+        return list(self.counts)
+    
+    def quantile(self, q, counts=None):
+        '''
+        Description:
+        ------------
+        Estimate a quantile as the upper bound of the bucket it falls in
+        
+        :param q:      float - quantile (0-1)
+        :param counts: list  - bucket counts to use (current counts if None)
+        
+        :return: float - estimated value (None if nothing was observed, inf
+                         if it's above the largest bucket)
+        '''
+        
+        counts = self.counts if counts is None else counts
+        total  = sum(counts)
+        
+        if not total:
+            return None
+        
+        rank       = q * total
+        cumulative = 0
+        
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            
+            if cumulative >= rank:
+                return bound
+        
+        return float('inf')
+    
+    def render(self, name):
+        lines      = []
+        cumulative = 0
+        
+        for bound, count in zip(self.buckets + (float('inf'),), list(self.counts)):
+            cumulative += count
+            le = 'le="{}"'.format(format_value(bound))
+            lines.append('{}_bucket{} {}'.format(name, format_labels(self.labels, le), cumulative))
+        
+        lines.append('{}_sum{} {}'.format(name, format_labels(self.labels), format_value(self.sum)))
+        lines.append('{}_count{} {}'.format(name, format_labels(self.labels), cumulative))
+        
+        return lines
+
+
+class MetricsRegistry(object):
+    '''
+    Description:
+    ------------
+    Process-wide collection of metric families. Metrics are created once
+    (usually at import) and kept by the code that updates them, so updating
+    a metric never touches the registry
+    '''
+    
+    def __init__(self):
+        self.families = {} # name -> [type, help, {labels: metric}]
+        self._lock    = threading.Lock()
+        self._last    = {} # stage -> bucket counts at the last summary()
+    
+    def _get(self, kind, name, doc, factory, labels):
+        labels = tuple(sorted(labels.items()))
+        
+        with self._lock:
+            family = self.families.setdefault(PREFIX + name, [kind, doc, {}])
+            
+            if labels not in family[2]:
+                family[2][labels] = factory(labels)
+            
+            return family[2][labels]
+    
+    def counter(self, name, doc, **labels):
+        '''
+        Description:
+        ------------
+        Get (or create) a counter
+        
+        :param name:   str - metric name without PREFIX (i.e. 'errors_total')
+        :param doc:    str - help text
+        :param labels: str - label values
+        
+        :return: Counter - counter
+        '''
+        
+        return self._get('counter', name, doc, Counter, labels)
+    
+    def gauge(self, name, doc, **labels):
+        '''
+        Description:
+        ------------
+        Get (or create) a gauge
+        
+        :param name:   str - metric name without PREFIX
+        :param doc:    str - help text
+        :param labels: str - label values
+        
+        :return: Gauge - gauge
+        '''
+        
+        return self._get('gauge', name, doc, Gauge, labels)
+    
+    def histogram(self, name, doc, buckets=LATENCY_BUCKETS, **labels):
+        '''
+        Description:
+        ------------
+        Get (or create) a histogram
+        
+        :param name:    str   - metric name without PREFIX
+        :param doc:     str   - help text
+        :param buckets: tuple - bucket upper bounds
+        :param labels:  str   - label values
+        
+        :return: Histogram - histogram
+        '''
+        
+        return self._get('histogram', name, doc, lambda labels: Histogram(labels, buckets), labels)
+    
+    def stage(self, stage):
+        '''
+        Description:
+        ------------
+        Latency histogram (s) of a pipeline stage
+        '''
+        
+        return self.histogram('stage_seconds', 'Time spent in each recording pipeline stage', stage=stage)
+    
+    def errors(self, source):
+        '''
+        Description:
+        ------------
+        Error counter of a component
+        '''
+        
+        return self.counter('errors_total', 'Errors reported by each component', source=source)
+    
+    def render(self):
+        '''
+        Description:
+        ------------
+        Every metric in the Prometheus text exposition format
+        
+        :return: str - metrics text
+        '''
+        
+        lines = []
+        
+        with self._lock:
+            families = [(name, kind, doc, list(metrics.values())) for name, (kind, doc, metrics) in sorted(self.families.items())]
+        
+        for name, kind, doc, family in families:
+            lines.append('# HELP {} {}'.format(name, doc))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            
+            for metric in family:
+                lines.extend(metric.render(name))
+        
+        return '\n'.join(lines) + '\n'
+    
+    def summary(self, stages=SUMMARY_STAGES, q=0.9):
+        '''
+        Description:
+        ------------
+        One-line summary of the stage latencies observed since the last call
+        (i.e. 'p90 ms: fetch 25 | format 0.25 | log 0.1')
+        
+        :param stages: tuple - stages to include (stages without new
+                               observations are left out)
+        :param q:      float - quantile to report
+        
+        :return: str - summary ('' if nothing was observed)
+        '''
+        
+        parts = []
+        
+        for stage in stages:
+            histogram = self.stage(stage)
+            counts    = histogram.snapshot()
+            last      = self._last.get(stage, [0] * len(counts))
+            window    = [now - before for now, before in zip(counts, last)]
+            value     = histogram.quantile(q, window)
+            
+            self._last[stage] = counts
+            
+            if value is not None:
+                parts.append('{} {}'.format(stage, '>{:g}'.format(histogram.buckets[-1] * 1000) if value == float('inf') else '{:g}'.format(value * 1000)))
+        
+        if not parts:
+            return ''
+        
+        return 'p{:g} ms: {}'.format(q * 100, ' | '.join(parts))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    '''
+    Description:
+    ------------
+    Serves the registry at /metrics
+    '''
+    
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        
+        body = self.server.registry.render().encode('utf8')
+        
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(object):
+    '''
+    Description:
+    ------------
+    Localhost HTTP endpoint Prometheus (or a browser) can scrape at
+    http://localhost:<port>/metrics
+    '''
+    
+    def __init__(self, port=METRICS_PORT, host='127.0.0.1', registry=None):
+        '''
+        Description:
+        ------------
+        Initialize the server (the port is not bound until serve_forever()
+        is called)
+        
+        :param port:     int             - TCP port to listen on
+        :param host:     str             - interface to listen on
+        :param registry: MetricsRegistry - metrics to serve (process-wide
+                                           metrics if None)
+        '''
+        
+        self.port     = port
+        self.host     = host
+        self.registry = registry or metrics
+        self._server  = None
+        self._stopped = False
+        self._lock    = threading.Lock() # orders binding the port against shutdown()
+    
+    def serve_forever(self):
+        '''
+        Description:
+        ------------
+        Serve requests until shutdown() is called (returns at once if it
+        already was)
+        '''
+        
+        with self._lock:
+            if self._stopped:
+                return
+            
+            try:
+                server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+            except OSError as e:
+                print('ERROR: Could not serve metrics on port {} - {}'.format(self.port, e))
+                return
+            
+            server.daemon_threads = True
+            server.registry       = self.registry
+            self._server          = server
+        
+        # a shutdown() requested from here on is picked up as soon as the
+        # loop starts
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+    
+    def shutdown(self):
+        '''
+        Description:
+        ------------
+        Stop serve_forever() - safe to call from any thread, before or after
+        serve_forever() was started
+        '''
+        
+        with self._lock:
+            self._stopped = True
+            server        = self._server
+        
+        if server:
+            server.shutdown()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,260 @@
+import json
+import math
+import time
+import zlib
+import struct
+from random import getrandbits
+from collections import namedtuple
+from acmi_format import EntryRecord
+from constants import ACMI_KEYFRAME_PERIOD
+
+
+MAGIC         = b'TV'
+CODEC_VERSION = 1
+
+HELLO      = 0    # session handshake - player identity, reference time and metadata
+SAMPLE     = 1    # changed EntryRecord fields of a single sample
+COMPRESSED = 0x80 # message type flag - body is zlib compressed
+
+PREFIX      = struct.Struct('<2sBB')  # magic, codec version, message type
+HELLO_HEAD  = struct.Struct('<I')     # sender ID
+SAMPLE_HEAD = struct.Struct('<IIII')  # sender ID, timestamp (centiseconds), field mask, int mask
+STR_LEN     = struct.Struct('<H')
+
+# struct code of every EntryRecord field - only the position needs double
+# precision, everything else is reported by War Thunder with < 7 significant
+# digits
+FIELD_CODES = ('d', 'd', 'd') + ('f',) * (len(EntryRecord._fields) - 3)
+ALL_FIELDS  = (1 << len(FIELD_CODES)) - 1
+
+Hello  = namedtuple('Hello',  ['sender', 'player', 'ref_time', 'obj_id', 'meta'])
+Sample = namedtuple('Sample', ['sender', 'tstamp', 'fields'])
+
+
+def _pack_str(text):
+    data = text.encode('utf8')
+    return STR_LEN.pack(len(data)) + data
+
+def _unpack_str(body, offset):
+    length, = STR_LEN.unpack_from(body, offset)
+    offset += STR_LEN.size
+    return body[offset:offset + length].decode('utf8'), offset + length
+
+def _field_struct(cache, mask):
+    field_struct = cache.get(mask)
+    
+    if field_struct is None:
+        codes = ''.join(code for i, code in enumerate(FIELD_CODES) if mask & (1 << i))
+        field_struct = struct.Struct('<' + codes)
+        cache[mask] = field_struct
+    
+    return field_struct
+
+def _wrap(msg_type, body, compress):
+    if compress:
+        body = zlib.compress(body)
+        msg_type |= COMPRESSED
+    
+    return PREFIX.pack(MAGIC, CODEC_VERSION, msg_type) + body
+
+
+class SampleEncoder(object):
+    '''
+    Description:
+    ------------
+    Convert telemetry samples into compact binary MQTT payloads.
+    
+    The player identity, reference time and object metadata are only sent in
+    a HELLO message. Sample messages carry a bit mask of the EntryRecord
+    fields that changed since the previous message followed by the packed
+    values of just those fields. A HELLO and a complete sample are sent with
+    the first sample and then every keyframe_period seconds so that players
+    joining late can reconstruct the object
+    '''
+    
+    def __init__(self, player, keyframe_period=ACMI_KEYFRAME_PERIOD, compress=False):
+        '''
+        Description:
+        ------------
+        Initialize the encoder
+        
+        :param player:          str   - local player name
+        :param keyframe_period: float - seconds between HELLO/complete samples
+        :param compress:        bool  - zlib compress message bodies
+        '''
+        
+        self.player          = player
+        self.keyframe_period = keyframe_period
+        self.compress        = compress
+        self.sender          = getrandbits(32) # identifies this session's samples
+        
+        self._hello    = None
+        self._last     = None
+        self._keyframe = 0
+        self._structs  = {}
+    
+    def start(self, ref_time, obj_id, meta):
+        '''
+        Description:
+        ------------
+        Start a new session (i.e. when a new ACMI log is started) - the next
+        sample is sent in full after a new HELLO message
+        
+        :param ref_time: datetime - UTC reference time of the sample timestamps
+        :param obj_id:   str      - ACMI object hex ID of the player
+        :param meta:     str      - object metadata properties (see
+                                    acmi_format.format_meta())
+        '''
+        
+        body = HELLO_HEAD.pack(self.sender)
+        body += _pack_str(self.player)
+        body += _pack_str(ref_time.isoformat())
+        body += _pack_str(obj_id)
+        body += _pack_str(meta)
+        
+        self._hello = _wrap(HELLO, body, self.compress)
+        self._last  = None
+    
+    def encode(self, tstamp, rec):
+        '''
+        Description:
+        ------------
+        Encode a single sample
+        
+        :param tstamp: float       - seconds since the reference time
+        :param rec:    EntryRecord - raw entry values
+        
+        :return payloads: list - MQTT payloads to publish in order (empty if
+                                 no field changed)
+        '''
+        
+        now      = time.monotonic()
+        last     = self._last
+        payloads = []
+        
+        if self._hello is None:
+            return payloads
+        
+        if (last is None) or (now - self._keyframe >= self.keyframe_period):
+            self._keyframe = now
+            mask = ALL_FIELDS
+            payloads.append(self._hello)
+        else:
+            mask = 0
+            
+            for i in range(len(rec)):
+                if rec[i] != last[i]:
+                    mask |= 1 << i
+            
+            if not mask:
+                return payloads
+        
+        self._last = rec
+        
+        int_mask = 0
+        values   = []
+        
+        for i in range(len(rec)):
+            if mask & (1 << i):
+                value = rec[i]
+                
+                if value is None:
+                    value = math.nan
+                elif isinstance(value, int):
+                    int_mask |= 1 << i
+                
+                values.append(value)
+        
+        body = SAMPLE_HEAD.pack(self.sender, int(round(tstamp * 100)), mask, int_mask)
+        body += _field_struct(self._structs, mask).pack(*values)
+        
+        payloads.append(_wrap(SAMPLE, body, self.compress))
+        
+        return payloads
+
+
+class SampleDecoder(object):
+    '''
+    Description:
+    ------------
+    Convert MQTT payloads (binary or JSON) back into messages
+    '''
+    
+    def __init__(self):
+        '''
+        Description:
+        ------------
+        Initialize the decoder
+        '''
+        
+        self._structs = {}
+    
+    def decode(self, payload):
+        '''
+        Description:
+        ------------
+        Decode a single MQTT payload
+        
+        :param payload: bytes - MQTT payload
+        
+        :return: Hello/Sample/dict - decoded message (dict for JSON payloads
+                                     sent by older versions, None if the
+                                     payload isn't recognized)
+        '''
+        
+        if payload[:1] == b'{':
+            return json.loads(payload)
+        
+        if (len(payload) < PREFIX.size) or (payload[:len(MAGIC)] != MAGIC):
+            return None
+        
+        magic, version, msg_type = PREFIX.unpack_from(payload)
+        
+        if version != CODEC_VERSION:
+            return None
+        
+        body = payload[PREFIX.size:]
+        
+        if msg_type & COMPRESSED:
+            body = zlib.decompress(body)
+            msg_type &= ~COMPRESSED
+        
+        if msg_type == SAMPLE:
+            sender, tstamp, mask, int_mask = SAMPLE_HEAD.unpack_from(body)
+            
+            if mask & ~ALL_FIELDS:
+                return None
+            
+            values = _field_struct(self._structs, mask).unpack_from(body, SAMPLE_HEAD.size)
+            fields = {}
+            
+            i = 0
+            
+            for value in values:
+                while not mask & (1 << i):
+                    i += 1
+                
+                if value != value: # NaN
+                    value = None
+                elif int_mask & (1 << i):
+                    value = int(value)
+                elif FIELD_CODES[i] == 'f':
+                    value = float('{:.7g}'.format(value)) # drop float32 rounding noise
+                
+                fields[i] = value
+                i += 1
+            
+            return Sample(sender, tstamp / 100, fields)
+        
+        if msg_type == HELLO:
+            sender, = HELLO_HEAD.unpack_from(body)
+            offset  = HELLO_HEAD.size
+            
+            player,   offset = _unpack_str(body, offset)
+            ref_time, offset = _unpack_str(body, offset)
+            obj_id,   offset = _unpack_str(body, offset)
+            meta,     offset = _unpack_str(body, offset)
+            
+            return Hello(sender, player, ref_time, obj_id, meta)
+        
+        return None
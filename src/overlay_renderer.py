@@ -0,0 +1,263 @@
+from PyQt5.QtGui import QColor
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QTimer, Qt
+from PyQt5.QtWidgets import QApplication, QTableWidgetItem
+from constants import OVERLAY_MAX_FPS
+
+
+FONT_COLOR = QColor(255, 255, 255)
+NAME_COL   = 0
+VALUE_COL  = 1
+
+
+def display_name(field):
+    '''
+    Description:
+    ------------
+    Convert a War Thunder telemetry key to the name shown in the overlay
+    
+    :param field: str - telemetry key (i.e. "IAS, km/h")
+    
+    :return: str - display name (i.e. "IAS")
+    '''
+    
+    return field.replace('_', ' ').upper().split(',')[0]
+
+
+class OverlayModel(QAbstractTableModel):
+    '''
+    Description:
+    ------------
+    Table model of the selected overlay fields - one row per field with the
+    field's display name and latest value
+    '''
+    
+    def __init__(self, parent=None):
+        super(OverlayModel, self).__init__(parent)
+        
+        self.rows = [] # [telemetry key, display name, value text] of every row
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        
+        if role == Qt.DisplayRole:
+            row = self.rows[index.row()]
+            
+            if index.column() == NAME_COL:
+                return row[1] + '   '
+            
+            return row[2]
+        
+        if role == Qt.ForegroundRole:
+            return FONT_COLOR
+        
+        return None
+    
+    def set_fields(self, fields, names, telem):
+        '''
+        Description:
+        ------------
+        Replace all rows
+        
+        :param fields: list - telemetry keys to show (in order)
+        :param names:  dict - telemetry key -> display name
+        :param telem:  dict - full War Thunder vehicle telemetry data
+        '''
+        
+        self.beginResetModel()
+        self.rows = [[key, names[key], str(telem.get(key, '')).upper()] for key in fields]
+        self.endResetModel()
+    
+    def refresh(self, telem):
+        '''
+        Description:
+        ------------
+        Update the value of every row and emit dataChanged for the cells that
+        changed
+        
+        :param telem: dict - full War Thunder vehicle telemetry data
+        
+        :return resize: bool - whether or not the length of any value changed
+        '''
+        
+        resize = False
+        
+        for i, row in enumerate(self.rows):
+            text = str(telem.get(row[0], '')).upper()
+            
+            if text != row[2]:
+                resize = resize or (len(text) != len(row[2]))
+                row[2] = text
+                
+                index = self.index(i, VALUE_COL)
+                self.dataChanged.emit(index, index, [Qt.DisplayRole])
+        
+        return resize
+
+
+class OverlayRenderer(object):
+    '''
+    Description:
+    ------------
+    Drives the telemetry overlay from a TelemetrySnapshot. A timer pulls the
+    latest sample at (at most) the display refresh rate - samples published
+    in between are never seen, so GUI work doesn't depend on the sample rate.
+    
+    Rows of the overlay model are only rebuilt when the set of fields or the
+    selection changes, otherwise only cells whose text changed are updated
+    '''
+    
+    def __init__(self, window, ui, snapshot, max_fps=OVERLAY_MAX_FPS):
+        '''
+        Description:
+        ------------
+        Initialize the renderer
+        
+        :param window:   QMainWindow       - overlay window
+        :param ui:       Ui_Overlay        - overlay widgets
+        :param snapshot: TelemetrySnapshot - latest telemetry sample
+        :param max_fps:  float             - max number of redraws per second
+        '''
+        
+        self.window   = window
+        self.ui       = ui
+        self.snapshot = snapshot
+        self.model    = OverlayModel(window)
+        self.names    = {} # telemetry key -> display name
+        self.keys     = [] # telemetry keys listed in field_select_table (in order)
+        self.rows     = {} # display name -> field_select_table item
+        self.generation   = 0    # generation of the sample shown
+        self.layout_dirty = True # True if the model rows need to be rebuilt
+        
+        self.ui.telem_table.setModel(self.model)
+        self.ui.field_select_table.itemChanged.connect(self.selection_changed)
+        
+        screen = QApplication.primaryScreen()
+        fps    = min(max_fps, screen.refreshRate()) if screen else max_fps
+        
+        self.timer = QTimer(window)
+        self.timer.setInterval(int(1000 / fps))
+        self.timer.timeout.connect(self.render)
+        self.timer.start()
+    
+    def name(self, field):
+        '''
+        Description:
+        ------------
+        Cached display name of a telemetry key
+        
+        :param field: str - telemetry key
+        
+        :return: str - display name
+        '''
+        
+        try:
+            return self.names[field]
+        except KeyError:
+            self.names[field] = display_name(field)
+            return self.names[field]
+    
+    def selection_changed(self, item):
+        self.layout_dirty = True
+        self.generation   = 0 # redraw even if no new sample arrives
+    
+    def render(self):
+        '''
+        Description:
+        ------------
+        Redraw the overlay if a new sample was published since the last redraw
+        '''
+        
+        generation, telem = self.snapshot.get()
+        
+        if (generation == self.generation) or (telem is None) or not self.window.isVisible():
+            return
+        
+        self.generation = generation
+        
+        if len(telem) != len(self.keys) or any(key not in telem for key in self.keys):
+            self.update_fields(telem)
+        
+        if self.layout_dirty:
+            self.build_rows(telem)
+        
+        elif self.model.refresh(telem):
+            self.ui.telem_table.resizeColumnsToContents()
+    
+    def update_fields(self, telem):
+        '''
+        Description:
+        ------------
+        Sync field_select_table with the keys of the latest sample
+        
+        :param telem: dict - full War Thunder vehicle telemetry data
+        '''
+        
+        table = self.ui.field_select_table
+        table.blockSignals(True)
+        
+        # remove any fields that are no longer valid
+        removed   = [key for key in self.keys if key not in telem]
+        self.keys = [key for key in self.keys if key in telem]
+        known     = set(self.keys)
+        names     = set(self.name(key) for key in self.keys)
+        
+        for key in removed:
+            if self.name(key) not in names:
+                item = self.rows.pop(self.name(key), None)
+                
+                if item is not None:
+                    table.removeRow(item.row())
+        
+        # add new fields
+        for key in telem:
+            if key not in known:
+                self.keys.append(key)
+                name = self.name(key)
+                
+                if name in self.rows:
+                    continue
+                
+                new_row_num = table.rowCount()
+                table.insertRow(new_row_num)
+                
+                chkBoxItem = QTableWidgetItem()
+                chkBoxItem.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
+                chkBoxItem.setCheckState(Qt.Unchecked)
+                chkBoxItem.setTextAlignment(Qt.AlignLeft | Qt.AlignVCenter)
+                chkBoxItem.setText(name)
+                
+                table.setItem(new_row_num, 0, chkBoxItem)
+                self.rows[name] = chkBoxItem
+        
+        table.blockSignals(False)
+        
+        self.layout_dirty = True
+    
+    def build_rows(self, telem):
+        '''
+        Description:
+        ------------
+        Rebuild the overlay model with one row per selected field
+        
+        :param telem: dict - full War Thunder vehicle telemetry data
+        '''
+        
+        self.layout_dirty = False
+        
+        selected = set(name for name, item in self.rows.items() if item.checkState())
+        fields   = [key for key in self.keys if self.name(key) in selected]
+        
+        self.model.set_fields(fields, self.names, telem)
+        
+        # resize table to contents
+        table = self.ui.telem_table
+        table.resizeColumnsToContents()
+        table.resizeRowsToContents()
+        table.resize(10000, 10000)
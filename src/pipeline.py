@@ -0,0 +1,317 @@
+import time
+import threading
+from collections import deque, namedtuple
+from metrics import metrics
+from constants import SINK_QUEUE_LEN
+
+
+DROP_OLDEST = 0 # discard the oldest queued sample to make room (latest data matters most)
+DROP_NEWEST = 1 # discard the new sample (keep what's already queued)
+BLOCK       = 2 # wait for room - lossless, but a stalled sink stalls the sample clock
+
+
+# a single telemetry sample as published by the recorder - every sink gets the
+# same instance, so neither the sample nor the telemetry dictionaries in it
+# may be modified (War Thunder telemetry dictionaries are rebuilt for every
+# sample). tstamp, meta, record and log_line are None until the ACMI log
+# header was written. record and log_line are also None if the vehicle
+# values were reused from an earlier sample (see stale) - they are never
+# logged again under a new timestamp
+TelemetrySample = namedtuple('TelemetrySample', ['tstamp',    # seconds since the log's reference time
+                                                 'path',      # ACMI log the sample belongs to
+                                                 'ref_time',  # UTC reference time of the ACMI log
+                                                 'obj_id',    # ACMI object hex ID of the player
+                                                 'meta',      # player object metadata properties
+                                                 'record',    # raw entry values (EntryRecord)
+                                                 'log_line',  # ACMI entry ('' if no property changed)
+                                                 'telemetry', # full War Thunder vehicle telemetry data
+                                                 'basic',     # basic War Thunder vehicle telemetry data
+                                                 'grid_info', # map location metadata
+                                                 'stale'])    # endpoints whose data was reused from an earlier sample (frozenset)
+
+VALUE_ENDPOINTS = frozenset(('indicators', 'state')) # War Thunder endpoints the vehicle values come from
+
+
+class Sink(object):
+    '''
+    Description:
+    ------------
+    A single pipeline output - a bounded queue of samples and the worker
+    that delivers them, so a slow output only ever delays itself
+    '''
+    
+    def __init__(self, name, deliver, maxsize=SINK_QUEUE_LEN, policy=DROP_OLDEST):
+        '''
+        Description:
+        ------------
+        Initialize the sink (samples are delivered once run() is started)
+        
+        :param name:    str      - sink name (used in metrics)
+        :param deliver: callable - called from the sink's worker with every
+                                   TelemetrySample, in order
+        :param maxsize: int      - max number of queued samples (0 delivers
+                                   every sample from the publishing thread
+                                   without a queue or worker - only for
+                                   outputs that hand samples off without
+                                   blocking)
+        :param policy:  int      - what to do when the queue is full
+                                   (DROP_OLDEST, DROP_NEWEST or BLOCK)
+        '''
+        
+        self.name      = name
+        self.deliver   = deliver
+        self.maxsize   = maxsize
+        self.policy    = policy
+        self.queue     = deque()
+        self.delivered = 0
+        self.dropped   = 0
+        self.failed    = 0
+        
+        self._cond    = threading.Condition()
+        self._running = True
+        self._busy    = False # True while a sample is being delivered
+        
+        self._timer   = metrics.histogram('sink_seconds', 'Time each pipeline sink spends delivering a sample', sink=name)
+        self._drops   = metrics.counter('sink_dropped_total', 'Samples dropped by each pipeline sink', sink=name)
+        self._errors  = metrics.errors(name)
+    
+    def put(self, sample):
+        '''
+        Description:
+        ------------
+        Queue a sample, applying the overflow policy if the queue is full
+        
+        :param sample: TelemetrySample - sample to deliver
+        '''
+        
+        if not self.maxsize:
+            self._deliver(sample)
+            return
+        
+        with self._cond:
+            if len(self.queue) >= self.maxsize:
+                if self.policy == BLOCK:
+                    while self._running and len(self.queue) >= self.maxsize:
+                        self._cond.wait()
+                    
+                    if not self._running:
+                        return
+                
+                else:
+                    self.dropped += 1
+                    self._drops.inc()
+                    
+                    if self.policy == DROP_NEWEST:
+                        return
+                    
+                    self.queue.popleft()
+            
+            self.queue.append(sample)
+            self._cond.notify_all()
+    
+    def drain(self, timeout=None):
+        '''
+        Description:
+        ------------
+        Wait until every queued sample was delivered
+        
+        :param timeout: float - max time (s) to wait (forever if None)
+        
+        :return: bool - whether or not the sink is idle
+        '''
+        
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        with self._cond:
+            while self._running and (self.queue or self._busy):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                
+                if remaining is not None and remaining <= 0:
+                    return False
+                
+                self._cond.wait(remaining)
+            
+            return not (self.queue or self._busy)
+    
+    def stop(self):
+        '''
+        Description:
+        ------------
+        Ask the worker to deliver the queued samples and exit
+        '''
+        
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+    
+    def run(self):
+        '''
+        Description:
+        ------------
+        Worker delivering queued samples until stop() is called and the queue
+        is empty
+        '''
+        
+        while True:
+            with self._cond:
+                while self._running and not self.queue:
+                    self._cond.wait()
+                
+                if not self.queue:
+                    self._cond.notify_all()
+                    return
+                
+                sample     = self.queue.popleft()
+                self._busy = True
+                self._cond.notify_all()
+            
+            self._deliver(sample)
+            
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+    
+    def _deliver(self, sample):
+        try:
+            with self._timer.time():
+                self.deliver(sample)
+            
+            self.delivered += 1
+        
+        except Exception as e:
+            # a broken output must not take the worker (or the other sinks) down
+            self.failed += 1
+            self._errors.inc()
+            print('ERROR: Sink {} could not deliver a sample - {}'.format(self.name, e))
+
+
+class Pipeline(object):
+    '''
+    Description:
+    ------------
+    Publish/subscribe fan-out of telemetry samples. The sampling thread
+    publishes every sample once and each registered sink delivers it from
+    its own worker thread, so the sample clock never waits for an output
+    (unless that output's overflow policy is BLOCK)
+    '''
+    
+    def __init__(self):
+        self.sinks    = {} # name -> Sink
+        self.threads  = {} # name -> worker thread
+        self._running = False
+        self._lock    = threading.Lock()
+        self._fanout  = () # sinks samples are published to, replaced as a whole
+    
+    def add_sink(self, name, deliver, maxsize=SINK_QUEUE_LEN, policy=DROP_OLDEST):
+        '''
+        Description:
+        ------------
+        Register an output (replacing any sink with the same name). Sinks
+        can be added before or while the pipeline is running
+        
+        :param name:    str      - sink name
+        :param deliver: callable - called with every TelemetrySample
+        :param maxsize: int      - max number of queued samples (0 to deliver
+                                   from the publishing thread)
+        :param policy:  int      - DROP_OLDEST, DROP_NEWEST or BLOCK
+        
+        :return: Sink - registered sink
+        '''
+        
+        self.remove_sink(name)
+        
+        sink = Sink(name, deliver, maxsize, policy)
+        
+        with self._lock:
+            self.sinks[name] = sink
+            self._fanout     = tuple(self.sinks.values())
+            
+            if self._running:
+                self._start(sink)
+        
+        return sink
+    
+    def remove_sink(self, name):
+        '''
+        Description:
+        ------------
+        Unregister an output after its queued samples were delivered
+        
+        :param name: str - sink name
+        '''
+        
+        with self._lock:
+            sink   = self.sinks.pop(name, None)
+            thread = self.threads.pop(name, None)
+            self._fanout = tuple(self.sinks.values())
+        
+        if sink:
+            sink.stop()
+        
+        if thread:
+            thread.join()
+    
+    def publish(self, sample):
+        '''
+        Description:
+        ------------
+        Hand a sample to every sink
+        
+        :param sample: TelemetrySample - sample to publish
+        '''
+        
+        for sink in self._fanout:
+            sink.put(sample)
+    
+    def drain(self, names=None, timeout=None):
+        '''
+        Description:
+        ------------
+        Wait until the given sinks delivered every queued sample (i.e.
+        before the file they write to is closed)
+        
+        :param names:   iterable - sink names (all sinks if None)
+        :param timeout: float    - max time (s) to wait for each sink
+        '''
+        
+        for name, sink in list(self.sinks.items()):
+            if names is None or name in names:
+                sink.drain(timeout)
+    
+    def start(self):
+        '''
+        Description:
+        ------------
+        Start the workers of all registered sinks
+        '''
+        
+        with self._lock:
+            self._running = True
+            
+            for sink in self.sinks.values():
+                self._start(sink)
+    
+    def stop(self):
+        '''
+        Description:
+        ------------
+        Deliver the queued samples and stop all workers
+        '''
+        
+        with self._lock:
+            self._running = False
+            threads = list(self.threads.values())
+            self.threads.clear()
+            
+            for sink in self.sinks.values():
+                sink.stop()
+        
+        for thread in threads:
+            thread.join()
+    
+    def _start(self, sink):
+        if sink.maxsize and (sink.name not in self.threads):
+            thread = threading.Thread(target=sink.run, name='sink-{}'.format(sink.name), daemon=True)
+            thread.start()
+            
+            self.threads[sink.name] = thread
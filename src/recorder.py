@@ -0,0 +1,715 @@
+import os
+import json
+import time
+import threading
+import datetime as dt
+from WarThunder import general
+from constants import USERNAME, BROKER_HOST
+from constants import LOGS_DIR, REMOTE_DIR, TITLE_FORMAT
+from constants import ACMI_HEADER, FETCH_BUDGET, MQTT_CODEC, MQTT_COMPRESS, USB_RATE
+from constants import METRICS_SUMMARY_PERIOD, SINK_QUEUE_LEN, SINK_PROCESSES, TELEM_SHM
+from constants import BROADCAST_TARGET
+from scheduler import DeadlineScheduler
+from log_writer import LogWriter
+from column_recorder import ColumnRecorder, COLUMN_EXT
+from shared_reference import shared_ref
+from texture_cache import texture_cache
+from mqtt_codec import SampleEncoder
+from metrics import metrics
+from usb_layout import UsbLayout
+from usb_writer import UsbWriter
+from telem_fetch import PooledTelemInterface, FETCH_ERRORS
+from game_state import GameStateMachine, GAME_DOWN, IN_MATCH, STATUS
+from pipeline import Pipeline, TelemetrySample, VALUE_ENDPOINTS, DROP_OLDEST, BLOCK
+from sink_process import SinkProcess, ProcessLogWriter, SESSION, SAMPLE, TEXT
+from sink_process import STREAM_WORKER, MQTT_WORKER
+from telem_shm import TelemetryPublisher
+from broadcast import BroadcastSender
+from acmi_format import EntryFormatter, extract_record, format_record, format_meta
+from acmi_format import gen_id, format_header, format_user_header
+
+
+sample_timer    = metrics.stage('sample')
+fetch_timer     = metrics.stage('fetch')
+format_timer    = metrics.stage('format')
+mqtt_timer      = metrics.stage('mqtt')
+mqtt_errors     = metrics.errors('mqtt')
+missed_counter  = metrics.counter('missed_deadlines_total', 'Sample deadlines that could not be met')
+samples_counter = metrics.counter('samples_total', 'Telemetry samples taken')
+
+
+def format_header_dict(grid_info, loc_time):
+    '''
+    Description:
+    ------------
+    Create a dictionary of formatted telemetry samples to be logged in the
+    ACMI log
+    
+    :param grid_info: dict     - map location metadata
+    :param loc_time:  datetime - local date/time at the time of ACMI log creation
+    
+    :return formatted_header: dict - all additional fields and values desired
+                                     in the ACMI log header
+    '''
+    
+    formatted_header = dict(ACMI_HEADER)
+    
+    formatted_header['DataSource']         = 'War Thunder v{}'.format(general.get_version())
+    formatted_header['DataRecorder']       = 'Thunder Viewer'
+    formatted_header['Author']             = USERNAME
+    formatted_header['Title']              = grid_info['name']
+    formatted_header['Comments']           = 'Local: {}'.format(loc_time.strftime('%Y-%m-%d %H:%M:%S'))
+    formatted_header['ReferenceLatitude']  = grid_info['ULHC_lat']
+    formatted_header['ReferenceLongitude'] = grid_info['ULHC_lon']
+    
+    return formatted_header
+
+
+class RecordConfig(object):
+    '''
+    Description:
+    ------------
+    Settings used to record and stream personal match data
+    '''
+    
+    def __init__(self, log_dir=LOGS_DIR, sample_rate=6, team_flag=True,
+                 stream_enable=False, mqtt_enable=False, mqtt_id='',
+                 broker_host=BROKER_HOST, usb_enable=False, usb_fields=None,
+                 mqtt_codec=MQTT_CODEC, mqtt_compress=MQTT_COMPRESS,
+                 usb_port='', usb_baud=115200, usb_rate=USB_RATE,
+                 column_enable=False, sink_processes=SINK_PROCESSES,
+                 stream_port=None, telem_shm=TELEM_SHM,
+                 broadcast_target=BROADCAST_TARGET):
+        '''
+        Description:
+        ------------
+        Initialize the settings
+        
+        :param log_dir:       str  - directory ACMI logs are saved in
+        :param sample_rate:   int  - number of samples per second
+        :param team_flag:     bool - True for the blue team, False for the red team
+        :param stream_enable: bool - stream samples to Tacview
+        :param mqtt_enable:   bool - share samples with the remote session
+        :param mqtt_id:       str  - remote session ID (MQTT topic)
+        :param broker_host:   str  - MQTT broker host name
+        :param usb_enable:    bool - send samples to a USB device
+        :param usb_fields:    list - names of the fields sent to the USB device
+        :param mqtt_codec:    str  - MQTT payload format ('binary' or 'json')
+        :param mqtt_compress: bool - zlib compress binary MQTT payloads
+        :param usb_port:      str  - serial port of the USB device
+        :param usb_baud:      int  - serial baud rate of the USB device
+        :param usb_rate:      int  - packets sent to the USB device per second
+        :param column_enable: bool - also record raw telemetry samples to a
+                                     column file (see column_recorder.py)
+        :param sink_processes: bool - write ACMI logs, stream to Tacview and
+                                      publish to MQTT from worker processes
+                                      (see sink_process.py)
+        :param stream_port:   int  - Tacview stream port (only used by the
+                                     stream worker process - otherwise
+                                     samples are streamed through on_stream)
+        :param telem_shm:     bool - publish the latest sample to shared
+                                     memory for local tools (see telem_shm.py)
+        :param broadcast_target: str - binary telemetry broadcast target, i.e.
+                                       'udp://239.255.42.99:8114' ('' disables
+                                       it - see broadcast.py)
+        '''
+        
+        self.log_dir       = log_dir
+        self.sample_rate   = sample_rate
+        self.team_flag     = team_flag
+        self.stream_enable = stream_enable
+        self.mqtt_enable   = mqtt_enable
+        self.mqtt_id       = mqtt_id
+        self.broker_host   = broker_host
+        self.usb_enable    = usb_enable
+        self.usb_fields    = usb_fields or []
+        self.mqtt_codec    = mqtt_codec
+        self.mqtt_compress = mqtt_compress
+        self.usb_port      = usb_port
+        self.usb_baud      = usb_baud
+        self.usb_rate      = usb_rate
+        self.column_enable = column_enable
+        self.sink_processes = sink_processes
+        self.stream_port    = stream_port
+        self.telem_shm      = telem_shm
+        self.broadcast_target = broadcast_target
+
+
+class Recorder(object):
+    '''
+    Description:
+    ------------
+    Record and stream personal match data. This class does not depend on Qt -
+    every output that isn't handled here (Tacview stream, GUI overlay, status
+    messages) is reported through the given callback functions.
+    
+    The sampling loop only fetches and formats samples - every output is a
+    pipeline sink with its own queue and worker (see pipeline.py), and more
+    outputs can be plugged in with add_sink()
+    '''
+    
+    def __init__(self, config, on_stream=None, on_overlay=None, on_status=None):
+        '''
+        Description:
+        ------------
+        Initialize the recorder
+        
+        :param config:     RecordConfig   - recording settings
+        :param on_stream:  callable(str)  - called with every ACMI line to be
+                                            streamed to Tacview
+        :param on_overlay: callable(dict) - called with every telemetry sample
+        :param on_status:  callable(str)  - called with status messages
+        '''
+        
+        self.sample_period = 1.0 / config.sample_rate
+        self.on_stream     = on_stream
+        self.on_overlay    = on_overlay
+        self.on_status     = on_status
+        
+        # class used to query War Thunder telemetry
+        self.telem     = PooledTelemInterface(budget=min(FETCH_BUDGET, self.sample_period))
+        self.writer    = None        # class used to write ACMI logs off the sampling thread
+        self.processes = []          # outputs run in worker processes (other than the log writer)
+        self.title     = None        # path of the ACMI log currently being written
+        self.ref_time  = None        # UTC reference time of the current ACMI log
+        self.obj_id    = None        # ACMI object hex ID of the player
+        self.formatter = None        # class used to build ACMI entries
+        self.columns   = None        # class used to record raw telemetry columns (None if disabled)
+        self.column_enable = config.column_enable
+        self.log_dir   = config.log_dir
+        self.mqtt_enable   = config.mqtt_enable
+        self.stream_enable = config.stream_enable and (on_stream is not None)
+        self.team          = config.team_flag
+        self.scheduler     = DeadlineScheduler(self.sample_period)
+        self.game          = GameStateMachine(self.sample_period) # what War Thunder is doing (only matches are fully sampled)
+        self.pipeline      = Pipeline() # fan-out of samples to every output
+        self.meta          = None       # ACMI object metadata properties of the player
+        self.mqtt_session  = None       # (ref_time, obj_id) the MQTT encoder was started with
+        self.usb_writer    = None # class used to send samples to the USB device off the sampling thread
+        self.sink_processes = config.sink_processes
+        self.crashes        = [] # worker crash messages kept in every status message until the recorder restarts
+        self.telem_shm      = config.telem_shm
+        self.shm_publisher  = None # latest sample shared with local tools (created by run())
+        self.broadcast_target = config.broadcast_target
+        self.broadcaster      = None # binary telemetry datagram sender (created by run())
+        
+        if self.sink_processes:
+            self.writer = ProcessLogWriter(on_crash=self.report_crash)
+            
+            if config.stream_enable and config.stream_port:
+                self.stream_process = SinkProcess('stream', STREAM_WORKER, (config.stream_port,), on_crash=self.report_crash)
+                self.processes.append(self.stream_process)
+                self.on_stream     = self.publish_text
+                self.stream_enable = True
+        
+        else:
+            self.writer = LogWriter()
+        
+        if config.usb_enable and config.usb_port:
+            self.usb_writer = UsbWriter(config.usb_port, config.usb_baud, config.usb_fields, config.usb_rate)
+        
+        self.usb_enable = self.usb_writer is not None
+        self.usb_fields = config.usb_fields
+        
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+        
+        if self.mqtt_enable and self.sink_processes:
+            self.mqtt_id = config.mqtt_id
+            
+            # no worker is started without a topic to publish to
+            if not self.mqtt_id:
+                print('ERROR: No remote session ID provided')
+                self.mqtt_enable = False
+            
+            else:
+                self.mqtt_process = SinkProcess('mqtt', MQTT_WORKER, (config.broker_host,
+                                                                      self.mqtt_id,
+                                                                      USERNAME,
+                                                                      config.mqtt_codec,
+                                                                      config.mqtt_compress), on_crash=self.report_crash)
+                self.processes.append(self.mqtt_process)
+        
+        elif self.mqtt_enable:
+            import paho.mqtt.client as mqtt
+            
+            if not os.path.exists(REMOTE_DIR):
+                os.makedirs(REMOTE_DIR)
+            
+            self.mqtt_id = config.mqtt_id
+            self.mqttc   = mqtt.Client()
+            self.encoder = None # JSON payloads are used without an encoder
+            
+            if config.mqtt_codec == 'binary':
+                self.encoder = SampleEncoder(USERNAME, compress=config.mqtt_compress)
+            
+            if self.mqttc.connect(config.broker_host):
+                print('ERROR: Could not connect to MQTT broker {}'.format(config.broker_host))
+                mqtt_errors.inc()
+                self.mqtt_enable = False
+            
+            if not self.mqtt_id:
+                print('ERROR: No remote session ID provided')
+                self.mqtt_enable = False
+    
+    def init_mqtt_struct(self):
+        '''
+        Description:
+        ------------
+        Initialize the file structure needed for propper MQTT processing
+        '''
+        
+        if not os.path.exists(REMOTE_DIR):
+            os.makedirs(REMOTE_DIR)
+        
+        shared_ref.update(self.ref_time, self.obj_id)
+    
+    @property
+    def usb_fields(self):
+        return self._usb_fields
+    
+    @usb_fields.setter
+    def usb_fields(self, fields):
+        self._usb_fields = fields or []
+        
+        # compile the packet layout once instead of checking every field per sample
+        if self.usb_writer:
+            self.usb_writer.layout = UsbLayout(fields)
+    
+    def add_sink(self, name, deliver, maxsize=SINK_QUEUE_LEN, policy=DROP_OLDEST):
+        '''
+        Description:
+        ------------
+        Plug an output into the recording pipeline (see pipeline.Pipeline)
+        
+        :param name:    str      - sink name
+        :param deliver: callable - called from the sink's own worker with every
+                                   pipeline.TelemetrySample
+        :param maxsize: int      - max number of queued samples
+        :param policy:  int      - pipeline.DROP_OLDEST, DROP_NEWEST or BLOCK
+        
+        :return: pipeline.Sink - registered sink
+        '''
+        
+        return self.pipeline.add_sink(name, deliver, maxsize, policy)
+    
+    def setup_sinks(self):
+        '''
+        Description:
+        ------------
+        Register the enabled built-in outputs. ACMI log and column samples are
+        lossless, while the outputs that only ever show the latest sample
+        (overlay, USB device) keep a single queued sample
+        '''
+        
+        # worker process outputs only copy samples into their ring buffers
+        # (without a thread of their own)
+        inline = 0 if self.sink_processes else SINK_QUEUE_LEN
+        
+        self.add_sink('log', self.write_sample, maxsize=inline, policy=BLOCK)
+        self.add_sink('texture', self.save_texture, maxsize=0)
+        
+        if self.column_enable:
+            self.add_sink('columns', self.append_columns, policy=BLOCK)
+        
+        if self.on_overlay:
+            self.add_sink('overlay', self.publish_overlay, maxsize=1)
+        
+        if self.stream_enable:
+            self.add_sink('stream', self.publish_stream, maxsize=inline)
+        
+        if self.mqtt_enable and self.sink_processes:
+            self.add_sink('mqtt', self.send_mqtt, maxsize=inline)
+        
+        elif self.mqtt_enable:
+            self.add_sink('mqtt', self.publish_mqtt)
+        
+        if self.usb_enable:
+            self.add_sink('usb', self.publish_usb, maxsize=1)
+        
+        if self.telem_shm:
+            try:
+                self.shm_publisher = TelemetryPublisher()
+                self.add_sink('shm', self.publish_shm, maxsize=0)
+            except OSError as e:
+                print('ERROR: Could not share telemetry in shared memory - {}'.format(e))
+        
+        if self.broadcast_target:
+            try:
+                self.broadcaster = BroadcastSender(self.broadcast_target)
+                self.add_sink('broadcast', self.publish_broadcast, maxsize=0)
+            except (OSError, ValueError) as e:
+                print('ERROR: Could not broadcast telemetry to {} - {}'.format(self.broadcast_target, e))
+    
+    def write_sample(self, sample):
+        if sample.log_line:
+            self.writer.write(sample.path, sample.log_line)
+    
+    def append_columns(self, sample):
+        # keep every raw field (not just the ones ACMI logs)
+        if self.columns and (sample.tstamp is not None) and not (sample.stale & VALUE_ENDPOINTS):
+            self.columns.append(sample.tstamp, sample.telemetry)
+    
+    def publish_overlay(self, sample):
+        self.on_overlay(sample.telemetry)
+    
+    def publish_stream(self, sample):
+        if sample.log_line:
+            self.on_stream(sample.log_line)
+    
+    def publish_text(self, line):
+        '''
+        Description:
+        ------------
+        Stream ACMI text through the stream worker process (i.e. remote
+        players' entries) - safe to call from any thread
+        
+        :param line: str - ACMI text to stream
+        '''
+        
+        self.stream_process.put(TEXT, line.encode('utf8'))
+    
+    def send_mqtt(self, sample):
+        # a new ACMI log starts a new session of the MQTT worker process
+        if sample.record is None:
+            return
+        
+        if self.mqtt_session != (sample.ref_time, sample.obj_id):
+            self.mqtt_session = (sample.ref_time, sample.obj_id)
+            session = '\x00'.join((sample.ref_time.isoformat(), sample.obj_id, sample.meta))
+            self.mqtt_process.put(SESSION, session.encode('utf8'), block=True)
+        
+        self.mqtt_process.put(SAMPLE, (sample.log_line or '').encode('utf8'), sample.tstamp, sample.record)
+    
+    def publish_usb(self, sample):
+        # sent by the USB writer at its own rate
+        self.usb_writer.publish(sample.basic)
+    
+    def sample_record(self, sample):
+        # raw entry values, also before the ACMI log header was written
+        if sample.record is not None:
+            return sample.record
+        
+        try:
+            return extract_record(sample.telemetry)
+        except KeyError:
+            return None # the ACMI fields weren't all reported
+    
+    def publish_shm(self, sample):
+        # only copies the sample into shared memory, so it's delivered inline
+        if sample.stale & VALUE_ENDPOINTS:
+            return # the snapshot already holds these values
+        
+        self.shm_publisher.publish(sample.tstamp, sample.telemetry.get('type', ''), self.sample_record(sample))
+    
+    def publish_broadcast(self, sample):
+        # a single non-blocking send, so it's delivered inline
+        if sample.stale & VALUE_ENDPOINTS:
+            return # these values were already sent
+        
+        self.broadcaster.send(sample.tstamp, sample.telemetry.get('type', ''), self.sample_record(sample))
+    
+    def save_texture(self, sample):
+        # save match map as a custom texture in Tacview - delivered inline,
+        # so the map image is read between map downloads (a late download
+        # may still be rewriting it)
+        if 'map' not in sample.stale:
+            texture_cache.add_map(sample.grid_info)
+    
+    def publish_mqtt(self, sample):
+        '''
+        Description:
+        ------------
+        Share a single sample with the remote session
+        
+        :param sample: pipeline.TelemetrySample - sample to share
+        '''
+        
+        if sample.record is None:
+            return
+        
+        with mqtt_timer.time():
+            if self.encoder:
+                # a new ACMI log starts a new session
+                if self.mqtt_session != (sample.ref_time, sample.obj_id):
+                    self.mqtt_session = (sample.ref_time, sample.obj_id)
+                    self.encoder.start(sample.ref_time, sample.obj_id, sample.meta)
+                
+                for mqtt_payload in self.encoder.encode(sample.tstamp, sample.record):
+                    if self.mqttc.publish(self.mqtt_id, mqtt_payload).rc:
+                        mqtt_errors.inc()
+            
+            elif sample.log_line:
+                mqtt_payload = json.dumps({'player':   USERNAME,
+                                           'ref_time': sample.ref_time.isoformat(),
+                                           'entry':    sample.log_line})
+                
+                if self.mqttc.publish(self.mqtt_id, mqtt_payload).rc:
+                    mqtt_errors.inc()
+    
+    def setup_log(self):
+        '''
+        Description:
+        ------------
+        Instantiate a new ACMI log file
+        '''
+        
+        self.close_log()
+        
+        self.loc_time = dt.datetime.now()
+        self.ref_time = dt.datetime.utcnow()
+        self.obj_id   = gen_id()
+        self.title = TITLE_FORMAT.format(timestamp=self.loc_time.strftime('%Y_%m_%d_%H_%M_%S'), user=USERNAME)
+        self.title = os.path.join(self.log_dir, self.title)
+        
+        self.writer.open(self.title, format_header(self.ref_time))
+        self.header_inserted = False
+        
+        if self.column_enable:
+            self.columns = ColumnRecorder(self.writer, os.path.splitext(self.title)[0] + COLUMN_EXT, self.ref_time)
+        
+        # remote players' entries are timed relative to this log
+        self.init_mqtt_struct()
+    
+    def close_log(self):
+        '''
+        Description:
+        ------------
+        Close the ACMI log currently being written (if any)
+        '''
+        
+        # everything queued for the log must be written before it's closed
+        self.pipeline.drain(('log', 'columns'))
+        
+        if self.title:
+            self.writer.close(self.title)
+            self.title = None
+        
+        if self.columns:
+            self.columns.close()
+            self.columns = None
+    
+    def process_player_data(self):
+        '''
+        Description:
+        ------------
+        Take a single sample of user War Thunder telemetry data and publish
+        it to every output
+        '''
+        
+        try:
+            with fetch_timer.time():
+                in_match = self.telem.get_telemetry()
+        
+        except FETCH_ERRORS:
+            # War Thunder was closed (or stopped answering) mid-match
+            self.set_game_state(GAME_DOWN)
+            return
+        
+        if in_match:
+            # create a new log if player was dead but just now respawned
+            if self.player_dead:
+                self.setup_log()
+                self.player_dead = False
+            
+            # insert header in ACMI file
+            if not self.header_inserted and self.telem.map_info.map_valid:
+                header = format_header_dict(self.telem.map_info.grid_info, self.loc_time)
+                self.writer.write(self.title, format_user_header(header))
+                self.header_inserted = True
+                
+                self.meta      = format_meta(self.telem.full_telemetry['type'], self.team)
+                self.formatter = EntryFormatter(self.obj_id, self.meta)
+            
+            # format telemetry sample as an ACMI entry (only properties that
+            # changed) - values reused from an earlier sample were already
+            # logged, so they get no entry
+            tstamp = record = log_line = None
+            stale  = frozenset(self.telem.stale)
+            
+            if self.header_inserted:
+                tstamp = (dt.datetime.utcnow() - self.ref_time).total_seconds()
+            
+            if self.header_inserted and not (stale & VALUE_ENDPOINTS):
+                with format_timer.time():
+                    record   = extract_record(self.telem.full_telemetry)
+                    log_line = self.formatter.format(tstamp, format_record(record))
+            
+            self.pipeline.publish(TelemetrySample(tstamp,
+                                                  self.title,
+                                                  self.ref_time,
+                                                  self.obj_id,
+                                                  self.meta if self.header_inserted else None,
+                                                  record,
+                                                  log_line,
+                                                  self.telem.full_telemetry,
+                                                  self.telem.basic_telemetry,
+                                                  self.telem.map_info.grid_info,
+                                                  stale))
+        
+        # identify when the player has died
+        elif not self.telem.map_info.player_found:
+            self.player_dead = True
+        
+        # find out whether the player died, left the match or closed the game
+        if not in_match:
+            self.set_game_state(self.telem.probe())
+    
+    def set_game_state(self, state):
+        '''
+        Description:
+        ------------
+        Update the game state machine with the state War Thunder was observed
+        in and report state changes
+        
+        :param state: str - game_state.GAME_DOWN, IN_HANGAR, DEAD or IN_MATCH
+        '''
+        
+        if not self.game.update(state):
+            return
+        
+        # every match (and every respawn) is recorded to a new log
+        if state != IN_MATCH:
+            self.player_dead = True
+        
+        print(STATUS[state])
+        self.report_status(STATUS[state])
+    
+    def stop(self):
+        '''
+        Description:
+        ------------
+        Ask the recording loop to finish its current sample and exit
+        '''
+        
+        self.scheduler.stop()
+    
+    def report_missed_deadlines(self):
+        '''
+        Description:
+        ------------
+        Report the number of sample deadlines that could not be met
+        '''
+        
+        msg = 'Missed {} of {} sample deadlines'.format(self.scheduler.missed,
+                                                         self.scheduler.missed + self.scheduler.ticks)
+        print('WARNING: {}'.format(msg))
+        self.report_status(msg)
+    
+    def report_status(self, msg=''):
+        '''
+        Description:
+        ------------
+        Report a status message - worker crashes stay in front of every
+        message (i.e. a dead log worker means the ACMI log is no longer
+        written)
+        
+        :param msg: str - status message
+        '''
+        
+        if self.on_status:
+            self.on_status(' | '.join(self.crashes + ([msg] if msg else [])))
+    
+    def report_crash(self, msg):
+        # called from the thread that waits for the crashed worker
+        self.crashes.append(msg)
+        self.report_status()
+    
+    def report_metrics(self):
+        '''
+        Description:
+        ------------
+        Report the stage latencies of the last METRICS_SUMMARY_PERIOD seconds
+        (see metrics.py)
+        '''
+        
+        summary = metrics.summary()
+        
+        if summary or self.crashes:
+            self.report_status(summary)
+    
+    def run(self):
+        '''
+        Description:
+        ------------
+        Main thread to record/stream user data
+        '''
+        
+        self.player_dead = True
+        self.crashes     = []
+        
+        writer_th = threading.Thread(target=self.writer.run, daemon=True)
+        writer_th.start()
+        
+        if self.usb_enable:
+            usb_th = threading.Thread(target=self.usb_writer.run, daemon=True)
+            usb_th.start()
+        
+        process_ths = [threading.Thread(target=process.run, daemon=True) for process in self.processes]
+        
+        for process_th in process_ths:
+            process_th.start()
+        
+        self.setup_sinks()
+        self.pipeline.start()
+        self.setup_log()
+        
+        missed = 0
+        self.scheduler.reset()
+        next_summary = time.monotonic() + METRICS_SUMMARY_PERIOD
+        
+        while not self.scheduler.stopped:
+            if not self.game.sampling:
+                # a cheap probe (backing off while nothing changes) instead
+                # of full samples until the player is driving a vehicle
+                if not self.scheduler.idle(self.game.delay):
+                    break
+                
+                self.set_game_state(self.telem.probe())
+                
+                # re-armed - the first sample is taken right away
+                if not self.game.sampling:
+                    continue
+            
+            elif not self.scheduler.wait():
+                break
+            
+            with sample_timer.time():
+                self.process_player_data()
+            
+            samples_counter.inc()
+            
+            if self.scheduler.missed != missed:
+                missed_counter.inc(self.scheduler.missed - missed)
+                missed = self.scheduler.missed
+                self.report_missed_deadlines()
+            
+            elif time.monotonic() >= next_summary:
+                next_summary = time.monotonic() + METRICS_SUMMARY_PERIOD
+                self.report_metrics()
+        
+        self.pipeline.stop()
+        self.close_log()
+        
+        if self.shm_publisher:
+            self.shm_publisher.close()
+            self.shm_publisher = None
+        
+        if self.broadcaster:
+            self.broadcaster.close()
+            self.broadcaster = None
+        
+        self.telem.close()
+        
+        self.writer.stop()
+        writer_th.join()
+        
+        for process in self.processes:
+            process.stop()
+        
+        for process_th in process_ths:
+            process_th.join()
+        
+        if self.usb_enable:
+            self.usb_writer.stop()
+            usb_th.join()
\ No newline at end of file
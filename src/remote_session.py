@@ -0,0 +1,275 @@
+import os
+import threading
+import datetime as dt
+import paho.mqtt.client as mqtt
+from constants import USERNAME, BROKER_HOST, TIME_FORMAT
+from constants import TITLE_FORMAT, REMOTE_DIR
+from log_writer import LogWriter
+from shared_reference import shared_ref
+from acmi_format import EntryRecord, EntryFormatter, gen_id, format_header, format_record
+from mqtt_codec import SampleDecoder, Sample, Hello
+from metrics import metrics
+
+
+class RemoteSession(object):
+    '''
+    Description:
+    ------------
+    Download remote user's data via MQTT. This class does not depend on Qt -
+    Tacview stream lines and player name updates are reported through the
+    given callback functions
+    '''
+    
+    def __init__(self, mqtt_id, broker_host=BROKER_HOST, on_stream=None, on_names=None):
+        '''
+        Description:
+        ------------
+        Initialize the remote session and connect to the MQTT broker
+        
+        :param mqtt_id:     str            - remote session ID (MQTT topic)
+        :param broker_host: str            - MQTT broker host name
+        :param on_stream:   callable(str)  - called with every remote ACMI
+                                             entry to be streamed to Tacview
+        :param on_names:    callable(list) - called with the names of all
+                                             remote players
+        '''
+        
+        self.on_stream     = on_stream
+        self.on_names      = on_names
+        self.stream_enable = on_stream is not None
+        self.mqtt_enable   = True
+        self.mqtt_id       = mqtt_id
+        self.mqttc         = mqtt.Client()
+        self.mqttc.on_connect = self.on_connect
+        self.mqttc.on_message = self.on_message
+        self.remote_players   = {}
+        self.writer           = LogWriter(name='remote') # class used to write remote player logs
+        self.ids_in_use       = set()
+        self.decoder          = SampleDecoder()
+        self.senders          = {} # binary session sender ID -> player name
+        self.blocked_players  = []
+        
+        if self.mqttc.connect(broker_host):
+            print('ERROR: Could not connect to MQTT broker {}'.format(broker_host))
+            metrics.errors('mqtt').inc()
+            self.mqtt_enable = False
+    
+    def on_connect(self, client, userdata, flags, rc):
+        '''
+        Description:
+        ------------
+        Callback function - subscribe to all MQTT messages where the topic is
+        the remote session ID specified in the GUI
+        '''
+        
+        client.subscribe(topic=self.mqtt_id)
+    
+    def on_message(self, client, userdata, message):
+        '''
+        Description:
+        ------------
+        Callback function - process remote player's data (record/stream)
+        '''
+        
+        try:
+            msg = self.decoder.decode(message.payload)
+            
+            if isinstance(msg, Sample):
+                self.process_sample(msg)
+            
+            elif isinstance(msg, Hello):
+                self.process_hello(msg)
+            
+            elif isinstance(msg, dict):
+                self.process_json(msg)
+                
+        except:
+            import traceback
+            traceback.print_exc()
+    
+    def add_player(self, player, log_ref):
+        '''
+        Description:
+        ------------
+        Create the log and a unique object ID for a player new to the remote
+        session
+        
+        :param player:  str      - remote player name
+        :param log_ref: datetime - UTC reference time of the new log
+        
+        :return: dict - remote player state
+        '''
+        
+        loc_time = dt.datetime.now()
+        title = TITLE_FORMAT.format(timestamp=loc_time.strftime('%Y_%m_%d_%H_%M_%S'), user=player)
+        title = os.path.join(REMOTE_DIR, title)
+        
+        obj_id = gen_id()
+        
+        # make sure new object ID is unique accross all objects
+        while obj_id in self.ids_in_use:
+            obj_id = gen_id()
+        
+        self.ids_in_use.add(obj_id)
+        
+        self.remote_players[player] = {'log_path':     title,
+                                       'log_ref':      log_ref,
+                                       'obj_id':       obj_id,
+                                       'ref_time_str': None,
+                                       'ref_time':     None,
+                                       'formatter':    EntryFormatter(obj_id),
+                                       'values':       [None] * len(EntryRecord._fields),
+                                       'synced':       False}
+        self.writer.open(title, format_header(log_ref))
+        
+        if self.on_names:
+            self.on_names(list(self.remote_players.keys()))
+        
+        return self.remote_players[player]
+    
+    def process_hello(self, msg):
+        '''
+        Description:
+        ------------
+        Start (or restart) a remote player's binary session
+        
+        :param msg: mqtt_codec.Hello - session handshake
+        '''
+        
+        # only process remote player's data
+        if msg.player == USERNAME:
+            return
+        
+        ref_time = dt.datetime.strptime(msg.ref_time, TIME_FORMAT)
+        player   = self.remote_players.get(msg.player)
+        
+        if player is None:
+            player = self.add_player(msg.player, ref_time)
+        
+        if msg.ref_time != player['ref_time_str']:
+            player['ref_time']     = ref_time
+            player['ref_time_str'] = msg.ref_time
+        
+        player['formatter'].meta = msg.meta
+        self.senders[msg.sender] = msg.player
+    
+    def process_sample(self, msg):
+        '''
+        Description:
+        ------------
+        Rebuild a remote player's ACMI entry from a binary sample and
+        record/stream it
+        
+        :param msg: mqtt_codec.Sample - changed sample fields
+        '''
+        
+        name   = self.senders.get(msg.sender)
+        player = self.remote_players.get(name)
+        
+        # wait for the HELLO message (own samples never have one)
+        if player is None:
+            return
+        
+        values = player['values']
+        
+        for i, value in msg.fields.items():
+            values[i] = value
+        
+        # wait for the first complete sample
+        if not player['synced']:
+            if len(msg.fields) < len(values):
+                return
+            
+            player['synced'] = True
+        
+        # log remote player's data relative to the remote log's reference time
+        remote_tref = player['ref_time']
+        log_tstamp  = msg.tstamp + (remote_tref - player['log_ref']).total_seconds()
+        entry       = player['formatter'].format(log_tstamp, format_record(EntryRecord(*values)))
+        
+        if not entry:
+            return
+        
+        self.writer.write(player['log_path'], entry)
+        
+        # stream remote session data to Tacview (relative to the local user's
+        # reference time) if enabled and player isn't blocked
+        if self.stream_enable and (name not in self.blocked_players):
+            user_tref, user_obj_id = shared_ref.get()
+            
+            if user_tref is not None:
+                self.ids_in_use.add(user_obj_id)
+                
+                true_tstamp = msg.tstamp + (remote_tref - user_tref).total_seconds()
+                self.on_stream('#{:.2f}'.format(true_tstamp) + entry[entry.index('\n'):])
+    
+    def process_json(self, payload):
+        '''
+        Description:
+        ------------
+        Process remote player's data sent as JSON (older versions of Thunder
+        Viewer)
+        
+        :param payload: dict - player name, reference time and ACMI entry
+        '''
+        
+        # only process remote player's data
+        if not payload['player'] == USERNAME:
+            user_tref, user_obj_id = shared_ref.get()
+            
+            if user_tref is None:
+                return # local recorder hasn't started a log yet
+            
+            if user_obj_id not in self.ids_in_use:
+                self.ids_in_use.add(user_obj_id)
+            
+            # process players new to the remote session
+            if payload['player'] not in self.remote_players:
+                self.add_player(payload['player'], dt.datetime.utcnow())
+            
+            player = self.remote_players[payload['player']]
+            
+            # only parse the remote reference time when the remote player starts a new log
+            if payload['ref_time'] != player['ref_time_str']:
+                player['ref_time']     = dt.datetime.strptime(payload['ref_time'], TIME_FORMAT)
+                player['ref_time_str'] = payload['ref_time']
+            
+            remote_tref   = player['ref_time']
+            entry         = payload['entry']
+            remote_tstamp = float(entry.split('\n')[0].replace('#', ''))
+            properties    = entry[entry.index('\n'):] if '\n' in entry else '\n'
+            
+            # stream remote session data to Tacview (relative to the local
+            # user's reference time) if enabled and player isn't blocked
+            if self.stream_enable and (payload['player'] not in self.blocked_players):
+                true_tstamp = remote_tstamp + (remote_tref - user_tref).total_seconds()
+                self.on_stream('#{:.2f}'.format(true_tstamp) + properties)
+            
+            # log remote player's data relative to the remote log's reference time
+            log_tstamp = remote_tstamp + (remote_tref - player['log_ref']).total_seconds()
+            self.writer.write(player['log_path'], '#{:.2f}'.format(log_tstamp) + properties)
+    
+    def stop(self):
+        '''
+        Description:
+        ------------
+        Disconnect from the MQTT broker - ends run()
+        '''
+        
+        self.mqttc.disconnect()
+    
+    def run(self):
+        '''
+        Description:
+        ------------
+        Process all MQTT messages for the remote session until stop() is called
+        '''
+        
+        if self.mqtt_enable:
+            writer_th = threading.Thread(target=self.writer.run, daemon=True)
+            writer_th.start()
+            
+            self.mqttc.loop_forever()
+            
+            self.writer.stop()
+            writer_th.join()
\ No newline at end of file
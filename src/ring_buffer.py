@@ -0,0 +1,103 @@
+import threading
+from collections import deque
+
+
+class RingBuffer(object):
+    '''
+    Description:
+    ------------
+    Thread-safe, fixed capacity FIFO buffer. Producers never block - once the
+    buffer is full the oldest item is dropped to make room for the newest.
+    Consumers block until at least one item is available and then take
+    everything that is buffered in a single call
+    '''
+    
+    def __init__(self, capacity):
+        '''
+        Description:
+        ------------
+        Initialize the buffer
+        
+        :param capacity: int - maximum number of items held before the oldest
+                               items start being dropped
+        '''
+        
+        self.capacity = capacity
+        self.dropped  = 0 # number of items discarded because the buffer was full
+        self._items   = deque(maxlen=capacity)
+        self._cond    = threading.Condition()
+        self._closed  = False
+    
+    @property
+    def backlog(self):
+        '''
+        Description:
+        ------------
+        Number of items waiting to be consumed
+        '''
+        
+        return len(self._items)
+    
+    @property
+    def closed(self):
+        return self._closed
+    
+    def put(self, item):
+        '''
+        Description:
+        ------------
+        Append an item and wake up a waiting consumer
+        
+        :param item: any - item to be buffered
+        '''
+        
+        with self._cond:
+            if len(self._items) == self.capacity:
+                self.dropped += 1
+            
+            self._items.append(item)
+            self._cond.notify()
+    
+    def get_all(self, timeout=None):
+        '''
+        Description:
+        ------------
+        Wait for items to become available and remove all of them from the
+        buffer
+        
+        :param timeout: float - maximum time to wait in seconds (None waits
+                                until an item arrives or the buffer is closed)
+        
+        :return items: list - buffered items in arrival order (empty if the
+                              wait timed out or the buffer was closed)
+        '''
+        
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            
+            items = list(self._items)
+            self._items.clear()
+        
+        return items
+    
+    def clear(self):
+        '''
+        Description:
+        ------------
+        Discard all buffered items
+        '''
+        
+        with self._cond:
+            self._items.clear()
+    
+    def close(self):
+        '''
+        Description:
+        ------------
+        Wake up all waiting consumers - buffered items can still be read
+        '''
+        
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
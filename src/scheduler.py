@@ -0,0 +1,99 @@
+import time
+import threading
+
+
+class DeadlineScheduler(object):
+    '''
+    Description:
+    ------------
+    Fixed-rate scheduler based on a monotonic clock. Every deadline is
+    computed from the time the schedule was started (not from the time the
+    previous sample finished) so the sample rate does not drift. Deadlines
+    that could not be met because the previous sample ran long are skipped
+    and counted instead of being run back-to-back
+    '''
+    
+    def __init__(self, period):
+        '''
+        Description:
+        ------------
+        Initialize the scheduler
+        
+        :param period: float - time between deadlines in seconds
+        '''
+        
+        self.period  = period
+        self.ticks   = 0 # number of deadlines serviced
+        self.missed  = 0 # number of deadlines skipped
+        self._wakeup = threading.Event()
+        
+        self.reset()
+    
+    def reset(self):
+        '''
+        Description:
+        ------------
+        Restart the schedule so that the next deadline is one period from now
+        '''
+        
+        self._start = time.monotonic()
+        self._index = 0
+    
+    def stop(self):
+        '''
+        Description:
+        ------------
+        Request the schedule to end - wakes up any thread waiting for its
+        next deadline
+        '''
+        
+        self._wakeup.set()
+    
+    @property
+    def stopped(self):
+        return self._wakeup.is_set()
+    
+    def wait(self):
+        '''
+        Description:
+        ------------
+        Sleep until the next deadline
+        
+        :return: bool - False if the schedule was stopped while waiting
+        '''
+        
+        self._index += 1
+        deadline = self._start + (self._index * self.period)
+        now      = time.monotonic()
+        
+        if now > deadline + self.period:
+            # skip every deadline that already passed except the latest one
+            behind = int((now - deadline) / self.period)
+            self._index += behind
+            self.missed += behind
+            deadline = self._start + (self._index * self.period)
+        
+        if deadline > now:
+            self._wakeup.wait(deadline - now)
+        
+        self.ticks += 1
+        
+        return not self.stopped
+    
+    def idle(self, delay):
+        '''
+        Description:
+        ------------
+        Sleep outside of the schedule (i.e. between probes while there is
+        nothing to sample). The schedule restarts afterwards, so the time
+        spent idle is never counted as missed deadlines
+        
+        :param delay: float - time to sleep in seconds
+        
+        :return: bool - False if the schedule was stopped while sleeping
+        '''
+        
+        self._wakeup.wait(delay)
+        self.reset()
+        
+        return not self.stopped
@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+import datetime as dt
+from metrics import metrics
+from constants import REF_FILE, TIME_FORMAT, REF_CHECK_PERIOD
+
+
+class SharedReference(object):
+    '''
+    Description:
+    ------------
+    In-memory copy of the local player's ACMI reference time and object ID.
+    The recorder updates it whenever a new log is started and the MQTT
+    subscriber reads it for every message without touching the disk.
+    
+    Every update is also saved to REF_FILE so a recorder running in another
+    process can still be followed - the file's modification time is checked
+    at most once every check_period seconds and the file is only parsed
+    again when it changed
+    '''
+    
+    def __init__(self, path=REF_FILE, check_period=REF_CHECK_PERIOD):
+        '''
+        Description:
+        ------------
+        Initialize the reference (no reference is known until update() is
+        called or the reference file is found)
+        
+        :param path:         str   - reference file path
+        :param check_period: float - min seconds between reference file checks
+        '''
+        
+        self.path         = path
+        self.check_period = check_period
+        self.version      = 0 # incremented every time the reference changes
+        
+        self._ref_time   = None
+        self._obj_id     = None
+        self._mtime      = None
+        self._next_check = 0
+        self._lock       = threading.Lock()
+    
+    def update(self, ref_time, obj_id):
+        '''
+        Description:
+        ------------
+        Set a new reference and save it to the reference file
+        
+        :param ref_time: datetime - UTC reference time of the local ACMI log
+        :param obj_id:   str      - ACMI object hex ID of the local player
+        '''
+        
+        with self._lock:
+            self._ref_time = ref_time
+            self._obj_id   = obj_id
+            self.version  += 1
+            
+            try:
+                dirname = os.path.dirname(self.path)
+                
+                if not os.path.exists(dirname):
+                    os.makedirs(dirname)
+                
+                with open(self.path, 'w') as f:
+                    f.write(ref_time.isoformat())
+                    f.write('\n')
+                    f.write(obj_id)
+                
+                self._mtime = os.stat(self.path).st_mtime
+            except OSError as e:
+                print('ERROR: Could not save reference file {} - {}'.format(self.path, e))
+                metrics.errors('reference').inc()
+    
+    def get(self):
+        '''
+        Description:
+        ------------
+        Get the current reference
+        
+        :return: tuple - UTC reference time (datetime) and object hex ID (str)
+                         of the local player - (None, None) if not known yet
+        '''
+        
+        now = time.monotonic()
+        
+        if now >= self._next_check:
+            self._next_check = now + self.check_period
+            self._reload()
+        
+        return self._ref_time, self._obj_id
+    
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            
+            try:
+                with open(self.path, 'r') as f:
+                    ref_time = dt.datetime.strptime(f.readline().replace('\n', ''), TIME_FORMAT)
+                    obj_id   = f.readline()
+            except (OSError, ValueError):
+                return # file is being rewritten - try again at the next check
+            
+            self._mtime = mtime
+            
+            if (ref_time, obj_id) != (self._ref_time, self._obj_id):
+                self._ref_time = ref_time
+                self._obj_id   = obj_id
+                self.version  += 1
+
+
+shared_ref = SharedReference() # reference shared by every recorder/subscriber in this process
@@ -0,0 +1,126 @@
+import struct
+from multiprocessing import shared_memory
+from constants import SHM_RING_SLOTS
+
+
+RING_MAGIC = b'TVRB'
+RING_HEAD  = struct.Struct('<4sII') # magic, number of slots, slot size
+INDEX      = struct.Struct('<Q')    # write/read sequence number
+WRITE_POS  = 64                     # write and read sequence numbers are kept
+READ_POS   = 128                    # on separate cache lines
+SLOTS_POS  = 192
+
+
+class ShmRing(object):
+    '''
+    Description:
+    ------------
+    Single-producer/single-consumer ring buffer of fixed-layout binary
+    records in shared memory (multiprocessing.shared_memory), so records can
+    be passed between processes without pickling or a pipe.
+    
+    The producer only ever writes the write sequence number and the consumer
+    only the read sequence number. A slot is written before the write
+    sequence number that publishes it, so the consumer never sees a partial
+    record. Neither side blocks - put() returns False if the ring is full and
+    get() returns None if it's empty
+    '''
+    
+    def __init__(self, layout, name=None, slots=SHM_RING_SLOTS):
+        '''
+        Description:
+        ------------
+        Create a new ring or attach to an existing one
+        
+        :param layout: struct.Struct - record layout (must match the ring's
+                                       slot size when attaching)
+        :param name:   str           - shared memory name of the ring to
+                                       attach to (a new ring is created if
+                                       None)
+        :param slots:  int           - number of records the ring can hold
+                                       (only used when creating a ring)
+        '''
+        
+        self.layout = layout
+        self.owner  = name is None
+        
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=SLOTS_POS + slots * layout.size)
+            RING_HEAD.pack_into(self.shm.buf, 0, RING_MAGIC, slots, layout.size)
+            INDEX.pack_into(self.shm.buf, WRITE_POS, 0)
+            INDEX.pack_into(self.shm.buf, READ_POS, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            magic, slots, size = RING_HEAD.unpack_from(self.shm.buf, 0)
+            
+            if magic != RING_MAGIC or size != layout.size:
+                self.shm.close()
+                raise ValueError('{} is not a ring of {} byte records'.format(name, layout.size))
+        
+        self.name  = self.shm.name
+        self.slots = slots
+        self.buf   = self.shm.buf
+        
+        # each side keeps its own sequence number locally and only reads the
+        # other side's from shared memory
+        self._write = INDEX.unpack_from(self.buf, WRITE_POS)[0]
+        self._read  = INDEX.unpack_from(self.buf, READ_POS)[0]
+    
+    def __len__(self):
+        return INDEX.unpack_from(self.buf, WRITE_POS)[0] - INDEX.unpack_from(self.buf, READ_POS)[0]
+    
+    def put(self, *values):
+        '''
+        Description:
+        ------------
+        Append a record (producer side)
+        
+        :param values: record values in layout order
+        
+        :return: bool - False if the ring is full (nothing was written)
+        '''
+        
+        if self._write - INDEX.unpack_from(self.buf, READ_POS)[0] >= self.slots:
+            return False
+        
+        self.layout.pack_into(self.buf, SLOTS_POS + (self._write % self.slots) * self.layout.size, *values)
+        
+        self._write += 1
+        INDEX.pack_into(self.buf, WRITE_POS, self._write)
+        
+        return True
+    
+    def get(self):
+        '''
+        Description:
+        ------------
+        Take the oldest record (consumer side)
+        
+        :return: tuple - record values (None if the ring is empty)
+        '''
+        
+        if self._read >= INDEX.unpack_from(self.buf, WRITE_POS)[0]:
+            return None
+        
+        values = self.layout.unpack_from(self.buf, SLOTS_POS + (self._read % self.slots) * self.layout.size)
+        
+        self._read += 1
+        INDEX.pack_into(self.buf, READ_POS, self._read)
+        
+        return values
+    
+    def close(self):
+        '''
+        Description:
+        ------------
+        Detach from the ring (the creating side also frees the shared memory)
+        '''
+        
+        self.buf = None
+        self.shm.close()
+        
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
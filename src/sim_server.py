@@ -0,0 +1,426 @@
+import sys
+import json
+import math
+import time
+import struct
+import argparse
+import threading
+from bisect import bisect_right
+from collections import namedtuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+SIM_PORT       = 8111     # War Thunder's localhost port (WarThunder library URLs are fixed to it)
+METERS_PER_DEG = 111320.0 # meters per degree of latitude
+
+# map metadata served by /map_info.json (65.5 km x 65.5 km map)
+MAP_INFO = {'grid_steps':     [8192.0, 8192.0],
+            'grid_zero':      [-28672.0, 28672.0],
+            'map_generation': 1,
+            'map_max':        [32768.0, 32768.0],
+            'map_min':        [-32768.0, -32768.0],
+            'valid':          True}
+MAP_SIZE = MAP_INFO['map_max'][0] - MAP_INFO['map_min'][0]
+
+# single state of the simulated aircraft
+FlightState = namedtuple('FlightState', ['lon',
+                                         'lat',
+                                         'alt',
+                                         'roll',
+                                         'pitch',
+                                         'heading',
+                                         'throttle',
+                                         'ailerons',
+                                         'elevator',
+                                         'pedals',
+                                         'ias',
+                                         'tas',
+                                         'fuel',
+                                         'fuel0',
+                                         'mach',
+                                         'aoa',
+                                         'gear',
+                                         'flaps'])
+
+
+def map_image(size=64, color=(64, 96, 74)):
+    '''
+    Description:
+    ------------
+    Create a plain map image (a BMP - War Thunder serves JPEGs, but the
+    WarThunder library only needs something PIL can open)
+    
+    :param size:  int   - image width and height in pixels
+    :param color: tuple - blue, green, red pixel color
+    
+    :return: bytes - BMP file contents
+    '''
+    
+    row    = bytes(color) * size
+    pixels = row * size
+    
+    return (struct.pack('<2sIHHI', b'BM', 54 + len(pixels), 0, 0, 54) +
+            struct.pack('<IiiHHIIiiII', 40, size, size, 1, 24, 0, len(pixels), 2835, 2835, 0, 0) +
+            pixels)
+
+
+class OrbitProfile(object):
+    '''
+    Description:
+    ------------
+    Synthetic flight profile - a constant speed orbit around the center of
+    the map with a slow altitude oscillation
+    '''
+    
+    def __init__(self, radius=8000.0, ias=450.0, alt=1500.0, airframe='p-51d-5'):
+        '''
+        Description:
+        ------------
+        Initialize the profile
+        
+        :param radius:   float - orbit radius (m)
+        :param ias:      float - airspeed (km/h)
+        :param alt:      float - mean altitude (m)
+        :param airframe: str   - War Thunder vehicle type
+        '''
+        
+        self.radius   = radius
+        self.ias      = ias
+        self.alt      = alt
+        self.airframe = airframe
+        self.duration = 2 * math.pi * radius / (ias / 3.6) # seconds per orbit
+    
+    def state(self, tstamp):
+        '''
+        Description:
+        ------------
+        Aircraft state at the given time
+        
+        :param tstamp: float - seconds since the start of the profile
+        
+        :return: FlightState - aircraft state
+        '''
+        
+        speed = self.ias / 3.6
+        angle = speed * tstamp / self.radius
+        east  = MAP_SIZE / 2 + self.radius * math.sin(angle)
+        north = -MAP_SIZE / 2 + self.radius * math.cos(angle)
+        alt   = self.alt + 200 * math.sin(tstamp / 20)
+        bank  = math.degrees(math.atan(speed ** 2 / (self.radius * 9.81)))
+        fuel  = max(300.0 - tstamp * 0.05, 0.0)
+        
+        return FlightState(east / METERS_PER_DEG,
+                           north / METERS_PER_DEG,
+                           alt,
+                           bank,
+                           2.0 + 3 * math.cos(tstamp / 20),
+                           (math.degrees(angle) + 90) % 360,
+                           0.9,
+                           0.05 * math.sin(tstamp),
+                           0.1,
+                           0.0,
+                           self.ias,
+                           self.ias * (1 + alt / 50000),
+                           fuel,
+                           300.0,
+                           self.ias / 1225,
+                           3.0,
+                           0.0,
+                           0.0)
+
+
+class ReplayProfile(object):
+    '''
+    Description:
+    ------------
+    Flight profile replayed from the first object of an ACMI log (looped)
+    '''
+    
+    def __init__(self, path):
+        '''
+        Description:
+        ------------
+        Load the log
+        
+        :param path: str - ACMI log path
+        '''
+        
+        from acmi_export import parse_log, COLUMN_NAMES
+        
+        ref_time, tracks = parse_log(path)
+        
+        if not tracks:
+            raise ValueError('{} has no objects to replay'.format(path))
+        
+        obj_id, track = next(iter(tracks.items()))
+        
+        self.columns  = dict(zip(COLUMN_NAMES, track.columns))
+        self.airframe = track.meta.get('Name', 'p-51d-5')
+        self.times    = self.columns['time']
+        self.start    = self.times[0]
+        self.duration = max(self.times[-1] - self.start, 1e-3)
+    
+    def state(self, tstamp):
+        '''
+        Description:
+        ------------
+        Aircraft state at the given time (the last logged state at or before
+        it)
+        
+        :param tstamp: float - seconds since the start of the replay
+        
+        :return: FlightState - aircraft state
+        '''
+        
+        i   = max(bisect_right(self.times, self.start + tstamp % self.duration) - 1, 0)
+        col = self.columns
+        
+        def get(name, default=0.0):
+            value = col[name][i]
+            return default if value != value else value # NaN
+        
+        fuel_volume = get('fuel_volume', 1.0) or 1.0
+        
+        return FlightState(get('lon'),
+                           get('lat'),
+                           get('alt'),
+                           get('roll'),
+                           get('pitch'),
+                           get('heading'),
+                           get('throttle'),
+                           get('roll_input'),
+                           get('pitch_input'),
+                           get('yaw_input'),
+                           get('ias'),
+                           get('tas'),
+                           get('fuel_weight'),
+                           get('fuel_weight') / fuel_volume,
+                           get('mach'),
+                           get('aoa'),
+                           get('gear', 1.0),
+                           get('flaps'))
+
+
+class SimHandler(BaseHTTPRequestHandler):
+    '''
+    Description:
+    ------------
+    Serves War Thunder's localhost endpoints (keep-alive, like the game)
+    '''
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        sim      = self.server.sim
+        endpoint = self.path.split('?')[0]
+        handler  = sim.endpoints.get(endpoint)
+        
+        if handler is None:
+            self.send_error(404)
+            return
+        
+        body, content_type = handler()
+        
+        with sim.lock:
+            sim.requests[endpoint] = sim.requests.get(endpoint, 0) + 1
+        
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class SimServer(object):
+    '''
+    Description:
+    ------------
+    Local stand-in for War Thunder's localhost telemetry server. Serves the
+    endpoints the WarThunder library reads (/indicators, /state,
+    /map_info.json, /map_obj.json, /map.img, /gamechat, /hudmsg) from a
+    flight profile, so everything can be run and benchmarked without the
+    game
+    '''
+    
+    def __init__(self, profile=None, port=SIM_PORT, host='127.0.0.1', speed=1.0):
+        '''
+        Description:
+        ------------
+        Initialize the server (the port is not bound until serve_forever()
+        is called)
+        
+        :param profile: OrbitProfile/ReplayProfile - flight profile (orbit if
+                                                     None)
+        :param port:    int   - TCP port to listen on
+        :param host:    str   - interface to listen on
+        :param speed:   float - playback speed of the profile
+        '''
+        
+        self.profile  = profile or OrbitProfile()
+        self.port     = port
+        self.host     = host
+        self.speed    = speed
+        self.requests = {} # endpoint -> number of requests served
+        self.lock     = threading.Lock()
+        self.image    = map_image()
+        
+        # endpoint -> function returning the response body and content type
+        self.endpoints = {'/indicators':    self.indicators,
+                          '/state':         self.state,
+                          '/map_info.json': self.map_info,
+                          '/map_obj.json':  self.map_obj,
+                          '/map.img':       self.map_img,
+                          '/gamechat':      self.gamechat,
+                          '/hudmsg':        self.hudmsg}
+        
+        self._start  = time.monotonic()
+        self._server = None
+    
+    def sample(self):
+        '''
+        Description:
+        ------------
+        Current state of the simulated aircraft
+        
+        :return: FlightState - aircraft state
+        '''
+        
+        return self.profile.state((time.monotonic() - self._start) * self.speed)
+    
+    def indicators(self):
+        s = self.sample()
+        
+        return _json({'valid':             True,
+                      'type':              self.profile.airframe,
+                      'speed':             round(s.ias / 3.6, 3),
+                      'pedals1':           round(s.pedals, 6),
+                      'stick_elevator':    round(s.elevator, 6),
+                      'stick_ailerons':    round(s.ailerons, 6),
+                      'vario':             0.0,
+                      'altitude_hour':     round(s.alt, 2),
+                      'aviahorizon_roll':  round(s.roll, 1),
+                      'aviahorizon_pitch': round(s.pitch, 1),
+                      'compass':           round(s.heading, 1),
+                      'clock_hour':        time.localtime().tm_hour,
+                      'clock_min':         time.localtime().tm_min,
+                      'clock_sec':         time.localtime().tm_sec,
+                      'throttle':          round(s.throttle, 2)})
+    
+    def state(self):
+        s = self.sample()
+        
+        return _json({'valid':         True,
+                      'H, m':          int(s.alt),
+                      'TAS, km/h':     int(s.tas),
+                      'IAS, km/h':     int(s.ias),
+                      'M':             round(s.mach, 2),
+                      'AoA, deg':      round(s.aoa, 1),
+                      'AoS, deg':      0.0,
+                      'Ny':            1.0,
+                      'Vy, m/s':       0.0,
+                      'Wx, deg/s':     0,
+                      'Mfuel, kg':     int(s.fuel),
+                      'Mfuel0, kg':    int(s.fuel0),
+                      'throttle 1, %': int(s.throttle * 100),
+                      'RPM 1':         2700,
+                      'gear, %':       int(s.gear * 100),
+                      'flaps, %':      int(s.flaps * 100)})
+    
+    def map_info(self):
+        return _json(MAP_INFO)
+    
+    def map_obj(self):
+        s = self.sample()
+        
+        # map coordinates are fractions of the map size, measured from the
+        # upper left corner
+        x   = s.lon * METERS_PER_DEG / MAP_SIZE
+        y   = -s.lat * METERS_PER_DEG / MAP_SIZE
+        hdg = math.radians(s.heading)
+        
+        return _json([{'type':    'aircraft',
+                       'color':   '#faC81E',
+                       'color[]': [250, 200, 30],
+                       'blink':   0,
+                       'icon':    'Player',
+                       'icon_bg': 'none',
+                       'x':       round(x, 6),
+                       'y':       round(y, 6),
+                       'dx':      round(math.sin(hdg), 6),
+                       'dy':      round(-math.cos(hdg), 6)}])
+    
+    def map_img(self):
+        return self.image, 'image/bmp'
+    
+    def gamechat(self):
+        return _json([])
+    
+    def hudmsg(self):
+        return _json({'events': [], 'damage': []})
+    
+    def serve_forever(self):
+        '''
+        Description:
+        ------------
+        Serve requests until shutdown() is called
+        
+        Raises OSError if the port can't be bound
+        '''
+        
+        self._server = ThreadingHTTPServer((self.host, self.port), SimHandler)
+        self._server.daemon_threads = True
+        self._server.sim = self
+        self._start = time.monotonic()
+        
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+    
+    def shutdown(self):
+        '''
+        Description:
+        ------------
+        Stop serve_forever() - safe to call from any thread
+        '''
+        
+        if self._server:
+            self._server.shutdown()
+
+
+def _json(value):
+    return json.dumps(value).encode('utf8'), 'application/json'
+
+
+def main(argv=None):
+    '''
+    Description:
+    ------------
+    Run the simulated War Thunder localhost server
+    '''
+    
+    parser = argparse.ArgumentParser(prog='sim_server.py',
+                                     description='Serve simulated War Thunder localhost telemetry')
+    parser.add_argument('--replay', help='ACMI log to replay (i.e. example_acmi_log/*.acmi) - synthetic orbit if not given')
+    parser.add_argument('--port', type=int, default=SIM_PORT, help='TCP port to listen on')
+    parser.add_argument('--speed', type=float, default=1.0, help='playback speed')
+    
+    args    = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    profile = ReplayProfile(args.replay) if args.replay else OrbitProfile()
+    server  = SimServer(profile, port=args.port, speed=args.speed)
+    
+    print('Serving simulated War Thunder telemetry on http://{}:{}'.format(server.host, server.port))
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print('ERROR: Could not serve on port {} - {}'.format(args.port, e))
+
+
+if __name__ == '__main__':
+    main()
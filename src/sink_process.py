@@ -0,0 +1,473 @@
+'''
+Pipeline outputs run in worker processes - ACMI log writing, Tacview
+fan-out and MQTT publishing can run outside the GUI/sampling process so
+their work never competes with sampling for the GIL.
+
+Every worker process reads fixed-layout binary records (see RECORD) from
+its own shared memory ring buffer (see shm_ring.py) - nothing is pickled
+after the process is started. Two semaphores count the records in the
+ring and its free slots, so an idle worker sleeps until the next record
+arrives instead of polling the ring. The latency histograms of the stages
+a worker runs are copied back to the main process every
+METRICS_SYNC_PERIOD seconds, so they're served and summarized like every
+other stage.
+'''
+
+import math
+import time
+import signal
+import struct
+import threading
+import multiprocessing
+import datetime as dt
+from shm_ring import ShmRing
+from metrics import metrics, LATENCY_BUCKETS
+from log_writer import queue_gauge
+from acmi_format import EntryRecord
+from constants import SHM_RING_SLOTS, SHM_WAIT_TIMEOUT, METRICS_SYNC_PERIOD
+
+
+STOP    = 0 # finish the queued records and exit
+OPEN    = 1 # text: log path, NUL, header
+WRITE   = 2 # text: log path, NUL, text (or binary data) to append
+CLOSE   = 3 # text: log path
+SESSION = 4 # text: reference time (ISO format), NUL, object ID, NUL, object metadata
+SAMPLE  = 5 # tstamp, record and text: ACMI entry
+TEXT    = 6 # text: ACMI text to stream (i.e. remote players' entries)
+
+MORE = 0x01 # the text continues in the next record
+
+RECORD_TEXT = 384 # text bytes per record - longer text is split over several records
+RECORD      = struct.Struct('<BBHId{}d{}s'.format(len(EntryRecord._fields), RECORD_TEXT)) # kind, flags, text length, int mask, tstamp, record fields (NaN if None), text
+NO_RECORD   = (math.nan,) * len(EntryRecord._fields)
+
+LOG_WORKER    = 'log'
+STREAM_WORKER = 'stream'
+MQTT_WORKER   = 'mqtt'
+
+WORKER_STAGES = {LOG_WORKER:    ('log',),   # metrics stages observed by each worker
+                 STREAM_WORKER: ('stream',),
+                 MQTT_WORKER:   ('mqtt',)}
+STAGE_STATS   = len(LATENCY_BUCKETS) + 2    # bucket counts (with +Inf) and sum of a stage
+
+mqtt_timer = metrics.stage('mqtt') # only observed in the MQTT worker process
+
+
+def pack_record(record):
+    '''
+    Description:
+    ------------
+    Convert an entry record to fixed-layout values
+    
+    :param record: EntryRecord - raw entry values (None if there is no record)
+    
+    :return: tuple - int mask (bit set for every int field) and field values
+                     (NaN for None)
+    '''
+    
+    if record is None:
+        return 0, NO_RECORD
+    
+    int_mask = 0
+    
+    for i, value in enumerate(record):
+        if isinstance(value, int):
+            int_mask |= 1 << i
+    
+    return int_mask, tuple(math.nan if value is None else value for value in record)
+
+def write_stats(stats, histograms):
+    '''
+    Description:
+    ------------
+    Copy stage histograms to shared memory (worker side)
+    
+    :param stats:      multiprocessing.Array - STAGE_STATS doubles per stage
+    :param histograms: list                  - stage histograms
+    '''
+    
+    values = []
+    
+    for histogram in histograms:
+        values.extend(histogram.counts)
+        values.append(histogram.sum)
+    
+    with stats.get_lock():
+        stats[:] = values
+
+def unpack_record(int_mask, values):
+    '''
+    Description:
+    ------------
+    Inverse of pack_record()
+    
+    :return: EntryRecord - raw entry values
+    '''
+    
+    return EntryRecord(*(None if value != value else (int(value) if int_mask & (1 << i) else value) for i, value in enumerate(values)))
+
+
+class SinkProcess(object):
+    '''
+    Description:
+    ------------
+    Parent side of a worker process - owns the ring buffer the worker reads
+    from and reports the worker exiting unexpectedly (i.e. a crash)
+    '''
+    
+    def __init__(self, name, worker, args=(), on_crash=None, slots=SHM_RING_SLOTS):
+        '''
+        Description:
+        ------------
+        Create the ring buffer (the process is started by run())
+        
+        :param name:     str           - output name (used in messages and
+                                         metrics)
+        :param worker:   str           - worker type (LOG_WORKER,
+                                         STREAM_WORKER or MQTT_WORKER)
+        :param args:     tuple         - worker arguments (must be picklable)
+        :param on_crash: callable(str) - called with an error message if the
+                                         worker exits unexpectedly
+        :param slots:    int           - number of records the ring can hold
+        '''
+        
+        self.name     = name
+        self.on_crash = on_crash
+        self.ring     = ShmRing(RECORD, slots=slots)
+        self.alive    = True
+        self.dropped  = 0 # records not sent because the ring was full
+        
+        # spawned (not forked) so the worker never inherits the GUI's threads
+        context      = multiprocessing.get_context('spawn')
+        self.stages  = WORKER_STAGES[worker]
+        self.stats   = context.Array('d', len(self.stages) * STAGE_STATS) # stage histograms copied by the worker
+        self.items   = context.Semaphore(0)     # records in the ring - the worker waits on it while the ring is empty
+        self.space   = context.Semaphore(slots) # free slots in the ring - only waited on while the ring is full
+        self.process = context.Process(target=run_worker,
+                                       args=(worker, self.ring.name, args, self.stats, self.items, self.space),
+                                       name='thunder_viewer_{}'.format(name),
+                                       daemon=True)
+        
+        self._lock     = threading.Lock() # records can be sent from several threads
+        self._stopping = False
+        self._errors   = metrics.errors(name)
+        self._synced   = [[0.0] * STAGE_STATS for _ in self.stages] # stats already merged
+    
+    def put(self, kind, text=b'', tstamp=0.0, record=None, block=False):
+        '''
+        Description:
+        ------------
+        Send a record to the worker - safe to call from any thread
+        
+        :param kind:   int         - record type (i.e. SAMPLE)
+        :param text:   bytes       - record text
+        :param tstamp: float       - seconds since the log's reference time
+        :param record: EntryRecord - raw entry values
+        :param block:  bool        - wait for room instead of dropping the
+                                     record if the ring is full
+        
+        :return: bool - whether or not the record was sent
+        '''
+        
+        int_mask, values = pack_record(record)
+        chunks = [text[i:i + RECORD_TEXT] for i in range(0, len(text), RECORD_TEXT)] or [b'']
+        
+        with self._lock:
+            if not self.alive:
+                self.dropped += 1
+                return False
+            
+            # a record split over several slots is sent completely or not at all
+            if not block and not self._reserve(len(chunks)):
+                self.dropped += 1
+                return False
+            
+            for i, chunk in enumerate(chunks):
+                flags = MORE if i < len(chunks) - 1 else 0
+                
+                while block and not self.space.acquire(timeout=SHM_WAIT_TIMEOUT):
+                    if not self.process.is_alive() and self.process.exitcode is not None:
+                        self.dropped += 1
+                        return False
+                
+                self.ring.put(kind, flags, len(chunk), int_mask, tstamp, *values, chunk)
+                self.items.release()
+        
+        return True
+    
+    def _reserve(self, count):
+        # take count free slots without waiting (none if there aren't enough)
+        for taken in range(count):
+            if not self.space.acquire(False):
+                for _ in range(taken):
+                    self.space.release()
+                
+                return False
+        
+        return True
+    
+    def stop(self):
+        '''
+        Description:
+        ------------
+        Ask the worker to handle the queued records and exit
+        '''
+        
+        self._stopping = True
+        self.put(STOP, block=True)
+    
+    def run(self):
+        '''
+        Description:
+        ------------
+        Start the worker and wait for it to exit (run from a parent thread -
+        waiting doesn't hold the GIL), merging its stage latencies into this
+        process' metrics meanwhile
+        '''
+        
+        self.process.start()
+        
+        while True:
+            self.process.join(METRICS_SYNC_PERIOD)
+            self.sync_metrics()
+            
+            if self.process.exitcode is not None:
+                break
+        
+        with self._lock:
+            self.alive = False
+            self.ring.close()
+        
+        if not self._stopping or self.process.exitcode:
+            msg = 'ERROR: {} worker process exited unexpectedly (exit code {})'.format(self.name, self.process.exitcode)
+            print(msg)
+            self._errors.inc()
+            
+            if self.on_crash:
+                self.on_crash(msg)
+    
+    def sync_metrics(self):
+        '''
+        Description:
+        ------------
+        Merge the stage observations the worker made since the last call
+        into this process' stage histograms
+        '''
+        
+        with self.stats.get_lock():
+            values = self.stats[:]
+        
+        for i, stage in enumerate(self.stages):
+            current = values[i * STAGE_STATS:(i + 1) * STAGE_STATS]
+            last    = self._synced[i]
+            counts  = [int(now - before) for now, before in zip(current[:-1], last[:-1])]
+            
+            if any(counts):
+                metrics.stage(stage).merge(counts, current[-1] - last[-1])
+            
+            self._synced[i] = current
+
+
+class ProcessLogWriter(SinkProcess):
+    '''
+    Description:
+    ------------
+    Drop-in replacement of log_writer.LogWriter that writes logs from a
+    worker process
+    '''
+    
+    def __init__(self, on_crash=None, slots=SHM_RING_SLOTS, name='local'):
+        super(ProcessLogWriter, self).__init__('log', LOG_WORKER, on_crash=on_crash, slots=slots)
+        
+        self.written = 0 # number of bytes handed to the worker
+        self.errors  = 0
+        
+        self._gauge = queue_gauge(name)
+        self._depth = lambda: self.queue_depth
+        self._gauge.set_function(self._depth)
+    
+    @property
+    def queue_depth(self):
+        # records waiting in the worker's ring buffer
+        with self._lock:
+            return len(self.ring) if self.alive else 0
+    
+    def _send(self, kind, path, data=b''):
+        data = data.encode('utf8') if isinstance(data, str) else bytes(data)
+        
+        if self.put(kind, path.encode('utf8') + b'\x00' + data, block=True):
+            self.written += len(data)
+        else:
+            self.errors += 1
+    
+    def open(self, path, header=''):
+        self._send(OPEN, path, header)
+    
+    def write(self, path, text):
+        self._send(WRITE, path, text)
+    
+    def close(self, path):
+        self._send(CLOSE, path)
+    
+    def run(self):
+        try:
+            super(ProcessLogWriter, self).run()
+        finally:
+            self._gauge.clear_function(self._depth)
+
+
+class LogWorker(object):
+    def __init__(self):
+        from log_writer import LogWriter
+        
+        self.writer = LogWriter()
+        self.thread = threading.Thread(target=self.writer.run, daemon=True)
+        self.thread.start()
+    
+    def handle(self, kind, tstamp, record, text):
+        path, _, data = text.partition(b'\x00')
+        path = path.decode('utf8')
+        
+        if kind == OPEN:
+            self.writer.open(path, data)
+        elif kind == WRITE:
+            self.writer.write(path, data)
+        elif kind == CLOSE:
+            self.writer.close(path)
+    
+    def close(self):
+        self.writer.stop()
+        self.thread.join()
+
+
+class StreamWorker(object):
+    def __init__(self, port):
+        from tacview_server import TacviewServer
+        
+        self.server = TacviewServer(port)
+        self.error  = None
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+    
+    def serve(self):
+        try:
+            self.server.serve_forever()
+        except OSError as e:
+            self.error = e
+    
+    def handle(self, kind, tstamp, record, text):
+        if self.error:
+            raise OSError('Could not stream on port {} - {}'.format(self.server.port, self.error))
+        
+        if text and kind in (SAMPLE, TEXT):
+            self.server.publish(text.decode('utf8'))
+    
+    def close(self):
+        self.server.shutdown()
+        self.thread.join()
+
+
+class MqttWorker(object):
+    def __init__(self, broker_host, mqtt_id, player, codec, compress):
+        import paho.mqtt.client as mqtt
+        from mqtt_codec import SampleEncoder
+        
+        self.mqtt_id  = mqtt_id
+        self.player   = player
+        self.ref_time = None
+        self.encoder  = SampleEncoder(player, compress=compress) if codec == 'binary' else None
+        self.mqttc    = mqtt.Client()
+        
+        if self.mqttc.connect(broker_host):
+            raise OSError('Could not connect to MQTT broker {}'.format(broker_host))
+    
+    def handle(self, kind, tstamp, record, text):
+        with mqtt_timer.time():
+            self._handle(kind, tstamp, record, text)
+    
+    def _handle(self, kind, tstamp, record, text):
+        if kind == SESSION:
+            ref_time, obj_id, meta = text.decode('utf8').split('\x00')
+            self.ref_time = dt.datetime.fromisoformat(ref_time)
+            
+            if self.encoder:
+                self.encoder.start(self.ref_time, obj_id, meta)
+        
+        elif kind == SAMPLE and self.ref_time:
+            if self.encoder:
+                for mqtt_payload in self.encoder.encode(tstamp, record):
+                    self.mqttc.publish(self.mqtt_id, mqtt_payload)
+            
+            elif text:
+                import json
+                
+                mqtt_payload = json.dumps({'player':   self.player,
+                                           'ref_time': self.ref_time.isoformat(),
+                                           'entry':    text.decode('utf8')})
+                self.mqttc.publish(self.mqtt_id, mqtt_payload)
+    
+    def close(self):
+        self.mqttc.disconnect()
+
+
+WORKERS = {LOG_WORKER:    LogWorker,
+           STREAM_WORKER: StreamWorker,
+           MQTT_WORKER:   MqttWorker}
+
+
+def run_worker(worker, ring_name, args, stats, items, space):
+    '''
+    Description:
+    ------------
+    Worker process main loop - hand every record from the ring to the worker
+    until a STOP record is received. Any exception ends the process with a
+    non-zero exit code, which the parent reports
+    
+    :param worker:    str   - worker type (key of WORKERS)
+    :param ring_name: str   - shared memory name of the ring to read from
+    :param args:      tuple - worker arguments
+    :param stats:     multiprocessing.Array - where the worker's stage
+                                              histograms are copied to
+    :param items:     multiprocessing.Semaphore - number of records in the ring
+    :param space:     multiprocessing.Semaphore - number of free slots in the ring
+    '''
+    
+    # the parent stops workers with a STOP record after the queued records
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    ring       = ShmRing(RECORD, name=ring_name)
+    handler    = WORKERS[worker](*args)
+    text       = b''
+    histograms = [metrics.stage(stage) for stage in WORKER_STAGES[worker]]
+    next_sync  = time.monotonic() + METRICS_SYNC_PERIOD
+    
+    try:
+        while True:
+            if time.monotonic() >= next_sync:
+                next_sync = time.monotonic() + METRICS_SYNC_PERIOD
+                write_stats(stats, histograms)
+            
+            # sleep until the parent sends a record (or the next metrics copy)
+            if not items.acquire(timeout=max(0.0, next_sync - time.monotonic())):
+                continue
+            
+            values = ring.get()
+            space.release()
+            
+            kind, flags, length, int_mask, tstamp = values[:5]
+            text += values[-1][:length]
+            
+            if flags & MORE:
+                continue
+            
+            if kind == STOP:
+                break
+            
+            record = unpack_record(int_mask, values[5:-1]) if kind == SAMPLE else None
+            handler.handle(kind, tstamp, record, text)
+            text = b''
+    
+    finally:
+        handler.close()
+        ring.close()
+        write_stats(stats, histograms)
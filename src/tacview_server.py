@@ -0,0 +1,283 @@
+import socket
+import selectors
+import datetime as dt
+from collections import deque
+from ring_buffer import RingBuffer
+from acmi_format import format_header
+from metrics import metrics
+from constants import STREAM_BUFF_LEN, STREAM_CLIENT_MAX_QUEUE
+
+
+HOST_HANDSHAKE = b'XtraLib.Stream.0\nTacview.RealTimeTelemetry.0\nThunder_Viewer\n\x00'
+
+send_timer    = metrics.stage('stream')
+stream_errors = metrics.errors('stream')
+
+
+class TacviewClient(object):
+    '''
+    Description:
+    ------------
+    State of a single Tacview real-time telemetry connection
+    '''
+    
+    def __init__(self, sock, addr, max_queue):
+        '''
+        Description:
+        ------------
+        Initialize the connection state
+        
+        :param sock:      socket - non-blocking client socket
+        :param addr:      tuple  - client address
+        :param max_queue: int    - maximum number of unsent bytes before the
+                                   client is considered too slow and dropped
+        '''
+        
+        self.sock         = sock
+        self.addr         = addr
+        self.max_queue    = max_queue
+        self.streaming    = False   # True once the client handshake was received
+        self.rx           = b''     # partial client handshake
+        self.queue        = deque() # encoded chunks shared with all other clients
+        self.queued_bytes = 0
+        self.offset       = 0       # bytes of queue[0] already sent
+        self.events       = selectors.EVENT_READ
+        self.closed       = False
+
+
+class TacviewServer(object):
+    '''
+    Description:
+    ------------
+    Selector based Tacview real-time telemetry server. Any number of Tacview
+    clients can connect to the same port. Every published batch of ACMI lines
+    is encoded once and the resulting bytes object is queued for every
+    connected client. Each client has its own bounded queue - clients that
+    fall too far behind are disconnected instead of stalling everyone else
+    '''
+    
+    def __init__(self, port, host='localhost', max_buff_len=STREAM_BUFF_LEN, max_client_queue=STREAM_CLIENT_MAX_QUEUE):
+        '''
+        Description:
+        ------------
+        Initialize the server (the port is not bound until serve_forever()
+        is called)
+        
+        :param port:             int - TCP port to listen on
+        :param host:             str - interface to listen on
+        :param max_buff_len:     int - number of published lines held before
+                                       the oldest lines are dropped
+        :param max_client_queue: int - maximum number of unsent bytes per client
+        '''
+        
+        self.port             = port
+        self.host             = host
+        self.max_client_queue = max_client_queue
+        self.ingress          = RingBuffer(max_buff_len)
+        self.clients          = {}
+        self.evicted          = 0 # number of clients dropped for being too slow
+        
+        self._running  = True
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+    
+    def publish(self, line):
+        '''
+        Description:
+        ------------
+        Queue ACMI text to be sent to all connected clients - safe to call
+        from any thread
+        
+        :param line: str - ACMI text to stream
+        '''
+        
+        self.ingress.put(line)
+        self._wake()
+    
+    def shutdown(self):
+        '''
+        Description:
+        ------------
+        Stop serve_forever() and close all client connections - safe to call
+        from any thread
+        '''
+        
+        self._running = False
+        self.ingress.close()
+        self._wake()
+    
+    def serve_forever(self):
+        '''
+        Description:
+        ------------
+        Accept clients and stream published data until shutdown() is called
+        
+        Raises OSError if the port can't be bound
+        '''
+        
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        
+        try:
+            listener.bind((self.host, self.port))
+            listener.listen()
+        except OSError:
+            listener.close()
+            self._close()
+            raise
+        
+        listener.setblocking(False)
+        
+        self._selector.register(listener, selectors.EVENT_READ, None)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        
+        try:
+            while self._running:
+                for key, mask in self._selector.select():
+                    if key.fileobj is listener:
+                        self._accept(listener)
+                    
+                    elif key.fileobj is self._wake_r:
+                        self._drain_wake()
+                        self._fan_out()
+                    
+                    else:
+                        client = key.data
+                        
+                        if mask & selectors.EVENT_READ:
+                            self._read(client)
+                        
+                        if (mask & selectors.EVENT_WRITE) and not client.closed:
+                            self._write(client)
+        finally:
+            for client in list(self.clients.values()):
+                self._drop(client)
+            
+            self._selector.unregister(listener)
+            self._selector.unregister(self._wake_r)
+            listener.close()
+            self._close()
+    
+    def _close(self):
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+    
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\x00')
+        except (BlockingIOError, OSError):
+            pass # selector is already awake
+    
+    def _drain_wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+    
+    def _accept(self, listener):
+        try:
+            sock, addr = listener.accept()
+        except (BlockingIOError, OSError):
+            return
+        
+        sock.setblocking(False)
+        
+        client = TacviewClient(sock, addr, self.max_client_queue)
+        self.clients[addr] = client
+        self._selector.register(sock, selectors.EVENT_READ, client)
+        
+        self._enqueue(client, HOST_HANDSHAKE)
+    
+    def _read(self, client):
+        try:
+            data = client.sock.recv(1024)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        
+        if not data:
+            print('Tacview closed live-telemetry connection')
+            self._drop(client)
+            return
+        
+        # anything received after the client handshake is ignored
+        if not client.streaming:
+            client.rx += data
+            
+            if b'\x00' in client.rx:
+                client.streaming = True
+                client.rx = b''
+                
+                init_str = format_header(dt.datetime.utcnow())
+                self._enqueue(client, bytes(init_str, encoding='utf8'))
+    
+    def _fan_out(self):
+        lines = self.ingress.get_all(timeout=0)
+        
+        if lines:
+            with send_timer.time():
+                payload = bytes(''.join(lines), encoding='utf8')
+                
+                for client in list(self.clients.values()):
+                    if client.streaming:
+                        self._enqueue(client, payload)
+    
+    def _enqueue(self, client, payload):
+        if client.queued_bytes + len(payload) > client.max_queue:
+            print('ERROR: Tacview client {} is too slow - disconnecting'.format(client.addr))
+            stream_errors.inc()
+            self.evicted += 1
+            self._drop(client)
+            return
+        
+        client.queue.append(payload)
+        client.queued_bytes += len(payload)
+        
+        self._write(client)
+    
+    def _write(self, client):
+        while client.queue:
+            chunk = client.queue[0]
+            
+            try:
+                sent = client.sock.send(memoryview(chunk)[client.offset:])
+            except BlockingIOError:
+                break
+            except OSError:
+                print('Tacview closed live-telemetry connection')
+                self._drop(client)
+                return
+            
+            client.offset += sent
+            
+            if client.offset < len(chunk):
+                break
+            
+            client.queue.popleft()
+            client.queued_bytes -= len(chunk)
+            client.offset = 0
+        
+        events = selectors.EVENT_READ
+        
+        if client.queue:
+            events |= selectors.EVENT_WRITE
+        
+        if events != client.events:
+            client.events = events
+            self._selector.modify(client.sock, events, client)
+    
+    def _drop(self, client):
+        client.closed = True
+        self.clients.pop(client.addr, None)
+        
+        try:
+            self._selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        
+        client.sock.close()
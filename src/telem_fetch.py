@@ -0,0 +1,223 @@
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait
+from WarThunder import telemetry, mapinfo
+from WarThunder.telemetry import URL_INDICATORS, URL_STATE
+from constants import FETCH_TIMEOUT, FETCH_BUDGET
+from game_state import GAME_DOWN, IN_HANGAR, DEAD, IN_MATCH
+
+
+ENDPOINTS    = ('indicators', 'state', 'map')
+URL_MAP_INFO = URL_INDICATORS.rsplit('/', 1)[0] + '/map_info.json'
+FETCH_ERRORS = (requests.RequestException, ValueError) # War Thunder not running/answering or invalid JSON
+
+
+class PooledTelemInterface(telemetry.TelemInterface):
+    '''
+    Description:
+    ------------
+    Drop-in replacement for telemetry.TelemInterface that queries all of War
+    Thunder's localhost endpoints at the same time over a pool of keep-alive
+    connections instead of one after another on fresh connections.
+    
+    Each sample waits at most "budget" seconds for the endpoints. If an
+    endpoint is late, the last value received from it is reused, the
+    endpoint is listed in self.stale and the late request is picked up by
+    the next sample instead of being issued again.
+    
+    Map data is downloaded and parsed into a private mapinfo.MapInfo that
+    only replaces self.map_info once the download finished, so the
+    sampling thread never reads a map that is being rewritten
+    '''
+    
+    def __init__(self, budget=FETCH_BUDGET, timeout=FETCH_TIMEOUT):
+        '''
+        Description:
+        ------------
+        Initialize the interface
+        
+        :param budget:  float - max time in seconds a sample waits for the
+                                endpoints before publishing partial data
+        :param timeout: float - HTTP timeout in seconds for a single request
+        '''
+        
+        super(PooledTelemInterface, self).__init__()
+        
+        self.budget  = budget
+        self.timeout = timeout
+        self.stale   = set() # endpoints whose data was reused from an earlier sample
+        
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=len(ENDPOINTS)))
+        self.executor = ThreadPoolExecutor(max_workers=len(ENDPOINTS))
+        
+        self._pending = {} # endpoint -> request still in flight
+        self._last    = {} # endpoint -> last value received
+        
+        # no map was parsed yet - the player counts as not found until then
+        self.map_info.player_found = False
+    
+    def _get_json(self, url):
+        return self.session.get(url, timeout=self.timeout).json()
+    
+    def _fetch_map(self):
+        map_info = mapinfo.MapInfo()
+        map_info.download_files()
+        map_info.parse_meta()
+        
+        return map_info
+    
+    def _submit(self):
+        if 'indicators' not in self._pending:
+            self._pending['indicators'] = self.executor.submit(self._get_json, URL_INDICATORS)
+        
+        if 'state' not in self._pending:
+            self._pending['state'] = self.executor.submit(self._get_json, URL_STATE)
+        
+        if 'map' not in self._pending:
+            self._pending['map'] = self.executor.submit(self._fetch_map)
+    
+    def fetch(self):
+        '''
+        Description:
+        ------------
+        Query all endpoints concurrently and collect the results that arrive
+        within the time budget
+        
+        :return: dict - endpoint -> latest value (missing if the endpoint
+                        never answered)
+        '''
+        
+        self._submit()
+        wait(list(self._pending.values()), timeout=self.budget)
+        
+        self.stale = set()
+        
+        for endpoint in ENDPOINTS:
+            future = self._pending[endpoint]
+            
+            if future.done():
+                del self._pending[endpoint]
+                
+                try:
+                    self._last[endpoint] = future.result()
+                except FETCH_ERRORS:
+                    # War Thunder went away - forget the other requests and
+                    # the old values so the next match starts afresh
+                    self._pending.clear()
+                    self._last.clear()
+                    raise
+            else:
+                self.stale.add(endpoint)
+        
+        return self._last
+    
+    def get_telemetry(self, comments=False, events=False):
+        '''
+        Description:
+        ------------
+        Sample telemetry data from all of War Thunder's localhost endpoints
+        
+        :param comments: bool - whether or not to query for match comment data
+        :param events:   bool - whether or not to query for match event data
+        
+        :return: bool - whether or not player is in a match
+        '''
+        
+        self.connected       = False
+        self.full_telemetry  = {}
+        self.basic_telemetry = {}
+        
+        results = self.fetch()
+        
+        if ('indicators' not in results) or ('state' not in results):
+            return self.connected
+        
+        # only swap in map data that finished downloading
+        if 'map' in results:
+            self.map_info = results['map']
+        
+        self.indicators = results['indicators']
+        self.state      = results['state']
+        
+        if comments:
+            self.get_comments()
+        
+        if events:
+            self.get_events()
+        
+        if self.indicators.get('valid') and self.state.get('valid'):
+            # samples without the player's position (map not parsed yet or
+            # player icon missing) or the basic vehicle data are not usable
+            try:
+                self.airframe  = self.indicators['type']
+                self.altitude  = self.find_altitude()
+                self.ias       = float(self.state.get('IAS, km/h', 0.0))
+                self.tas       = float(self.state.get('TAS, km/h', 0.0))
+                self.pitch     = -float(self.indicators.get('aviahorizon_pitch', -0.0))
+                self.roll      = -float(self.indicators.get('aviahorizon_roll', -0.0))
+                self.heading   = float(self.indicators['compass'])
+                self.lat       = self.map_info.player_lat
+                self.lon       = self.map_info.player_lon
+                self.flaps_pct = float(self.state.get('flaps, %', 0.0))
+                self.gear_pct  = float(self.state.get('gear, %', 0.0))
+            except (KeyError, AttributeError):
+                return self.connected
+            
+            self.basic_telemetry = {'airframe':  self.airframe,
+                                    'altitude':  self.altitude,
+                                    'IAS':       self.ias,
+                                    'TAS':       self.tas,
+                                    'heading':   self.heading,
+                                    'pitch':     self.pitch,
+                                    'roll':      self.roll,
+                                    'lat':       self.lat,
+                                    'lon':       self.lon,
+                                    'flapState': self.flaps_pct,
+                                    'gearState': self.gear_pct}
+            
+            # same sign conventions and defaults as TelemInterface
+            self.full_telemetry                      = dict(self.indicators)
+            self.full_telemetry.update(self.state)
+            self.full_telemetry['aviahorizon_pitch'] = self.pitch
+            self.full_telemetry['aviahorizon_roll']  = self.roll
+            self.full_telemetry['lat']               = self.lat
+            self.full_telemetry['lon']               = self.lon
+            self.full_telemetry['alt_m']             = self.altitude
+            
+            self.connected = True
+        
+        return self.connected
+    
+    def probe(self):
+        '''
+        Description:
+        ------------
+        Cheap check of what War Thunder is doing - a single small request
+        (two if the player isn't driving a vehicle) instead of a full sample
+        
+        :return: str - game_state.GAME_DOWN, IN_HANGAR, DEAD or IN_MATCH
+        '''
+        
+        try:
+            if self._get_json(URL_INDICATORS).get('valid'):
+                return IN_MATCH
+            
+            # the map is only valid while a match is loaded
+            if self._get_json(URL_MAP_INFO).get('valid'):
+                return DEAD
+            
+            return IN_HANGAR
+        
+        except FETCH_ERRORS:
+            return GAME_DOWN
+    
+    def close(self):
+        '''
+        Description:
+        ------------
+        Release the connection pool and worker threads
+        '''
+        
+        self.executor.shutdown(wait=False)
+        self.session.close()
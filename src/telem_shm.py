@@ -0,0 +1,317 @@
+'''
+Latest-telemetry snapshot in shared memory - while recording, Thunder
+Viewer publishes every fetched sample to a named shared memory block so any
+number of local tools (Python, MATLAB, C...) can read the current state
+without tailing ACMI logs or polling War Thunder themselves.
+
+Only the standard library is needed to read it:
+    from telem_shm import TelemetryReader
+    
+    with TelemetryReader() as reader:
+        state = reader.read()
+        
+        if state:
+            print(state.airframe, state.alt, state.ias)
+
+Schema (version 1) of the block named TELEM_SHM_NAME - little endian, no
+padding:
+
+    offset  type      field
+    0       char[4]   magic 'TVTS'
+    4       uint16    schema version
+    6       uint16    reserved
+    8       uint64    sequence - odd while a sample is being written
+    16      uint64    generation - number of samples published so far
+    24      double    time - UNIX time (s) the sample was taken
+    32      double    tstamp - seconds since the ACMI log's reference time
+    40      char[32]  airframe - War Thunder vehicle type (UTF-8, NUL padded)
+    72      double    lon, lat (deg), alt (m), roll, pitch, hdg (deg),
+                      throttle (%), ailerons, elevator, pedals (-1 to 1),
+                      ias, tas (km/h), fuel, fuel0 (kg, current and max),
+                      mach, aoa (deg), gear, flaps (%) - 18 values
+
+Values War Thunder didn't report are NaN. The sequence number is a seqlock:
+read it, copy the sample, read it again - the copy is only consistent if
+both reads match and are even (see TelemetryReader.read())
+'''
+
+import os
+import sys
+import time
+import struct
+import argparse
+from collections import namedtuple
+from multiprocessing import shared_memory
+from constants import TELEM_SHM_NAME
+
+
+SHM_MAGIC   = b'TVTS'
+SHM_VERSION = 1
+SHM_HEAD    = struct.Struct('<4sHH')    # magic, schema version, reserved
+SEQUENCE    = struct.Struct('<Q')       # seqlock sequence number
+SEQ_POS     = 8
+FIELDS      = ('lon', 'lat', 'alt', 'roll', 'pitch', 'hdg', 'throttle', 'ailerons', 'elevator',
+               'pedals', 'ias', 'tas', 'fuel', 'fuel0', 'mach', 'aoa', 'gear', 'flaps')
+SAMPLE      = struct.Struct('<Qdd32s{}d'.format(len(FIELDS))) # generation, time, tstamp, airframe, FIELDS
+SAMPLE_POS  = 16
+SHM_SIZE    = SAMPLE_POS + SAMPLE.size
+NO_VALUES   = (float('nan'),) * len(FIELDS)
+READ_TRIES  = 1000 # reads that may overlap a write before read() gives up
+
+TelemetryState = namedtuple('TelemetryState', ('generation', 'time', 'tstamp', 'airframe') + FIELDS)
+
+
+def _attach(name):
+    '''
+    Description:
+    ------------
+    Attach to an existing shared memory block without letting this process'
+    resource tracker delete the block when the process exits
+    
+    :param name: str - shared memory name
+    
+    :return: shared_memory.SharedMemory - attached block
+    '''
+    
+    try:
+        return shared_memory.SharedMemory(name=name, track=False) # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+    
+    if os.name == 'posix':
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    
+    return shm
+
+
+class TelemetryPublisher(object):
+    '''
+    Description:
+    ------------
+    Writer side of the snapshot - only one publisher may write a block
+    '''
+    
+    def __init__(self, name=TELEM_SHM_NAME):
+        '''
+        Description:
+        ------------
+        Create the shared memory block (a block left behind by a crashed
+        publisher is reused)
+        
+        :param name: str - shared memory name
+        
+        Raises OSError if the block can't be created
+        '''
+        
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=SHM_SIZE)
+        except FileExistsError:
+            self.shm = _attach(name)
+            
+            if self.shm.size < SHM_SIZE:
+                self.shm.close()
+                raise OSError('Shared memory block {} is too small'.format(name))
+        
+        self.name       = name
+        self.buf        = self.shm.buf
+        self.sequence   = 0
+        self.generation = 0
+        
+        SEQUENCE.pack_into(self.buf, SEQ_POS, self.sequence)
+        SAMPLE.pack_into(self.buf, SAMPLE_POS, 0, 0.0, float('nan'), b'', *NO_VALUES)
+        SHM_HEAD.pack_into(self.buf, 0, SHM_MAGIC, SHM_VERSION, 0)
+    
+    def publish(self, tstamp, airframe, values):
+        '''
+        Description:
+        ------------
+        Replace the snapshot
+        
+        :param tstamp:   float - seconds since the ACMI log's reference time
+                                 (None if unknown)
+        :param airframe: str   - War Thunder vehicle type
+        :param values:   tuple - values in FIELDS order (None if not reported,
+                                 i.e. an acmi_format.EntryRecord)
+        '''
+        
+        values = NO_VALUES if values is None else tuple(float('nan') if value is None else value for value in values)
+        
+        self.generation += 1
+        self.sequence   += 1
+        SEQUENCE.pack_into(self.buf, SEQ_POS, self.sequence) # odd - readers retry
+        
+        SAMPLE.pack_into(self.buf,
+                         SAMPLE_POS,
+                         self.generation,
+                         time.time(),
+                         float('nan') if tstamp is None else tstamp,
+                         airframe.encode('utf8')[:32],
+                         *values)
+        
+        self.sequence += 1
+        SEQUENCE.pack_into(self.buf, SEQ_POS, self.sequence)
+    
+    def close(self):
+        '''
+        Description:
+        ------------
+        Remove the block (readers see it disappear)
+        '''
+        
+        # readers still attached to the removed block detach at their next read
+        SHM_HEAD.pack_into(self.buf, 0, b'\x00' * 4, 0, 0)
+        
+        self.buf = None
+        self.shm.close()
+        
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class TelemetryReader(object):
+    '''
+    Description:
+    ------------
+    Reader side of the snapshot - reads straight from shared memory, so any
+    number of readers can poll it without polling War Thunder
+    '''
+    
+    def __init__(self, name=TELEM_SHM_NAME):
+        '''
+        Description:
+        ------------
+        Initialize the reader (the block is attached to by the first read()
+        after Thunder Viewer starts recording)
+        
+        :param name: str - shared memory name
+        '''
+        
+        self.name = name
+        self.shm  = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def attach(self):
+        '''
+        Description:
+        ------------
+        Attach to the block if it exists
+        
+        :return: bool - whether or not the reader is attached
+        '''
+        
+        if self.shm is None:
+            try:
+                shm = _attach(self.name)
+            except FileNotFoundError:
+                return False
+            
+            if shm.size < SHM_SIZE or SHM_HEAD.unpack_from(shm.buf, 0)[:2] != (SHM_MAGIC, SHM_VERSION):
+                shm.close()
+                return False
+            
+            self.shm = shm
+        
+        return True
+    
+    @property
+    def generation(self):
+        '''
+        Description:
+        ------------
+        Number of samples published so far (cheap check for a new sample -
+        0 if not attached)
+        '''
+        
+        if not self.attach():
+            return 0
+        
+        return SEQUENCE.unpack_from(self.shm.buf, SAMPLE_POS)[0] # generation has the same layout
+    
+    def read(self):
+        '''
+        Description:
+        ------------
+        Read a consistent copy of the latest sample
+        
+        :return: TelemetryState - latest sample (None if nothing was published
+                                  yet or the block doesn't exist)
+        '''
+        
+        if not self.attach():
+            return None
+        
+        buf = self.shm.buf
+        
+        # the publisher stopped - attach to its next block at the next read
+        if SHM_HEAD.unpack_from(buf, 0)[0] != SHM_MAGIC:
+            self.close()
+            return None
+        
+        for _ in range(READ_TRIES):
+            before = SEQUENCE.unpack_from(buf, SEQ_POS)[0]
+            
+            if before & 1:
+                continue
+            
+            values = SAMPLE.unpack_from(buf, SAMPLE_POS)
+            
+            if SEQUENCE.unpack_from(buf, SEQ_POS)[0] == before:
+                if not values[0]:
+                    return None
+                
+                airframe = values[3].rstrip(b'\x00').decode('utf8', 'replace')
+                return TelemetryState(values[0], values[1], values[2], airframe, *values[4:])
+        
+        return None
+    
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+
+
+def main(argv=None):
+    '''
+    Description:
+    ------------
+    Print the latest sample published by Thunder Viewer
+    '''
+    
+    parser = argparse.ArgumentParser(prog='telem_shm.py',
+                                     description='Print the telemetry Thunder Viewer is currently recording')
+    parser.add_argument('--rate', type=float, default=1, help='samples printed per second')
+    parser.add_argument('--once', action='store_true', help='print a single sample and exit')
+    
+    args       = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    generation = None
+    
+    with TelemetryReader() as reader:
+        try:
+            while True:
+                state = reader.read()
+                
+                if state is None:
+                    print('Waiting for Thunder Viewer to record...')
+                elif state.generation != generation:
+                    generation = state.generation
+                    print(', '.join('{}={}'.format(field, value) for field, value in state._asdict().items()))
+                
+                if args.once:
+                    break
+                
+                time.sleep(1 / args.rate)
+        
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
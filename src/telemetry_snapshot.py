@@ -0,0 +1,53 @@
+class TelemetrySnapshot(object):
+    '''
+    Description:
+    ------------
+    Latest-value mailbox for telemetry samples shared between threads. The
+    producer replaces the sample and bumps a generation counter - nothing is
+    ever queued, so a slow consumer simply skips stale intermediate samples.
+    
+    Published dictionaries must not be modified afterwards (War Thunder
+    telemetry dictionaries are rebuilt for every sample)
+    '''
+    
+    def __init__(self):
+        '''
+        Description:
+        ------------
+        Initialize the snapshot (generation 0 holds no sample)
+        '''
+        
+        self._latest = (0, None) # replaced as a whole so readers never see a torn update
+    
+    @property
+    def generation(self):
+        '''
+        Description:
+        ------------
+        Number of samples published so far
+        '''
+        
+        return self._latest[0]
+    
+    def publish(self, telem):
+        '''
+        Description:
+        ------------
+        Replace the latest sample - safe to call from any thread
+        
+        :param telem: dict - full War Thunder vehicle telemetry data
+        '''
+        
+        self._latest = (self._latest[0] + 1, telem)
+    
+    def get(self):
+        '''
+        Description:
+        ------------
+        Get the latest sample
+        
+        :return: tuple - generation (int) and sample (dict, None if nothing
+                         was published yet)
+        '''
+        
+        return self._latest
@@ -0,0 +1,198 @@
+import os
+import time
+import queue
+import threading
+from WarThunder import mapinfo
+from metrics import metrics
+from constants import TEXTURES_DIR, TEXTURE_XML_TEMPLATE, TEXTURE_XML, TEXTURE_RETRY
+
+
+save_timer     = metrics.stage('texture')
+texture_errors = metrics.errors('texture')
+
+
+def map_corners(grid_info):
+    '''
+    Description:
+    ------------
+    Find the coordinates of all four corners of a map
+    
+    :param grid_info: dict - map location metadata
+    
+    :return: dict - lat/lon of every corner (keys match the texture XML
+                    template)
+    '''
+    
+    map_dim  = grid_info['size_km']
+    ULHC_lat = grid_info['ULHC_lat']
+    ULHC_lon = grid_info['ULHC_lon']
+    
+    URHC_lat, URHC_lon = mapinfo.coord_coord(ULHC_lat, ULHC_lon, map_dim, 90)[:2]
+    LLHC_lat, LLHC_lon = mapinfo.coord_coord(ULHC_lat, ULHC_lon, map_dim, 180)[:2]
+    LRHC_lat, LRHC_lon = mapinfo.coord_coord(LLHC_lat, LLHC_lon, map_dim, 90)[:2]
+    
+    return {'LLHC_lon': LLHC_lon,
+            'LLHC_lat': LLHC_lat,
+            'LRHC_lon': LRHC_lon,
+            'LRHC_lat': LRHC_lat,
+            'URHC_lon': URHC_lon,
+            'URHC_lat': URHC_lat,
+            'ULHC_lon': ULHC_lon,
+            'ULHC_lat': ULHC_lat}
+
+
+def _write_atomic(path, data, mode='wb'):
+    # written next to the target and renamed over it
+    tmp_path = path + '.tmp'
+    
+    with open(tmp_path, mode) as tmp_file:
+        tmp_file.write(data)
+    
+    os.replace(tmp_path, path)
+
+
+class TextureCache(object):
+    '''
+    Description:
+    ------------
+    Adds War Thunder match maps to Tacview's custom terrain textures so the
+    map is displayed on Tacview's Globe during replays and streams.
+    
+    Every map is only handled once per process - the corners are computed
+    and the map image is read the first time a map is seen, and the XML
+    merge/image write is done by a background worker. The textures already
+    installed are listed once, so checking a sample is a single dictionary
+    lookup. A map that couldn't be installed is tried again after
+    TEXTURE_RETRY seconds
+    '''
+    
+    def __init__(self, textures_dir=TEXTURES_DIR, xml_path=TEXTURE_XML, template_path=TEXTURE_XML_TEMPLATE):
+        '''
+        Description:
+        ------------
+        Initialize the cache (the textures directory isn't listed until the
+        first map is seen)
+        
+        :param textures_dir:  str - Tacview custom terrain textures directory
+        :param xml_path:      str - Tacview custom texture list
+        :param template_path: str - texture list template of a single map
+        '''
+        
+        self.textures_dir  = textures_dir
+        self.xml_path      = xml_path
+        self.template_path = template_path
+        self.maps          = {}   # map name -> map corners (None if the map can't be installed)
+        self.installed     = None # image names found in the textures directory (or written by the worker)
+        self.retry_at      = {}   # map name -> time.monotonic() a failed map may be tried again
+        
+        self._jobs   = queue.Queue()
+        self._worker = None
+        self._lock   = threading.Lock()
+    
+    def add_map(self, grid_info):
+        '''
+        Description:
+        ------------
+        Make sure the given map is installed as a Tacview texture - safe to
+        call for every sample, but only while mapinfo.MAP_PATH isn't being
+        downloaded (the image is read when the map is first seen)
+        
+        :param grid_info: dict - map location metadata
+        '''
+        
+        map_name = grid_info['name']
+        
+        if map_name in self.maps:
+            return
+        
+        with self._lock:
+            if map_name in self.maps or time.monotonic() < self.retry_at.get(map_name, 0):
+                return
+            
+            if (map_name == 'UNKNOWN') or not os.path.exists(self.textures_dir):
+                self.maps[map_name] = None
+                return
+            
+            if self.installed is None:
+                self.installed = set(os.listdir(self.textures_dir))
+            
+            corners = map_corners(grid_info)
+            self.maps[map_name] = corners
+            
+            image_name = '{}.jpg'.format(map_name)
+            
+            if image_name in self.installed:
+                return
+            
+            # copy the image now - the next map download rewrites the file
+            try:
+                with open(mapinfo.MAP_PATH, 'rb') as image_file:
+                    image = image_file.read()
+            except OSError as e:
+                self._failed(map_name, image_name, e)
+                return
+            
+            self._jobs.put((map_name, image_name, image, corners))
+            
+            if self._worker is None:
+                self._worker = threading.Thread(target=self.run, daemon=True)
+                self._worker.start()
+    
+    def _failed(self, map_name, image_name, error):
+        # called with self._lock held
+        print('ERROR: Could not add {} to Tacview textures - {}'.format(image_name, error))
+        texture_errors.inc()
+        
+        self.maps.pop(map_name, None)
+        self.retry_at[map_name] = time.monotonic() + TEXTURE_RETRY
+    
+    def save_texture_files(self, image_name, image, corners):
+        '''
+        Description:
+        ------------
+        Add a single map to the custom texture list and write its image.
+        Both files are replaced atomically, so Tacview never reads a
+        partially written file
+        
+        :param image_name: str   - texture image file name
+        :param image:      bytes - map image
+        :param corners:    dict  - lat/lon of every map corner
+        '''
+        
+        with open(self.template_path, 'r') as template:
+            contents = template.read()
+        
+        new_contents = contents.format(filename=image_name, **corners)
+        
+        if os.path.exists(self.xml_path):
+            with open(self.xml_path, 'r') as text_xml:
+                current_contents = text_xml.read()
+            
+            if '\t</CustomTextureList>' in current_contents:
+                new_contents = current_contents.split('\t</CustomTextureList>')[0] + new_contents.split('<CustomTextureList>')[1]
+        
+        _write_atomic(os.path.join(self.textures_dir, image_name), image)
+        _write_atomic(self.xml_path, new_contents, 'w')
+    
+    def run(self):
+        '''
+        Description:
+        ------------
+        Background worker that installs queued maps
+        '''
+        
+        while True:
+            map_name, image_name, image, corners = self._jobs.get()
+            
+            try:
+                with save_timer.time():
+                    self.save_texture_files(image_name, image, corners)
+            except OSError as e:
+                with self._lock:
+                    self._failed(map_name, image_name, e)
+            else:
+                with self._lock:
+                    self.installed.add(image_name)
+
+
+texture_cache = TextureCache()
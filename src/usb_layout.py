@@ -0,0 +1,124 @@
+import sys
+import struct
+import argparse
+
+
+# every field that can be sent to a USB device, in packet order:
+# (GUI name, struct code, C type, C member name, value getter)
+USB_FIELDS = (('Roll Angle',        'f', 'float',    'roll',  lambda telem: telem['roll']),
+              ('Pitch Angle',       'f', 'float',    'pitch', lambda telem: telem['pitch']),
+              ('Heading',           'H', 'uint16_t', 'hdg',   lambda telem: int(telem['heading'])),
+              ('Altitude (meters)', 'H', 'uint16_t', 'alt',   lambda telem: int(telem['altitude'])),
+              ('Airspeed (km/h)',   'H', 'uint16_t', 'ias',   lambda telem: int(telem['IAS'])),
+              ('Latitude (dd)',     'f', 'float',    'lat',   lambda telem: telem['lat']),
+              ('Longitude (dd)',    'f', 'float',    'lon',   lambda telem: telem['lon']),
+              ('Flap State',        'B', 'byte',     'flaps', lambda telem: int(telem['flapState'] / 100)), # convert from % to bool
+              ('Gear State',        'B', 'byte',     'gear',  lambda telem: int(telem['gearState'] / 100))) # convert from % to bool
+
+C_HEADER = '''#pragma once
+
+// Generated by Thunder Viewer (usb_layout.py) - must match the USB fields
+// selected in Thunder Viewer
+struct __attribute__((__packed__)) {name}{{
+{members}
+}};
+'''
+
+
+class UsbLayout(object):
+    '''
+    Description:
+    ------------
+    Precompiled USB packet layout for a set of selected fields. The fields
+    are always packed in USB_FIELDS order (little-endian, no padding) so the
+    packet matches a packed struct on the device
+    '''
+    
+    def __init__(self, fields=None):
+        '''
+        Description:
+        ------------
+        Compile the layout
+        
+        :param fields: list - names of the selected fields (see USB_FIELDS)
+        '''
+        
+        selected = set(fields or [])
+        
+        self.fields  = [field for field in USB_FIELDS if field[0] in selected]
+        self.getters = [field[4] for field in self.fields]
+        self.struct  = struct.Struct('<' + ''.join(field[1] for field in self.fields))
+        self.buffer  = bytearray(self.struct.size)
+    
+    @property
+    def names(self):
+        return [field[0] for field in self.fields]
+    
+    @property
+    def size(self):
+        return self.struct.size
+    
+    def pack(self, telem):
+        '''
+        Description:
+        ------------
+        Pack a single sample into the (reused) packet buffer
+        
+        :param telem: dict - basic War Thunder vehicle telemetry data
+        
+        :return buffer: bytearray - packet (overwritten by the next call)
+        '''
+        
+        self.struct.pack_into(self.buffer, 0, *[getter(telem) for getter in self.getters])
+        
+        return self.buffer
+    
+    def to_c_header(self, name='state'):
+        '''
+        Description:
+        ------------
+        Create a C header declaring a struct that matches the packet layout
+        
+        :param name: str - C struct name
+        
+        :return: str - C header text
+        '''
+        
+        width   = max([len(field[2]) for field in self.fields] + [0])
+        members = '\n'.join('  {} {};'.format(field[2].ljust(width), field[3]) for field in self.fields)
+        
+        return C_HEADER.format(name=name, members=members)
+
+
+def main(argv=None):
+    '''
+    Description:
+    ------------
+    Write the C header of a USB packet layout (i.e. for the Arduino sketch)
+    '''
+    
+    parser = argparse.ArgumentParser(prog='usb_layout.py',
+                                     description='Export the USB packet layout as a C header')
+    parser.add_argument('fields', nargs='*', help='selected fields (i.e. "Roll Angle") - all fields if none are given')
+    parser.add_argument('-o', '--output', help='header file to write (printed if not given)')
+    parser.add_argument('--name', default='state', help='C struct name')
+    
+    args  = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    known = [field[0] for field in USB_FIELDS]
+    
+    for field in args.fields:
+        if field not in known:
+            print('ERROR: Unknown USB field "{}" - valid fields: {}'.format(field, ', '.join(known)))
+    
+    layout = UsbLayout(args.fields or known)
+    header = layout.to_c_header(args.name)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(header)
+    else:
+        print(header)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import struct
+import threading
+from scheduler import DeadlineScheduler
+from usb_layout import UsbLayout
+from telemetry_snapshot import TelemetrySnapshot
+from metrics import metrics
+from constants import USB_RATE, USB_RECONNECT_MIN, USB_RECONNECT_MAX
+
+
+send_timer = metrics.stage('usb')
+usb_errors = metrics.errors('usb')
+
+
+class UsbWriter(object):
+    '''
+    Description:
+    ------------
+    Send telemetry to a USB device (via pySerialTransfer) from a dedicated
+    thread. The sampling loop only publishes samples into a latest-value
+    mailbox - the writer sends the latest sample at its own fixed rate, so
+    a slow or unplugged serial port never delays logging or streaming and
+    the device keeps getting packets even when sampling runs slower.
+    
+    A failed write closes the port and the writer reconnects with an
+    exponential backoff instead of giving up
+    '''
+    
+    def __init__(self, port, baud, fields=None, rate=USB_RATE,
+                 reconnect_min=USB_RECONNECT_MIN, reconnect_max=USB_RECONNECT_MAX):
+        '''
+        Description:
+        ------------
+        Initialize the writer (the port isn't opened until run() is called)
+        
+        :param port:          str   - serial port name
+        :param baud:          int   - serial baud rate
+        :param fields:        list  - names of the fields sent to the device
+        :param rate:          float - packets sent per second
+        :param reconnect_min: float - first reconnect delay in seconds
+        :param reconnect_max: float - max reconnect delay in seconds
+        '''
+        
+        self.port          = port
+        self.baud          = baud
+        self.layout        = UsbLayout(fields)
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.mailbox       = TelemetrySnapshot()
+        self.scheduler     = DeadlineScheduler(1.0 / rate)
+        self.transfer      = None
+        self.sent          = 0 # packets sent
+        self.dropped       = 0 # samples replaced before they could be sent
+        self.failed        = 0 # failed connection attempts and writes
+        
+        self._retry = threading.Event()
+    
+    def publish(self, telem):
+        '''
+        Description:
+        ------------
+        Replace the sample sent to the device - safe to call from any thread
+        
+        :param telem: dict - basic War Thunder vehicle telemetry data
+        '''
+        
+        self.mailbox.publish(telem)
+    
+    def stop(self):
+        '''
+        Description:
+        ------------
+        End run() - safe to call from any thread
+        '''
+        
+        self.scheduler.stop()
+        self._retry.set()
+    
+    def connect(self):
+        '''
+        Description:
+        ------------
+        Open the serial port
+        
+        :return: bool - whether or not the port was opened
+        '''
+        
+        from pySerialTransfer import pySerialTransfer as txfer
+        
+        try:
+            self.transfer = txfer.SerialTransfer(self.port, self.baud)
+        except (OSError, ValueError) as e:
+            self.failed  += 1
+            self.transfer = None
+            print('ERROR: Could not open USB device on {} - {}'.format(self.port, e))
+            usb_errors.inc()
+        
+        return self.transfer is not None
+    
+    def disconnect(self):
+        '''
+        Description:
+        ------------
+        Close the serial port (if open)
+        '''
+        
+        if self.transfer:
+            try:
+                self.transfer.close()
+            except (OSError, ValueError):
+                pass
+            
+            self.transfer = None
+    
+    def send(self, telem):
+        '''
+        Description:
+        ------------
+        Send a single sample to the device
+        
+        :param telem: dict - basic War Thunder vehicle telemetry data
+        
+        :return: bool - whether or not the sample was sent
+        '''
+        
+        try:
+            with send_timer.time():
+                packet = self.layout.pack(telem)
+                
+                self.transfer.txBuff[:len(packet)] = packet
+                self.transfer.send(len(packet))
+        
+        except (KeyError, struct.error):
+            self.failed += 1
+            usb_errors.inc()
+            return True # bad sample - the connection is fine
+        
+        except (OSError, ValueError) as e:
+            self.failed += 1
+            usb_errors.inc()
+            print('ERROR: Could not communicate with USB device - {}'.format(e))
+            return False
+        
+        self.sent += 1
+        return True
+    
+    def run(self):
+        '''
+        Description:
+        ------------
+        Send the latest sample at the target rate until stop() is called
+        '''
+        
+        delay      = self.reconnect_min
+        generation = 0
+        
+        self.scheduler.reset()
+        
+        while not self.scheduler.stopped:
+            if self.transfer is None:
+                if not self.connect():
+                    # wait before trying again, doubling the delay every time
+                    self._retry.wait(delay)
+                    delay = min(delay * 2, self.reconnect_max)
+                    continue
+                
+                delay = self.reconnect_min
+                self.scheduler.reset()
+            
+            if not self.scheduler.wait():
+                break
+            
+            latest, telem = self.mailbox.get()
+            
+            if telem is None:
+                continue
+            
+            if latest > generation + 1:
+                self.dropped += latest - generation - 1
+            
+            generation = latest
+            
+            if not self.send(telem):
+                self.disconnect()
+        
+        self.disconnect()